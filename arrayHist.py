@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+"""
+Histograms as numpy arrays, converted to TH1D only to draw them.
+
+An ArrayHist is a binning, contiguous contents and sumw2 arrays in ROOT's
+bin layout (bin 0 is underflow, bin n_bins+1 is overflow) and an entry
+count -- the (contents, sumw2, entries) arrays fileReduction and
+partialResults pass around, with filling, merging, scaling and rebinning
+done in numpy.  Nothing is registered with ROOT, so ArrayHists need no
+gROOT.cd() or unique names, pickle cheaply to worker processes and can be
+kept by the hundred; to_th1d() makes the TH1D at render time.
+"""
+
+import numpy
+
+from lazyROOT import ROOT
+
+from fileReduction import fill_arrays
+from fileReduction import add_arrays_to_hist
+
+
+class ArrayHist(object):
+    """
+    1D histogram of binning (n_bins, x_min, x_max) held in numpy arrays.
+    """
+
+    __slots__ = ('binning', 'contents', 'sumw2', 'entries')
+
+    def __init__(self, binning, contents=None, sumw2=None, entries=0):
+
+        self.binning = tuple(binning)
+        n_bins = self.binning[0]
+        if contents is None:
+            contents = numpy.zeros(n_bins+2)
+        if sumw2 is None:
+            sumw2 = numpy.array(contents, dtype=numpy.float64)
+        self.contents = contents
+        self.sumw2 = sumw2
+        self.entries = entries
+
+    @classmethod
+    def from_arrays(cls, binning, arrays):
+        """
+        Return an ArrayHist of (contents, sumw2, entries) arrays, without
+        copying them; None gives an empty hist.
+        """
+        if arrays is None:
+            return cls(binning)
+        contents, sumw2, entries = arrays
+        return cls(binning, contents, sumw2, entries)
+
+    def __getstate__(self):
+
+        return (self.binning, self.contents, self.sumw2, self.entries)
+
+    def __setstate__(self, state):
+
+        self.binning, self.contents, self.sumw2, self.entries = state
+
+    def arrays(self):
+        """
+        Return (contents, sumw2, entries), sharing the hist's arrays.
+        """
+        return (self.contents, self.sumw2, self.entries)
+
+    def in_range(self):
+        """
+        Return views of the contents and sumw2 without underflow/overflow.
+        """
+        return (self.contents[1:-1], self.sumw2[1:-1])
+
+    def copy(self):
+
+        return ArrayHist(
+            self.binning,
+            self.contents.copy(),
+            self.sumw2.copy(),
+            self.entries,
+        )
+
+    def fill(self, values, weights=None):
+        """
+        Fill values (with weights) like TTree::Draw; return self.
+        """
+        return self.add(fill_arrays(values, self.binning, weights))
+
+    def add(self, other):
+        """
+        Add another ArrayHist, or (contents, sumw2, entries) arrays, of the
+        same binning; return self.
+        """
+        if isinstance(other, ArrayHist):
+            if other.binning != self.binning:
+                raise ValueError('cannot add binning %s to %s' % (
+                    other.binning,
+                    self.binning,
+                ))
+            other = other.arrays()
+        contents, sumw2, entries = other
+        self.contents = self.contents + contents
+        self.sumw2 = self.sumw2 + sumw2
+        self.entries += entries
+        return self
+
+    __iadd__ = add
+
+    def scale(self, factor):
+        """
+        Multiply by factor, like TH1::Scale; return self.
+        """
+        self.contents = self.contents*factor
+        self.sumw2 = self.sumw2*(factor*factor)
+        return self
+
+    def rebin(self, n_group):
+        """
+        Return a new ArrayHist with every n_group bins merged, like
+        TH1::Rebin; n_group must divide the number of bins.
+        """
+        n_bins, x_min, x_max = self.binning
+        if n_bins % n_group:
+            raise ValueError('cannot rebin %i bins by %i' % (n_bins, n_group))
+
+        def merge(values):
+            merged = numpy.empty(n_bins//n_group + 2)
+            merged[0] = values[0]
+            merged[-1] = values[-1]
+            merged[1:-1] = values[1:-1].reshape(-1, n_group).sum(axis=1)
+            return merged
+
+        return ArrayHist(
+            (n_bins//n_group, x_min, x_max),
+            merge(self.contents),
+            merge(self.sumw2),
+            self.entries,
+        )
+
+    def bin_width(self):
+
+        n_bins, x_min, x_max = self.binning
+        return (x_max - x_min)/float(n_bins)
+
+    def integral(self):
+        """
+        Return the in-range sum of contents, like TH1::Integral().
+        """
+        return float(self.contents[1:-1].sum())
+
+    def to_th1d(self, name, title=''):
+        """
+        Return a new TH1D with this hist's contents, kept in gROOT so it
+        outlives any open files.
+        """
+        n_bins, x_min, x_max = self.binning
+        ROOT.gROOT.cd()
+        hist = ROOT.TH1D(str(name), title, n_bins, x_min, x_max)
+        hist.Sumw2()
+        add_arrays_to_hist(hist, self.arrays())
+        return hist
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""
+Unattended runs of the plotting scripts.
+
+A Views object decides where the views of a run go.  Interactively, the
+canvas is shown and prompts wait for input.  In batch mode (--batch
+OUTPUT_DIR) ROOT draws without windows, prompts return their default at
+once and every view is printed to a file in OUTPUT_DIR.  render_in_pool()
+spreads independent rendering jobs, e.g. one per isotope or directory, over
+worker processes.
+"""
+
+import os
+import multiprocessing
+
+from lazyROOT import ROOT
+
+
+view_format = 'pdf'
+
+
+class Views(object):
+    """
+    Prompts and printed views of one run.  Views are printed to output_dir
+    (if given), with prefix prepended to their names.
+    """
+
+    def __init__(self, output_dir=None, is_batch=False, prefix=''):
+
+        self.output_dir = output_dir
+        self.is_batch = is_batch
+        self.prefix = prefix
+        if is_batch:
+            ROOT.gROOT.SetBatch(True)
+        if output_dir is not None and not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+    def prompt(self, message, default=''):
+        """
+        Return raw_input(message), or default without asking in batch mode.
+        """
+        if self.is_batch:
+            return default
+        return raw_input(message)
+
+    def save(self, canvas, name):
+        """
+        Print canvas as view name; return the file name, or None if views
+        aren't saved.
+        """
+        if self.output_dir is None:
+            return None
+        file_name = os.path.join(
+            self.output_dir,
+            '%s%s.%s' % (self.prefix, name, view_format),
+        )
+        canvas.Print(file_name)
+        return file_name
+
+
+def render_in_pool(function, jobs, n_workers):
+    """
+    Return [function(job) for job in jobs], run on n_workers processes if
+    n_workers > 1.  function must be a module-level function.
+    """
+    if n_workers <= 1 or len(jobs) <= 1:
+        return [function(job) for job in jobs]
+    pool = multiprocessing.Pool(min(n_workers, len(jobs)))
+    try:
+        results = pool.map(function, jobs)
+        pool.close()
+        return results
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,102 @@
+// Stand-ins for the MGDO/GAT classes the scripts read from fTree, with the
+// same member and method names.  Compiled with ACLiC by syntheticFiles.py.
+
+#ifndef SYNTHETIC_MAGE_CLASSES_H
+#define SYNTHETIC_MAGE_CLASSES_H
+
+#include "TObject.h"
+#include "TClonesArray.h"
+
+
+class SynthMCRun : public TObject {
+public:
+  Int_t fNEvents;
+  Bool_t fUseImportanceSampling;
+  Int_t fRunID;
+  Int_t fAmax;
+  Int_t fBiasedParticleID;
+  Bool_t fUseTimeWindow;
+  Bool_t fUseImportanceProcessWindow;
+
+  SynthMCRun() : fNEvents(0), fUseImportanceSampling(kFALSE), fRunID(0),
+    fAmax(0), fBiasedParticleID(0), fUseTimeWindow(kFALSE),
+    fUseImportanceProcessWindow(kFALSE) {}
+  virtual ~SynthMCRun() {}
+
+  Int_t GetNEvents() const { return fNEvents; }
+  Bool_t GetUseImportanceSampling() const { return fUseImportanceSampling; }
+  Int_t GetRunID() const { return fRunID; }
+  Int_t GetAmax() const { return fAmax; }
+  Int_t GetBiasedParticleID() const { return fBiasedParticleID; }
+  Bool_t GetUseTimeWindow() const { return fUseTimeWindow; }
+  Bool_t GetUseImportanceProcessWindow() const
+    { return fUseImportanceProcessWindow; }
+
+  ClassDef(SynthMCRun, 1)
+};
+
+
+class SynthMCEventHeader : public TObject {
+public:
+  Bool_t fIsHeartbeatEvent;
+
+  SynthMCEventHeader() : fIsHeartbeatEvent(kFALSE) {}
+  virtual ~SynthMCEventHeader() {}
+
+  Bool_t GetIsHeartbeatEvent() const { return fIsHeartbeatEvent; }
+
+  ClassDef(SynthMCEventHeader, 1)
+};
+
+
+class SynthMCStepData : public TObject {
+public:
+  Double_t fEdep;
+  Double_t fTrackWeight;
+
+  SynthMCStepData() : fEdep(0), fTrackWeight(1) {}
+  virtual ~SynthMCStepData() {}
+
+  Double_t GetEdep() const { return fEdep; }
+  Double_t GetTrackWeight() const { return fTrackWeight; }
+
+  ClassDef(SynthMCStepData, 1)
+};
+
+
+class SynthMCEventSteps : public TObject {
+public:
+  Int_t fNSteps;
+  TClonesArray* fSteps;
+
+  SynthMCEventSteps() : fNSteps(0), fSteps(new TClonesArray("SynthMCStepData")) {}
+  virtual ~SynthMCEventSteps() { delete fSteps; }
+
+  Int_t GetNSteps() const { return fNSteps; }
+  SynthMCStepData* GetStep(Int_t i) const
+    { return (SynthMCStepData*) fSteps->At(i); }
+
+  SynthMCStepData* AddStep(Double_t edep, Double_t trackWeight)
+  {
+    SynthMCStepData* step = new ((*fSteps)[fNSteps++]) SynthMCStepData();
+    step->fEdep = edep;
+    step->fTrackWeight = trackWeight;
+    return step;
+  }
+  virtual void Clear(Option_t* = "") { fSteps->Clear(); fNSteps = 0; }
+
+  ClassDef(SynthMCEventSteps, 1)
+};
+
+
+class SynthMCEventWeight : public TObject {
+public:
+  Double_t fWaveformWeight;
+
+  SynthMCEventWeight() : fWaveformWeight(1) {}
+  virtual ~SynthMCEventWeight() {}
+
+  ClassDef(SynthMCEventWeight, 1)
+};
+
+#endif
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+
+"""
+Time the scripts' entry points on synthetic files.
+
+Synthetic files are written with syntheticFiles.py (and reused while the
+settings don't change); each entry point then runs in a fresh, headless
+interpreter, with ROOT in batch mode and every prompt answered with enter.
+For each one the median wall time, files/s, tree entries/s and peak RSS are
+printed, and one JSON record per run is appended to the results file, so
+results can be tracked over time:
+
+    runBenchmarks.py [-n N_FILES] [-e ENTRIES_PER_FILE] [-o results.jsonl]
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import resource
+import tempfile
+import subprocess
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(benchmarks_dir)
+sys.path.insert(0, repo_dir)
+
+from syntheticFiles import make_synthetic_files
+
+
+default_data_dir = os.path.join(tempfile.gettempdir(), 'mjBenchmarkFiles')
+
+
+def run_check(root_file_names, work_dir):
+
+    import checkImportanceSampledSpectra
+    checkImportanceSampledSpectra.main(root_file_names)
+
+
+def run_check_jobs(root_file_names, work_dir):
+
+    import checkImportanceSampledSpectra
+    checkImportanceSampledSpectra.main(root_file_names, jobs=4)
+
+
+def run_check_columns(root_file_names, work_dir):
+
+    import checkImportanceSampledSpectra
+    checkImportanceSampledSpectra.main(
+        root_file_names,
+        column_root=os.path.join(work_dir, 'columns'),
+    )
+
+
+def run_remove_IS_files(root_file_names, work_dir):
+
+    import removeISFiles
+    removeISFiles.main(root_file_names) # the prompt declines the move
+
+
+def run_mage_spectra(root_file_names, work_dir):
+
+    import plotMaGeSpectra
+    plotMaGeSpectra.get_hist_from_files(os.path.dirname(root_file_names[0]))
+
+
+def run_spectra(root_file_names, work_dir):
+
+    import plotSpectra
+    plotSpectra.main(root_file_names)
+
+
+def run_cosmic_ray_spectra(root_file_names, work_dir):
+
+    import plotCosmicRaySpectra
+    plotCosmicRaySpectra.main(root_file_names)
+
+
+def run_column_export(root_file_names, work_dir):
+
+    import columnExport
+    columnExport.main(root_file_names, os.path.join(work_dir, 'columns'))
+
+
+benchmarks = [
+    # (name, function); column benchmarks use the columns exported before them
+    ('checkImportanceSampledSpectra.main', run_check),
+    ('checkImportanceSampledSpectra.main jobs=4', run_check_jobs),
+    ('removeISFiles.main', run_remove_IS_files),
+    ('plotMaGeSpectra.get_hist_from_files', run_mage_spectra),
+    ('plotSpectra.main', run_spectra),
+    ('plotCosmicRaySpectra.main', run_cosmic_ray_spectra),
+    ('columnExport.main', run_column_export),
+    ('checkImportanceSampledSpectra.main columns', run_check_columns),
+]
+
+
+def peak_rss_mb():
+    """
+    Return the peak resident set size [MB] of this process and of its
+    finished children, whichever is larger.
+    """
+    # ru_maxrss is in kB on Linux
+    return max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )/1024.0
+
+
+def run_benchmark(name, manifest_file_name, work_dir):
+    """
+    Run one benchmark in this process and return its wall time [s] and peak
+    RSS [MB].  Meant to be run in a fresh interpreter.
+    """
+
+    import __builtin__
+    from lazyROOT import ROOT
+    from syntheticFiles import load_synthetic_classes
+
+    with open(manifest_file_name) as manifest_file:
+        root_file_names = json.load(manifest_file)['root_file_names']
+
+    function = dict(benchmarks)[name]
+    __builtin__.raw_input = lambda prompt='': ''
+    ROOT.gROOT.SetBatch(True)
+    load_synthetic_classes()
+    os.chdir(work_dir) # scripts write their PDFs to the working directory
+
+    # the scripts' (and ROOT's) printout goes to /dev/null
+    sys.stdout.flush()
+    stdout_fd = os.dup(1)
+    devnull_fd = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull_fd, 1)
+    try:
+        start_time = time.time()
+        function(root_file_names, work_dir)
+        wall_time = time.time() - start_time
+    finally:
+        sys.stdout.flush()
+        os.dup2(stdout_fd, 1)
+        os.close(devnull_fd)
+
+    return {'wall_time': wall_time, 'peak_rss_mb': peak_rss_mb()}
+
+
+def time_benchmark(name, manifest_file_name, work_dir, n_runs):
+    """
+    Run a benchmark n_runs times in fresh interpreters; return the median
+    wall time [s] and the largest peak RSS [MB].
+    """
+    runs = []
+    for i_run in range(n_runs):
+        output = subprocess.check_output([
+            sys.executable,
+            os.path.abspath(__file__),
+            '--run-one', name,
+            '--manifest', manifest_file_name,
+            '--work-dir', work_dir,
+        ])
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    wall_times = sorted(run['wall_time'] for run in runs)
+    return {
+        'wall_time': wall_times[len(wall_times)//2],
+        'peak_rss_mb': max(run['peak_rss_mb'] for run in runs),
+    }
+
+
+def git_commit():
+
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'],
+                cwd=repo_dir,
+                stderr=devnull,
+            ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(
+    data_dir,
+    n_files,
+    n_entries,
+    n_runs=3,
+    names=None,
+    output_file_name=None,
+):
+
+    manifest = make_synthetic_files(data_dir, n_files, n_entries)
+    manifest_file_name = os.path.join(data_dir, 'synthetic.json')
+    n_files = len(manifest['root_file_names'])
+    n_tree_entries = manifest['n_tree_entries']
+
+    work_dir = tempfile.mkdtemp(prefix='mjBenchmark')
+
+    results = []
+    for name, function in benchmarks:
+
+        if names and name not in names:
+            continue
+
+        timing = time_benchmark(name, manifest_file_name, work_dir, n_runs)
+        wall_time = timing['wall_time']
+        result = {
+            'benchmark': name,
+            'wall_time': wall_time,
+            'files_per_s': n_files/wall_time,
+            'entries_per_s': n_tree_entries/wall_time,
+            'peak_rss_mb': timing['peak_rss_mb'],
+        }
+        results.append(result)
+
+        print '%-45s %8.2f s | %7.1f files/s | %9.3g entries/s | %7.1f MB' % (
+            name,
+            wall_time,
+            result['files_per_s'],
+            result['entries_per_s'],
+            result['peak_rss_mb'],
+        )
+
+    if output_file_name is not None:
+        record = {
+            'time': time.time(),
+            'host': socket.gethostname(),
+            'commit': git_commit(),
+            'settings': manifest['settings'],
+            'n_runs': n_runs,
+            'results': results,
+        }
+        with open(output_file_name, 'a') as output_file:
+            output_file.write(json.dumps(record, sort_keys=True) + '\n')
+        print '--> appended results to %s' % output_file_name
+
+    return results
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-d', '--data-dir',
+        default=default_data_dir,
+        help='where to write (or find) the synthetic files',
+    )
+    parser.add_argument('-n', '--files', type=int, default=10)
+    parser.add_argument(
+        '-e', '--entries',
+        type=int,
+        default=10000,
+        help='tree entries per file',
+    )
+    parser.add_argument(
+        '-r', '--runs',
+        type=int,
+        default=3,
+        help='runs per benchmark; the median time is reported',
+    )
+    parser.add_argument(
+        '-b', '--benchmark',
+        action='append',
+        dest='names',
+        metavar='NAME',
+        help='only run this benchmark (may be repeated)',
+    )
+    parser.add_argument(
+        '-o', '--output',
+        metavar='JSONL_FILE',
+        help='append a JSON record of the results to this file',
+    )
+    # internal: run one benchmark in this interpreter
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    parser.add_argument('--manifest', help=argparse.SUPPRESS)
+    parser.add_argument('--work-dir', help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.run_one:
+        result = run_benchmark(
+            options.run_one,
+            options.manifest,
+            options.work_dir,
+        )
+        print json.dumps(result)
+        sys.exit()
+
+    main(
+        options.data_dir,
+        options.files,
+        options.entries,
+        n_runs=options.runs,
+        names=options.names,
+        output_file_name=options.output,
+    )
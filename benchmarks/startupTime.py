@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""
+Benchmark the startup time of the scripts and check that none of them loads
+ROOT just to parse its arguments.
+
+Each script is run with --help several times in a fresh interpreter; the
+median wall time is reported.  Exits with status 1 if a script imports ROOT
+at module load or is slower than the time budget.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+script_names = [
+    'checkImportanceSampledSpectra.py',
+    'removeISFiles.py',
+    'plotMaGeSpectra.py',
+    'plotSpectra.py',
+    'plotCosmicRaySpectra.py',
+    'columnExport.py',
+    'fileRelocation.py',
+]
+
+
+def loads_root(script_name):
+    """
+    Return whether importing script_name imports ROOT.
+    """
+    module_name = os.path.splitext(script_name)[0]
+    code = 'import sys; import %s; sys.exit(int("ROOT" in sys.modules))' % (
+        module_name
+    )
+    status = subprocess.call([sys.executable, '-c', code], cwd=repo_dir)
+    return status != 0
+
+
+def time_startup(script_name, n_runs):
+    """
+    Return the median wall time [s] of running script_name --help.
+    """
+    times = []
+    with open(os.devnull, 'w') as devnull:
+        for i_run in range(n_runs):
+            start_time = time.time()
+            subprocess.call(
+                [sys.executable, os.path.join(repo_dir, script_name), '--help'],
+                stdout=devnull,
+                stderr=devnull,
+            )
+            times.append(time.time() - start_time)
+    times.sort()
+    return times[len(times)//2]
+
+
+def main(n_runs, budget, output_file_name=None):
+
+    results = []
+    is_ok = True
+    for script_name in script_names:
+
+        startup_time = time_startup(script_name, n_runs)
+        is_root_loaded = loads_root(script_name)
+        is_script_ok = startup_time < budget and not is_root_loaded
+        is_ok = is_ok and is_script_ok
+
+        print '%-35s %6.3f s | ROOT at import: %-5s | %s' % (
+            script_name,
+            startup_time,
+            is_root_loaded,
+            'ok' if is_script_ok else 'FAIL',
+        )
+        results.append({
+            'script': script_name,
+            'startup_time': startup_time,
+            'loads_root': is_root_loaded,
+        })
+
+    if output_file_name is not None:
+        with open(output_file_name, 'w') as output_file:
+            json.dump(
+                {'time': time.time(), 'benchmark': 'startup', 'results': results},
+                output_file,
+                indent=1,
+            )
+
+    return is_ok
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--runs', type=int, default=5)
+    parser.add_argument(
+        '--budget',
+        type=float,
+        default=1.0,
+        help='maximum startup time [s] per script',
+    )
+    parser.add_argument('-o', '--output', metavar='JSON_FILE')
+    options = parser.parse_args()
+
+    if not main(options.runs, options.budget, options.output):
+        sys.exit(1)
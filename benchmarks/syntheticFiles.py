@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+
+"""
+Write synthetic MaGe/GAT ROOT files for benchmarks.
+
+The files have the fTree layout the scripts read -- fTotalEnergy, fEnergy,
+fRand, fMCEventWeight.fWaveformWeight, eventSteps with fSteps.fEdep and
+fSteps.fTrackWeight, eventHeader heartbeats and fMCRun -- using the
+stand-in classes of SyntheticMaGeClasses.h, so no MGDO/GAT installation is
+needed.  The classes are compiled with ACLiC the first time they are used.
+
+    syntheticFiles.py -o DIR [-n N_FILES] [-e ENTRIES_PER_FILE]
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lazyROOT import ROOT
+
+
+header_file_name = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    'SyntheticMaGeClasses.h',
+)
+default_build_dir = os.path.join(tempfile.gettempdir(), 'syntheticMaGeClasses')
+manifest_file_name = 'synthetic.json'
+
+# IS track weights are 2**-k for k drawn from these
+is_weight_exponents = [1, 2, 3, 4, 5, 6]
+
+# (energy [keV], fraction of entries) of lines on top of the continuum
+lines = [(609.32, 0.05), (1460.8, 0.03), (2614.5, 0.05)]
+
+
+def load_synthetic_classes(build_dir=default_build_dir):
+    """
+    Compile (if needed) and load the stand-in MGDO classes.
+    """
+    if ROOT.TClass.GetClass('SynthMCRun', False):
+        return
+    if not os.path.isdir(build_dir):
+        os.makedirs(build_dir)
+    if not ROOT.gSystem.CompileMacro(header_file_name, 'k', '', build_dir):
+        raise RuntimeError('could not compile %s' % header_file_name)
+
+
+def draw_energies(rng, n_entries):
+    """
+    Return n_entries total energies [MeV]: an exponential continuum up to
+    3 MeV plus a few lines.
+    """
+    energies = rng.exponential(0.4, n_entries)
+    is_line = rng.uniform(size=n_entries)
+    line_start = 0.0
+    for line_energy, fraction in lines:
+        in_line = (is_line >= line_start) & (is_line < line_start + fraction)
+        energies[in_line] = line_energy*1e-3
+        line_start += fraction
+    return numpy.minimum(energies, 3.0)
+
+
+def write_synthetic_file(
+    root_file_name,
+    run_id,
+    n_entries,
+    rng,
+    is_weight=None,
+    steps_per_event=5,
+    events_per_entry=10,
+    a_max=208,
+):
+    """
+    Write one synthetic file with n_entries tree entries, the first of them a
+    heartbeat.  If is_weight is given, importance sampling is flagged as used
+    and every step after the first has that track weight.
+    """
+
+    load_synthetic_classes()
+
+    root_file = ROOT.TFile(root_file_name, 'recreate')
+    tree = ROOT.TTree('fTree', 'synthetic MaGe/GAT tree')
+
+    mc_run = ROOT.SynthMCRun()
+    mc_run.fNEvents = n_entries*events_per_entry
+    mc_run.fUseImportanceSampling = is_weight is not None
+    mc_run.fRunID = run_id
+    mc_run.fAmax = a_max
+    mc_run.fBiasedParticleID = 22 if is_weight is not None else 0
+
+    event_header = ROOT.SynthMCEventHeader()
+    event_steps = ROOT.SynthMCEventSteps()
+    event_weight = ROOT.SynthMCEventWeight()
+    total_energy = numpy.zeros(1)
+    energy = numpy.zeros(1)
+    rand = numpy.zeros(1)
+
+    tree.Branch('fMCRun', 'SynthMCRun', mc_run, 32000, 99)
+    tree.Branch('eventHeader', 'SynthMCEventHeader', event_header, 32000, 99)
+    tree.Branch('eventSteps', 'SynthMCEventSteps', event_steps, 32000, 99)
+    tree.Branch('fTotalEnergy', total_energy, 'fTotalEnergy/D')
+    tree.Branch('fEnergy', energy, 'fEnergy/D')
+    tree.Branch('fRand', rand, 'fRand/D')
+    tree.Branch('fMCEventWeight', 'SynthMCEventWeight', event_weight, 32000, 99)
+
+    total_energies = draw_energies(rng, n_entries)
+    n_steps = 1 + rng.poisson(steps_per_event-1, n_entries)
+    rands = rng.normal(size=n_entries)
+    waveform_weights = rng.uniform(0.9, 1.0, n_entries)
+    track_weight = 1.0 if is_weight is None else is_weight
+
+    for i_entry in range(n_entries):
+
+        event_steps.Clear()
+        is_heartbeat = i_entry == 0
+        event_header.fIsHeartbeatEvent = is_heartbeat
+        if is_heartbeat:
+            total_energy[0] = 0.0
+        else:
+            total_energy[0] = total_energies[i_entry]
+            edeps = total_energy[0]*rng.dirichlet(numpy.ones(n_steps[i_entry]))
+            for i_step in range(n_steps[i_entry]):
+                event_steps.AddStep(
+                    edeps[i_step],
+                    1.0 if i_step == 0 else track_weight,
+                )
+        energy[0] = total_energy[0]
+        rand[0] = rands[i_entry]
+        event_weight.fWaveformWeight = waveform_weights[i_entry]
+        tree.Fill()
+
+    root_file.Write()
+    root_file.Close()
+
+
+def make_synthetic_files(
+    output_dir,
+    n_files=10,
+    n_entries=10000,
+    steps_per_event=5,
+    is_fraction=0.8,
+    seed=1,
+):
+    """
+    Write n_files synthetic files to output_dir (unless a manifest there says
+    they were written with the same settings) and return the manifest: the
+    settings, the file names and the total number of tree entries.
+    """
+
+    settings = {
+        'n_files': n_files,
+        'n_entries': n_entries,
+        'steps_per_event': steps_per_event,
+        'is_fraction': is_fraction,
+        'seed': seed,
+    }
+    manifest_path = os.path.join(output_dir, manifest_file_name)
+    if os.path.isfile(manifest_path):
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest['settings'] == settings and all(
+            os.path.isfile(name) for name in manifest['root_file_names']
+        ):
+            return manifest
+
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    rng = numpy.random.RandomState(seed)
+    root_file_names = []
+    for i_file in range(n_files):
+
+        root_file_name = os.path.join(
+            os.path.abspath(output_dir),
+            'synthetic_%04i.root' % i_file,
+        )
+        is_weight = None
+        if rng.uniform() < is_fraction:
+            is_weight = 2.0**-rng.choice(is_weight_exponents)
+
+        print '--> writing %s' % os.path.basename(root_file_name)
+        write_synthetic_file(
+            root_file_name,
+            run_id=i_file,
+            n_entries=n_entries,
+            rng=rng,
+            is_weight=is_weight,
+            steps_per_event=steps_per_event,
+        )
+        root_file_names.append(root_file_name)
+
+    manifest = {
+        'settings': settings,
+        'root_file_names': root_file_names,
+        'n_tree_entries': n_files*n_entries,
+    }
+    with open(manifest_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+    return manifest
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', '--output', required=True, metavar='DIR')
+    parser.add_argument('-n', '--files', type=int, default=10)
+    parser.add_argument(
+        '-e', '--entries',
+        type=int,
+        default=10000,
+        help='tree entries per file',
+    )
+    parser.add_argument('--steps', type=int, default=5, help='mean steps per event')
+    parser.add_argument(
+        '--is-fraction',
+        type=float,
+        default=0.8,
+        help='fraction of files with importance sampling',
+    )
+    parser.add_argument('--seed', type=int, default=1)
+    options = parser.parse_args()
+
+    ROOT.gROOT.SetBatch(True)
+    make_synthetic_files(
+        options.output,
+        n_files=options.files,
+        n_entries=options.entries,
+        steps_per_event=options.steps,
+        is_fraction=options.is_fraction,
+        seed=options.seed,
+    )
@@ -10,195 +10,466 @@ they are similar.
 import os
 import sys
 import math
-
-from ROOT import gROOT
-from ROOT import TCanvas
-from ROOT import TColor
-from ROOT import TFile
-from ROOT import TH1D
-from ROOT import TLegend
-
-
-def get_hist(
-    name,
-    bin_width=5.0,
-    max_bin=2000,
+import argparse
+import functools
+import itertools
+import collections
+import multiprocessing
+
+from lazyROOT import ROOT
+
+from fileReduction import reduce_file
+from fileReduction import spectrum_binning
+from fileReduction import run_spectrum_binning
+from fileReduction import track_weight_binning
+from fileCache import FileCache
+from fileCache import default_cache_file_name
+from fileProfile import Profiler
+from filePrefetch import prefetch_files
+from filePrefetch import default_budget_mb
+from columnExport import reduce_file_columns
+from partialResults import Partial
+from partialResults import merge_partials
+from partialResults import select_shard
+from batchMode import Views
+from arrayHist import ArrayHist
+from quickLook import QuickLook
+from scanCheckpoint import Checkpointer
+from scanCheckpoint import default_interval
+from runOutliers import run_matrix
+from runOutliers import score_runs
+from runOutliers import rank_outliers
+from runOutliers import print_ranking
+from runOutliers import write_outlier_files
+from runOutliers import default_max_chi2_ndf
+from runOutliers import default_max_pull
+from batchMode import render_in_pool
+from weightConsistency import class_matrix
+from weightConsistency import score_pairs
+from weightConsistency import rank_pairs
+from weightConsistency import print_pairs
+from weightConsistency import default_max_ks
+from followFiles import FileWatcher
+from followFiles import follow
+from followFiles import default_poll_interval
+from followFiles import default_settle_time
+from followFiles import default_refresh_interval
+
+
+def imap_ahead(pool, function, items, n_ahead):
+    """
+    Like pool.imap(function, items), but with at most n_ahead items handed
+    to the workers before their results are taken, so a loop that stops
+    early leaves little work behind.
+    """
+    pending = collections.deque()
+    for item in items:
+        pending.append(pool.apply_async(function, (item,)))
+        if len(pending) >= n_ahead:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def handed_out(file_names, on_read):
+    """
+    Yield file_names, calling on_read(file name) as each is taken.
+    """
+    for file_name in file_names:
+        on_read(file_name)
+        yield file_name
+
+
+def read_files(
+    root_file_names,
+    jobs=1,
+    column_root=None,
+    n_prefetch=0,
+    prefetch_budget_mb=default_budget_mb,
+    on_read=None,
 ):
+    """
+    Yield fileReduction.reduce_file() results in the order of
+    root_file_names, sharding the files over a pool of jobs worker processes
+    if jobs > 1.  main() merges the results in file order, so serial and
+    parallel runs give identical output.
+
+    If column_root is given, results are computed from columnExport column
+    files there, which are written first for files that don't have them.
+    Otherwise the next n_prefetch files are read ahead (see filePrefetch).
+
+    If on_read is given, on_read(file name) is called for each file as it
+    is handed to be reduced, and the pool only gets jobs files ahead of
+    the consumer (for --quick, which stops early).
+    """
+
+    n_files = len(root_file_names)
+    reduce_function = reduce_file
+    if column_root is not None:
+        reduce_function = functools.partial(
+            reduce_file_columns,
+            column_root=column_root,
+        )
+    else:
+        root_file_names = prefetch_files(
+            root_file_names,
+            n_prefetch,
+            prefetch_budget_mb,
+        )
+    if on_read is not None:
+        root_file_names = handed_out(root_file_names, on_read)
 
-    gROOT.cd() # deal with TH1D/TFile/python scope issues!!
-    n_bins = int(1.0*max_bin/bin_width)
-    hist = TH1D('%s' % name, '', n_bins, 0, max_bin)
-    hist.Sumw2()
-    #print '----> making hist: %s' % hist.GetName()
-    return hist
-
-
-def main(root_file_names):
-
-    weight_to_hist_dict = {}
-    weight_to_n_events_dict = {}
-
-    total_hist = get_hist('total')
-    n_all_events = 0
-    total_track_weight_hist = TH1D('track_weight_hist', '', 110, -100, 10)
-    total_track_weight_hist.SetLineColor(TColor.kBlue+1)
-    total_track_weight_hist.SetFillColor(TColor.kBlue+1)
+    if jobs <= 1:
+        for result in itertools.imap(reduce_function, root_file_names):
+            yield result
+        return
 
-    n_IS_entries = 0
-    n_noIS_entries = 0
+    # a few chunks per worker keeps the pool balanced when file sizes vary
+    chunksize = max(1, n_files // (4*jobs))
+    pool = multiprocessing.Pool(jobs)
+    try:
+        if on_read is not None:
+            results = imap_ahead(pool, reduce_function, root_file_names, jobs)
+        else:
+            results = pool.imap(reduce_function, root_file_names, chunksize)
+        for result in results:
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def process_files(
+    root_file_names,
+    jobs=1,
+    cache=None,
+    column_root=None,
+    n_prefetch=0,
+    prefetch_budget_mb=default_budget_mb,
+    on_read=None,
+):
+    """
+    Like read_files(), but take results from cache (a fileCache.FileCache)
+    where they are valid and only read the other files.
+    """
+
+    read_function = functools.partial(
+        read_files,
+        jobs=jobs,
+        column_root=column_root,
+        n_prefetch=n_prefetch,
+        prefetch_budget_mb=prefetch_budget_mb,
+        on_read=on_read,
+    )
 
-    n_files = 0
-    for root_file_name in root_file_names:
-        
-        n_files += 1
-        #if n_files > 4: break  # debugging
+    if cache is None:
+        for result in read_function(root_file_names):
+            yield result
+        return
 
-        basename = os.path.basename(root_file_name)
+    lookups = [cache.lookup(root_file_name) for root_file_name in root_file_names]
+    file_names_to_read = [
+        root_file_name for root_file_name, (found, result) in
+        itertools.izip(root_file_names, lookups) if not found
+    ]
+    read_results = read_function(file_names_to_read)
 
-        print '--> processing %s' % basename
+    for root_file_name, (found, result) in itertools.izip(root_file_names, lookups):
+        if not found:
+            result = read_results.next()
+            cache.store(root_file_name, result)
+            cache.commit()
+        yield result
 
-        root_file = TFile(root_file_name)
-        tree = root_file.Get('fTree')
-        #n_entries = tree.GetEntries()
-        n_entries = tree.Draw('fTotalEnergy', 'fTotalEnergy>0', 'goff')
 
-        if n_entries <= 0:  
-            continue
+def add_result(partial, root_file_name, result):
+    """
+    Add one file's reduce_file() result to partial.
+    """
 
-        # get some info from the first tree entry
-        tree.GetEntry(0)
-        mc_run = tree.fMCRun
-        n_events = mc_run.GetNEvents()
-        is_used = mc_run.GetUseImportanceSampling()
+    if result is None:
+        return
 
-        n_all_events += n_events
+    n_entries = result['n_entries']
+    n_events = result['n_events']
+    is_used = result['is_used']
 
-        if is_used:
+    # (run ID, n events, spectrum arrays), for the per-run overlay
+    partial.runs.append(result['run_id'], n_events, result['run_arrays'])
+    partial.run_file_names.append(root_file_name)
 
-            track_weight_hist = TH1D('track_weight_hist', '', 110, -100, 10)
-            tree.Draw(
-                'TMath::Log2(fSteps.fTrackWeight) >> track_weight_hist',
-                'fEdep>0',
-                'goff'
-            )
-            total_track_weight_hist.Add(track_weight_hist)
+    if n_entries <= 0:  
+        return
 
-            min_weight = 1.0
-            max_weight = -400
-            for i_bin in range(track_weight_hist.GetNbinsX()):
-                
-                low_edge = track_weight_hist.GetBinLowEdge(i_bin)
-                counts = track_weight_hist.GetBinContent(i_bin)
+    weight = 0.0
+    if is_used:
+        weight = result['max_weight'] # test!
 
-                if counts > 0:
-                    #print i_bin, low_edge, counts
+    partial.add_count('events', n_events)
 
-                    if low_edge > max_weight:
-                        max_weight = low_edge
-                    if low_edge <  min_weight:
-                        min_weight = low_edge
+    if is_used:
+        partial.add_hist('track_weight', result['track_weight_arrays'])
 
-            #print min_weight, max_weight
+    print '\t %i events | %i entries | weight: %s | eff: %.1e +/- %.1e' % (
+        n_events,
+        n_entries,
+        weight,
+        weight*n_entries/n_events,
+        weight*math.sqrt(n_entries)/n_events,
+    )
 
-            # these were all log2 values:
-            #min_weight = pow(2.0, min_weight)
-            #max_weight = pow(2.0, max_weight)
+    if is_used:
+        print '\t\t weight range: %s, %s' % (
+            result['min_weight'],
+            result['max_weight'],
+        )
+        partial.add_count('IS_entries', n_entries)
+    else:
+        partial.add_count('noIS_entries', n_entries)
+
+    weight_name = 'weight %r' % weight
+    partial.add_hist(weight_name, result['hist_arrays'])
+    partial.add_count(weight_name, n_events)
+    partial.add_hist('total', result['hist_arrays'])
+
+    print '\t IS used:', is_used, result['biased_particle_id'], result['use_time_window'], result['use_process_window']
+
+
+def summarize_files(
+    root_file_names,
+    jobs=1,
+    cache_file_name=None,
+    column_root=None,
+    profiler=None,
+    n_prefetch=0,
+    prefetch_budget_mb=default_budget_mb,
+    spill_dir=None,
+    quick_precision=None,
+    seed=None,
+    checkpoint_file_name=None,
+    resume=False,
+    checkpoint_interval=default_interval,
+    partial=None,
+):
+    """
+    Read root_file_names and return their partialResults.Partial: spectra
+    per IS weight class ('weight <log2 weight>', with its event count) and
+    in total, the track-weight distribution, event and entry counts and the
+    per-run spectra.
+
+    profiler, a fileProfile.Profiler, records per-file timing; n_prefetch
+    files are read ahead (see filePrefetch).  If spill_dir is given,
+    per-run spectra are kept on disk there.
+
+    If quick_precision is given, files are read in random order (see
+    quickLook) and reading stops once the efficiency is known to that
+    relative precision; the partial only has the files read.
+
+    If checkpoint_file_name is given, the partial is saved there every
+    checkpoint_interval seconds and at the end (see scanCheckpoint); with
+    resume, an existing checkpoint is loaded and its files are skipped.
+
+    If partial is given, the files are added to it instead of a new one.
+    """
+
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+
+    quick = None
+    if quick_precision is not None:
+        quick = QuickLook(root_file_names, quick_precision, seed)
+        root_file_names = quick.file_names
+
+    if partial is None:
+        partial = Partial('check', spill_dir)
+    if resume and os.path.exists(checkpoint_file_name):
+        partial = Partial.load(checkpoint_file_name, spill_dir)
+        done = set(partial.file_names)
+        root_file_names = [
+            root_file_name for root_file_name in root_file_names
+            if root_file_name not in done
+        ]
+        print '--> resuming from %s: %i files done, %i to go' % (
+            checkpoint_file_name,
+            len(done),
+            len(root_file_names),
+        )
+    checkpointer = Checkpointer(
+        checkpoint_file_name,
+        partial.save,
+        checkpoint_interval,
+    )
 
+    cache = None
+    if cache_file_name is not None:
+        cache = FileCache(cache_file_name)
+
+    results = process_files(
+        root_file_names,
+        jobs,
+        cache,
+        column_root,
+        n_prefetch,
+        prefetch_budget_mb,
+        quick.file_read if quick is not None else None,
+    )
+    for root_file_name, result in profiler.iterate(root_file_names, results):
 
+        checkpointer.update()
+        basename = os.path.basename(root_file_name)
 
-            weight = max_weight # test!
+        print '--> processing %s' % basename
+        partial.file_names.append(root_file_name)
+
+        add_result(partial, root_file_name, result)
+
+        if quick is not None:
+            if result is None:
+                quick.add('efficiency', 0.0, 0.0)
+            else:
+                quick.add(
+                    'efficiency',
+                    result['hist_arrays'][0].sum(),
+                    result['n_events'],
+                )
+            quick.file_done(root_file_name)
+            if quick.is_precise():
+                break
 
-        else:
-            weight = 0.0
+        # end loop over input files
 
+    results.close()
+    checkpointer.update(force=True)
+    if cache is not None:
+        cache.close()
+    if quick is not None:
+        quick.report()
 
-        print '\t %i events | %i entries | weight: %s | eff: %.1e +/- %.1e' % (
-            n_events,
-            n_entries,
-            weight,
-            weight*n_entries/n_events,
-            weight*math.sqrt(n_entries)/n_events,
-        )
+    return partial
 
-        if is_used:
-            print '\t\t weight range: %s, %s' % (min_weight, max_weight)
-            n_IS_entries += n_entries
-        else:
-            n_noIS_entries += n_entries
 
+n_overlay_runs = 10 # runs drawn in the per-run overlay, worst first
 
-        try:
-            hist = weight_to_hist_dict[weight]
-            n_total_events = weight_to_n_events_dict[weight]
-            #print '--> found hist: %s' % hist.GetName()
 
-        except KeyError:
-            hist = get_hist(name = 'hist_weight%.3e' % weight)
-            weight_to_hist_dict[weight] = hist
-            hist = weight_to_hist_dict[weight]
-            n_total_events = 0
+def find_outliers(
+    partial,
+    max_chi2_ndf=default_max_chi2_ndf,
+    max_pull=default_max_pull,
+):
+    """
+    Score the per-run spectra of partial against each other (see runOutliers)
+    and return the ranked [(row, run ID, chi2/ndf, max pull, is outlier)]
+    and the file name of each row; files, not run IDs, identify the rows, as
+    several files can have the same fMCRun.
+    """
+    if len(partial.runs) == 0:
+        return ([], [])
+    run_ids, n_events, contents, sumw2 = run_matrix(partial.runs)
+    ranked = rank_outliers(
+        list(run_ids),
+        score_runs(n_events, contents, sumw2),
+        max_chi2_ndf,
+        max_pull,
+    )
+    return (ranked, partial.run_file_names)
 
 
-        n_total_events += n_events
-        weight_to_n_events_dict[weight] = n_total_events
-        #print hist.GetEntries()
-        hist.GetDirectory().cd()
+def check_weight_classes(
+    partial,
+    max_chi2_ndf=default_max_chi2_ndf,
+    max_pull=default_max_pull,
+    max_ks=default_max_ks,
+):
+    """
+    Compare the spectra of every pair of IS weight classes in partial (see
+    weightConsistency) and return the ranked
+    [(weight i, weight j, chi2/ndf, max pull, KS, passed)].
+    """
+    classes = []
+    for name in partial.hist_names:
+        if name.startswith('weight ') and partial.counts.get(name):
+            weight = name.split(' ', 1)[1]
+            classes.append((weight, partial.counts[name], partial.hists[name]))
+    if len(classes) < 2:
+        return []
+    names, n_events, contents, sumw2 = class_matrix(classes)
+    return rank_pairs(
+        names,
+        score_pairs(n_events, contents, sumw2),
+        max_chi2_ndf,
+        max_pull,
+        max_ks,
+    )
 
-        # this draws edep from each step
-        #tree.Draw(
-        #    'fEdep*1e3 >> +%s' % hist.GetName(),
-        #    'fTrackWeight*(fEdep>0)',
-        #    'goff'
-        #)
 
-        # this draws total edep -- assuming fTrackWeight taken from the last step
-        # in the first event applied to all events!
-        selection = '(fTotalEnergy>0)'
-        if is_used:
-            selection = 'fTrackWeight[1]*(fTotalEnergy>0)'
-        #print selection
+def render(partial, profiler=None, views=None):
+    """
+    Draw the spectra of a Partial from summarize_files() or from merged
+    map jobs.  views, a batchMode.Views, decides whether to prompt and where
+    to print the views: the overlay of weight classes, each weight class,
+    the track-weight distribution and the per-run overlay.  partial.runs is
+    left open; callers close it once they are done with partial.
+    """
 
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+    if views is None:
+        views = Views()
 
-        n_drawn = tree.Draw(
-            'fTotalEnergy*1e3 >> +%s' % hist.GetName(),
-            selection,
-            'goff'
-        )
+    profiler.start_phase('render')
+    print_pairs(check_weight_classes(partial))
 
-        tree.Draw(
-            'fTotalEnergy*1e3 >> +%s' % total_hist.GetName(),
-            selection,
-            'goff'
+    # spectra per decay, as ArrayHists until they are drawn
+    weight_to_spectrum_dict = {}
+    for name in partial.hist_names:
+        if not name.startswith('weight '):
+            continue
+        if not partial.counts.get(name):
+            continue # no events with entries yet
+        weight = float(name.split(' ', 1)[1])
+        spectrum = ArrayHist.from_arrays(spectrum_binning, partial.hists[name])
+        weight_to_spectrum_dict[weight] = spectrum.scale(
+            1.0/partial.counts[name]
         )
 
-        #print hist.GetEntries(), n_drawn, total_hist.GetEntries()
-        print '\t IS used:', is_used, mc_run.GetBiasedParticleID(), mc_run.GetUseTimeWindow(), mc_run.GetUseImportanceProcessWindow()
-
-        #print hist.GetEntries()
-
-        # end loop over input files
-
-
-    weight_to_n_events_dict[4.0] = n_all_events
-    weight_to_hist_dict[4.0] = total_hist
+    if not partial.counts.get('events'):
+        print '--> no events with entries to draw yet'
+        profiler.stop_phase()
+        return
+    total_spectrum = ArrayHist.from_arrays(
+        spectrum_binning,
+        partial.hists.get('total'),
+    )
+    weight_to_spectrum_dict[4.0] = total_spectrum.scale(
+        1.0/partial.counts['events']
+    )
+    total_track_weight_hist = ArrayHist.from_arrays(
+        track_weight_binning,
+        partial.hists.get('track_weight'),
+    ).to_th1d('track_weight_hist')
+    total_track_weight_hist.SetLineColor(ROOT.TColor.kBlue+1)
+    total_track_weight_hist.SetFillColor(ROOT.TColor.kBlue+1)
+
+    weight_to_hist_dict = dict(
+        (weight, spectrum.to_th1d('hist_weight%.3e' % weight))
+        for weight, spectrum in weight_to_spectrum_dict.items()
+    )
 
     weights = weight_to_hist_dict.keys()
     weights.sort()
 
 
-    canvas = TCanvas('canvas', '')
+    canvas = ROOT.TCanvas('canvas', '')
     canvas.SetLogy(1)
-    legend = TLegend(0.1, 0.91, 0.9, 0.99)
+    legend = ROOT.TLegend(0.1, 0.91, 0.9, 0.99)
     legend.SetNColumns(4)
 
     # find the max
     max_y_value = 0
     min_max_y_value = weight_to_hist_dict.values()[0].GetMaximum()
     min_y_value = weight_to_hist_dict.values()[0].GetMinimum()
-    hists = weight_to_hist_dict.values()
-    for hist in hists:
-        n_total_events = weight_to_n_events_dict[weight]
-        hist.Scale(1.0/n_total_events)
+    for weight, hist in weight_to_hist_dict.items():
         hist_max = hist.GetMaximum()
         hist_min = hist.GetMinimum()
         if hist_max > max_y_value: max_y_value = hist_max
@@ -252,16 +523,22 @@ def main(root_file_names):
     legend.Draw()        
     canvas.Update()
 
-    prefix = os.path.commonprefix(root_file_names)
+    prefix = os.path.commonprefix(partial.file_names)
     prefix = os.path.basename(prefix)
-    #canvas.Print('%s_IS_Spectra.pdf' % prefix)
+    if not views.prefix and prefix:
+        views.prefix = '%s_' % prefix
+    views.save(canvas, 'IS_Spectra')
 
     print '---  %i entries with IS, %i entries w/o IS' % (
-        n_IS_entries,
-        n_noIS_entries,
+        partial.counts.get('IS_entries', 0),
+        partial.counts.get('noIS_entries', 0),
     )
 
-    response = raw_input('--> enter to continue, i to see indiv hists, q to quit: ')
+    profiler.stop_phase()
+    response = views.prompt(
+        '--> enter to continue, i to see indiv hists, q to quit: ',
+        default='i',
+    )
     if response == 'q':
         return
 
@@ -276,57 +553,50 @@ def main(root_file_names):
             hist.Draw('e2')
 
             canvas.Update()
-            raw_input('--> return to continue ')
+            views.save(canvas, 'weight_%g' % weight)
+            views.prompt('--> return to continue ')
 
 
-    legend = TLegend(0.1, 0.91, 0.9, 0.99)
+    legend = ROOT.TLegend(0.1, 0.91, 0.9, 0.99)
     legend.SetNColumns(4)
 
 
     print '--> drawing track weight distribution:'
+    profiler.start_phase('render')
     total_track_weight_hist.Draw()
     canvas.Update()
-    raw_input('--> return to continue ')
-
-    # now look at the output of each run:
+    views.save(canvas, 'track_weights')
+    profiler.stop_phase()
+    views.prompt('--> return to continue ')
+
+    # now look at the output of each run; with many runs, only the ones
+    # that disagree most with the others are drawn
+    profiler.start_phase('render')
+    ranked, run_files = find_outliers(partial)
+    print_ranking(ranked)
+    overlay_rows = set(
+        i_run for i_run, run_id, chi2_ndf, pull, is_outlier in
+        ranked[:n_overlay_runs]
+    )
     hists = []
     hist_min = 1e5
     hist_max = 0.0
-    for i_file in range(len(root_file_names)):
+    for i_run, (run_id, n_events, run_arrays) in enumerate(partial.runs):
 
-        root_file_name = root_file_names[i_file]
-        root_file = TFile(root_file_name)
-        tree = root_file.Get('fTree')
-
-        # get some info from the first tree entry
-        tree.GetEntry(0)
-        mc_run = tree.fMCRun
-        n_events = mc_run.GetNEvents()
-        is_used = mc_run.GetUseImportanceSampling()
-        run_id = mc_run.GetRunID()
-
-
-        i_color = i_file +2
-        hist = get_hist(name=run_id, bin_width=75.0)
+        if i_run not in overlay_rows:
+            continue
+        i_color = len(hists) + 2
+        # spectra were filled by reduce_file() in the first pass
+        hist = ArrayHist.from_arrays(
+            run_spectrum_binning,
+            run_arrays,
+        ).scale(1.0/n_events).to_th1d(run_id)
         hist.SetLineColor(i_color)
         hist.SetFillColor(i_color)
         hist.SetLineWidth(3)
 
         entry_label = '%s' % run_id
         legend.AddEntry(hist, entry_label, 'lf')
-
-        selection = '(fTotalEnergy>0)'
-        if is_used:
-            selection = 'fTrackWeight[1]*(fTotalEnergy>0)'
-        #print selection
-
-        n_drawn = tree.Draw(
-            'fTotalEnergy*1e3 >> +%s' % hist.GetName(),
-            selection,
-            'goff'
-        )
- 
-        hist.Scale(1.0/n_events)
         hists.append(hist)
 
         print run_id, i_color
@@ -341,25 +611,438 @@ def main(root_file_names):
         # end loop over files
 
 
-    hists[0].SetMaximum(hist_max*2.0)
-    hists[0].SetMinimum(hist_max/1e7)
-    hists[0].Draw('e2')
+    if hists:
+        hists[0].SetMaximum(hist_max*2.0)
+        hists[0].SetMinimum(hist_max/1e7)
+        hists[0].Draw('e2')
     for hist in hists:
         hist.Draw('e2 same')
 
     legend.Draw()
     canvas.Update()
-    x = raw_input('--> enter to continue')
+    views.save(canvas, 'runs')
+    profiler.stop_phase()
+    x = views.prompt('--> enter to continue')
+
+
+def follow_files(
+    patterns,
+    jobs=1,
+    cache_file_name=None,
+    column_root=None,
+    profiler=None,
+    n_prefetch=0,
+    prefetch_budget_mb=default_budget_mb,
+    spill_dir=None,
+    checkpoint_file_name=None,
+    resume=False,
+    checkpoint_interval=default_interval,
+    views=None,
+    poll_interval=default_poll_interval,
+    settle_time=default_settle_time,
+    refresh_interval=default_refresh_interval,
+    idle_time=None,
+):
+    """
+    Add the files matching patterns to a Partial as their jobs finish them
+    (see followFiles), until idle_time seconds pass without new files or
+    Ctrl-C, and return it.  Every refresh_interval seconds the weight-class
+    table is printed and, with batch views, the views are printed again.
+    Checkpoints are saved as by summarize_files(), every
+    checkpoint_interval seconds while a batch of new files is read and at
+    its end.
+    """
+
+    if views is None:
+        views = Views()
+
+    partial = Partial('check', spill_dir)
+    if resume and os.path.exists(checkpoint_file_name):
+        partial = Partial.load(checkpoint_file_name, spill_dir)
+        print '--> resuming from %s: %i files done' % (
+            checkpoint_file_name,
+            len(partial.file_names),
+        )
+
+    def process(root_file_names):
+        summarize_files(
+            root_file_names,
+            jobs,
+            cache_file_name,
+            column_root,
+            profiler,
+            n_prefetch,
+            prefetch_budget_mb,
+            spill_dir,
+            checkpoint_file_name=checkpoint_file_name,
+            checkpoint_interval=checkpoint_interval,
+            partial=partial,
+        )
+
+    def refresh():
+        print '--> %i files | %i events | %i IS entries | %i no-IS entries' % (
+            len(partial.file_names),
+            partial.counts.get('events', 0),
+            partial.counts.get('IS_entries', 0),
+            partial.counts.get('noIS_entries', 0),
+        )
+        print_pairs(check_weight_classes(partial))
+        if views.is_batch:
+            render(partial, profiler, views)
+
+    watcher = FileWatcher(patterns, settle_time, partial.file_names)
+    follow(
+        watcher,
+        process,
+        refresh,
+        poll_interval,
+        refresh_interval,
+        idle_time,
+    )
+    return partial
+
+
+def main(
+    root_file_names,
+    jobs=1,
+    cache_file_name=None,
+    column_root=None,
+    profiler=None,
+    n_prefetch=0,
+    prefetch_budget_mb=default_budget_mb,
+    spill_dir=None,
+    views=None,
+    quick_precision=None,
+    seed=None,
+    checkpoint_file_name=None,
+    resume=False,
+):
+
+    partial = summarize_files(
+        root_file_names,
+        jobs,
+        cache_file_name,
+        column_root,
+        profiler,
+        n_prefetch,
+        prefetch_budget_mb,
+        spill_dir,
+        quick_precision,
+        seed,
+        checkpoint_file_name,
+        resume,
+    )
+    render(partial, profiler, views)
+    partial.runs.close()
+
+
+def render_partial_file(job):
+    """
+    Render one partial file in batch mode; job is (partial file name, output
+    dir).  Run by render_in_pool() for --reduce --separate.
+    """
+    partial_file_name, output_dir = job
+    prefix = os.path.splitext(os.path.basename(partial_file_name))[0]
+    partial = Partial.load(partial_file_name)
+    views = Views(output_dir, is_batch=True, prefix='%s_' % prefix)
+    try:
+        render(partial, views=views)
+    finally:
+        partial.runs.close()
+    return partial_file_name
 
 
 
 if __name__ == '__main__':
 
-    if len(sys.argv) < 2:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('root_file_names', nargs='*', metavar='ROOT_FILE')
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=1,
+        help='number of worker processes to read files with',
+    )
+    parser.add_argument(
+        '--cache',
+        nargs='?',
+        const=default_cache_file_name,
+        default=None,
+        metavar='FILE',
+        help='reuse per-file results cached in FILE (default %s)' % (
+            default_cache_file_name
+        ),
+    )
+    parser.add_argument(
+        '--columns',
+        metavar='COLUMN_DIR',
+        default=None,
+        help='fill spectra from columnExport column files in COLUMN_DIR',
+    )
+    parser.add_argument(
+        '--map',
+        metavar='PARTIAL_FILE',
+        default=None,
+        help='save the partial result of these files to PARTIAL_FILE instead '
+            'of drawing it',
+    )
+    parser.add_argument(
+        '--shard',
+        type=int,
+        nargs=2,
+        metavar=('INDEX', 'N'),
+        default=None,
+        help='only read every Nth input file, starting at INDEX',
+    )
+    parser.add_argument(
+        '--reduce',
+        action='store_true',
+        help='inputs are partial files from --map; merge and draw them (or, '
+            'with --map, save the merged partial)',
+    )
+    parser.add_argument(
+        '--quick',
+        type=float,
+        metavar='PRECISION',
+        default=None,
+        help='read files in random order and stop once the efficiency is '
+            'known to this relative precision (e.g. 0.05)',
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=None,
+        help='random seed of --quick',
+    )
+    parser.add_argument(
+        '--checkpoint',
+        metavar='FILE',
+        default=None,
+        help='save the state of the scan to FILE every so often, to '
+            '--resume it after a crash',
+    )
+    parser.add_argument(
+        '--checkpoint-interval',
+        type=float,
+        default=default_interval,
+        metavar='SECONDS',
+        help='time between checkpoints (default %g s)' % default_interval,
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='continue from the --checkpoint FILE, skipping its files',
+    )
+    parser.add_argument(
+        '--follow',
+        action='store_true',
+        help='inputs are directories or quoted glob patterns; keep reading '
+            'their new files as jobs finish them, until --idle or Ctrl-C',
+    )
+    parser.add_argument(
+        '--poll',
+        type=float,
+        default=default_poll_interval,
+        metavar='SECONDS',
+        help='time between looks for new files (default %g s)' % (
+            default_poll_interval
+        ),
+    )
+    parser.add_argument(
+        '--settle',
+        type=float,
+        default=default_settle_time,
+        metavar='SECONDS',
+        help='files modified more recently are still being written '
+            '(default %g s)' % default_settle_time,
+    )
+    parser.add_argument(
+        '--refresh',
+        type=float,
+        default=default_refresh_interval,
+        metavar='SECONDS',
+        help='time between updates of the outputs while following '
+            '(default %g s)' % default_refresh_interval,
+    )
+    parser.add_argument(
+        '--idle',
+        type=float,
+        default=None,
+        metavar='SECONDS',
+        help='stop following after this long without new files',
+    )
+    parser.add_argument(
+        '--outliers',
+        metavar='LIST_FILE',
+        default=None,
+        help='rank runs by how much their spectra disagree with the others '
+            'and write the files of outlier runs to LIST_FILE (for '
+            'fileRelocation.py --move) instead of drawing',
+    )
+    parser.add_argument(
+        '--max-chi2-ndf',
+        type=float,
+        default=default_max_chi2_ndf,
+        help='runs (or weight-class pairs) with a larger chi2/ndf are '
+            'outliers (default %g)' % default_max_chi2_ndf,
+    )
+    parser.add_argument(
+        '--max-pull',
+        type=float,
+        default=default_max_pull,
+        help='runs (or weight-class pairs) with a larger |pull| in any bin '
+            'are outliers (default %g)' % default_max_pull,
+    )
+    parser.add_argument(
+        '--consistency',
+        action='store_true',
+        help='compare the spectra of every pair of IS weight classes, print '
+            'a pass/fail table and exit (status 1 if any pair fails) '
+            'instead of drawing',
+    )
+    parser.add_argument(
+        '--max-ks',
+        type=float,
+        default=default_max_ks,
+        help='weight-class pairs with a larger scaled Kolmogorov distance '
+            'fail (default %g)' % default_max_ks,
+    )
+    parser.add_argument(
+        '--batch',
+        metavar='OUTPUT_DIR',
+        default=None,
+        help='don\'t prompt or open windows; print every view to OUTPUT_DIR',
+    )
+    parser.add_argument(
+        '--separate',
+        action='store_true',
+        help='with --reduce --batch, render each partial file on its own '
+            '(on -j worker processes) instead of merging them',
+    )
+    parser.add_argument(
+        '--spill-runs',
+        metavar='DIR',
+        default=None,
+        help='keep per-run spectra in a scratch file in DIR, not in memory',
+    )
+    parser.add_argument(
+        '--prefetch',
+        type=int,
+        default=0,
+        metavar='N',
+        help='read the next N files ahead into the page cache',
+    )
+    parser.add_argument(
+        '--prefetch-budget',
+        type=int,
+        default=default_budget_mb,
+        metavar='MB',
+        help='most data to read ahead at once (default %i MB)' % (
+            default_budget_mb
+        ),
+    )
+    parser.add_argument(
+        '--profile',
+        metavar='TRACE_FILE',
+        default=None,
+        help='write per-file timing to TRACE_FILE (JSON) and print a summary',
+    )
+    options = parser.parse_args()
+
+    if len(options.root_file_names) < 1:
         print 'arguments: [MaGe ROOT output]'
+        print '           --map PARTIAL_FILE [MaGe ROOT output]'
+        print '           --reduce [PARTIAL_FILE ...]'
         sys.exit()
 
-    main(sys.argv[1:])
+    if options.separate:
+        if not options.reduce or options.batch is None:
+            parser.error('--separate needs --reduce and --batch')
+        render_in_pool(
+            render_partial_file,
+            [(name, options.batch) for name in options.root_file_names],
+            options.jobs,
+        )
+        sys.exit()
+
+    if options.resume and options.checkpoint is None:
+        parser.error('--resume needs --checkpoint')
+    if options.checkpoint is not None and (options.reduce or options.quick):
+        parser.error('--checkpoint can\'t be used with --reduce or --quick')
+    if options.follow and (options.reduce or options.quick or options.shard):
+        parser.error('--follow can\'t be used with --reduce, --quick or '
+            '--shard')
+
+    profiler = Profiler(enabled=options.profile is not None)
+    if options.reduce:
+        partial = merge_partials(options.root_file_names, options.spill_runs)
+    elif options.follow:
+        partial = follow_files(
+            options.root_file_names,
+            jobs=options.jobs,
+            cache_file_name=options.cache,
+            column_root=options.columns,
+            profiler=profiler,
+            n_prefetch=options.prefetch,
+            prefetch_budget_mb=options.prefetch_budget,
+            spill_dir=options.spill_runs,
+            checkpoint_file_name=options.checkpoint,
+            resume=options.resume,
+            checkpoint_interval=options.checkpoint_interval,
+            views=Views(options.batch, is_batch=options.batch is not None),
+            poll_interval=options.poll,
+            settle_time=options.settle,
+            refresh_interval=options.refresh,
+            idle_time=options.idle,
+        )
+    else:
+        root_file_names = options.root_file_names
+        if options.shard is not None:
+            root_file_names = select_shard(root_file_names, *options.shard)
+        partial = summarize_files(
+            root_file_names,
+            jobs=options.jobs,
+            cache_file_name=options.cache,
+            column_root=options.columns,
+            profiler=profiler,
+            n_prefetch=options.prefetch,
+            prefetch_budget_mb=options.prefetch_budget,
+            spill_dir=options.spill_runs,
+            quick_precision=options.quick,
+            seed=options.seed,
+            checkpoint_file_name=options.checkpoint,
+            resume=options.resume,
+            checkpoint_interval=options.checkpoint_interval,
+        )
+
+    if options.map is not None:
+        partial.save(options.map)
+        print '--> wrote %s' % options.map
+    elif options.outliers is not None:
+        ranked, run_files = find_outliers(
+            partial,
+            options.max_chi2_ndf,
+            options.max_pull,
+        )
+        print_ranking(ranked)
+        n_written = write_outlier_files(options.outliers, ranked, run_files)
+        print '--> wrote %i files to %s' % (n_written, options.outliers)
+    elif options.consistency:
+        ranked = check_weight_classes(
+            partial,
+            options.max_chi2_ndf,
+            options.max_pull,
+            options.max_ks,
+        )
+        print_pairs(ranked, n_print=len(ranked))
+        profiler.report(options.profile)
+        partial.runs.close()
+        sys.exit(0 if all(pair[-1] for pair in ranked) else 1)
+    else:
+        views = Views(options.batch, is_batch=options.batch is not None)
+        render(partial, profiler, views)
+    partial.runs.close()
+    profiler.report(options.profile)
 
 
 
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+
+"""
+Export the fTree branches the scripts here read into flat numpy column files,
+so spectra can be refilled with numpy without another pass through ROOT.
+
+Each input file gets a directory under the column root, mirroring its
+absolute path, with one <column>.npy per branch (plus <column>_offsets.npy
+for step arrays) and a run.json sidecar of run info.  Columns are loaded
+memory-mapped; a file is exported again if its size or mtime changed.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+
+import numpy
+
+from lazyROOT import ROOT
+
+from fileReduction import draw_arrays
+from fileReduction import open_tree
+from fileReduction import probe_run_info
+from fileReduction import reduce_columns
+
+
+# (column name, TTree::Draw expression); branches missing from a file are
+# skipped
+column_expressions = [
+    ('fTotalEnergy', 'fTotalEnergy'),
+    ('fEnergy', 'fEnergy'),
+    ('fRand', 'fRand'),
+    ('fWaveformWeight', 'fMCEventWeight.fWaveformWeight'),
+    ('fTrackWeight', 'fSteps.fTrackWeight'),
+    ('fEdep', 'fSteps.fEdep'),
+]
+
+run_file_name = 'run.json'
+
+
+def get_column_dir(root_file_name, column_root):
+    """
+    Return the directory holding the columns of root_file_name.
+    """
+    path = os.path.splitext(os.path.abspath(root_file_name))[0]
+    return os.path.join(column_root, path.lstrip(os.sep))
+
+
+class ColumnSet(object):
+    """
+    The exported columns of one file.  columns[name] is a memory-mapped
+    array; run holds the run.json sidecar.
+    """
+
+    def __init__(self, column_dir):
+
+        self.column_dir = column_dir
+        with open(os.path.join(column_dir, run_file_name)) as run_file:
+            self.run = json.load(run_file)
+
+    def _path(self, name):
+
+        return os.path.join(self.column_dir, '%s.npy' % name)
+
+    def has(self, name):
+
+        return name in self.run['columns']
+
+    def __getitem__(self, name):
+
+        if not self.has(name):
+            raise KeyError('%s has no column %s' % (self.column_dir, name))
+        return numpy.load(self._path(name), mmap_mode='r')
+
+    def offsets(self, name):
+        """
+        Return the offsets of each entry's rows in column name: rows of entry
+        i are offsets[i]:offsets[i+1].  Scalar columns have one row per entry.
+        """
+        if self.run['columns'][name]['is_scalar']:
+            return numpy.arange(self.run['n_tree_entries']+1)
+        return numpy.load(self._path('%s_offsets' % name), mmap_mode='r')
+
+    def expand(self, name, like_name):
+        """
+        Return column name with one row per row of column like_name, by
+        repeating each entry's value -- the way TTree::Draw combines scalars
+        with arrays.
+        """
+        if self.run['columns'][name]['is_scalar'] and \
+            not self.run['columns'][like_name]['is_scalar']:
+            return numpy.repeat(self[name], numpy.diff(self.offsets(like_name)))
+        return self[name]
+
+
+def _has_expression(tree, expression):
+
+    ignore_level = ROOT.gErrorIgnoreLevel
+    ROOT.gErrorIgnoreLevel = ROOT.kFatal # missing branches aren't errors here
+    try:
+        formula = ROOT.TTreeFormula('has_expression', expression, tree)
+        return formula.GetNdim() > 0
+    finally:
+        ROOT.gErrorIgnoreLevel = ignore_level
+
+
+def export_columns(root_file_name, column_dir):
+    """
+    Write the columns of root_file_name to column_dir and return a ColumnSet.
+    """
+
+    stat = os.stat(root_file_name)
+    with open_tree(root_file_name) as (root_file, tree):
+        n_tree_entries = tree.GetEntries()
+
+        run = {
+            'root_file_name': os.path.abspath(root_file_name),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'n_tree_entries': n_tree_entries,
+            'run_info': None,
+            'columns': {},
+        }
+        if n_tree_entries > 0:
+            run['run_info'] = probe_run_info(tree)
+
+        # write into a scratch directory, so an interrupted export is never
+        # used
+        tmp_dir = column_dir + '.tmp'
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+
+        for name, expression in column_expressions:
+
+            if not _has_expression(tree, expression):
+                continue
+
+            values = []
+            entries = []
+            for value, entry, weight in draw_arrays(tree, [expression, 'Entry$']):
+                values.append(value)
+                entries.append(entry.astype(numpy.int64))
+
+            if values:
+                values = numpy.concatenate(values)
+                entries = numpy.concatenate(entries)
+            else:
+                values = numpy.zeros(0)
+                entries = numpy.zeros(0, dtype=numpy.int64)
+
+            n_rows = numpy.bincount(entries, minlength=n_tree_entries)
+            is_scalar = bool(numpy.all(n_rows == 1))
+            numpy.save(os.path.join(tmp_dir, '%s.npy' % name), values)
+            if not is_scalar:
+                offsets = numpy.zeros(n_tree_entries+1, dtype=numpy.int64)
+                numpy.cumsum(n_rows, out=offsets[1:])
+                numpy.save(os.path.join(tmp_dir, '%s_offsets.npy' % name), offsets)
+
+            run['columns'][name] = {
+                'expression': expression,
+                'is_scalar': is_scalar,
+                'n_rows': len(values),
+            }
+
+    with open(os.path.join(tmp_dir, run_file_name), 'w') as run_file:
+        json.dump(run, run_file, indent=1, sort_keys=True)
+
+    if os.path.isdir(column_dir):
+        shutil.rmtree(column_dir)
+    os.rename(tmp_dir, column_dir)
+
+    return ColumnSet(column_dir)
+
+
+def get_columns(root_file_name, column_root):
+    """
+    Return the ColumnSet of root_file_name under column_root, exporting it
+    first if it is missing or older than the file.
+    """
+
+    column_dir = get_column_dir(root_file_name, column_root)
+    if os.path.isfile(os.path.join(column_dir, run_file_name)):
+        columns = ColumnSet(column_dir)
+        stat = os.stat(root_file_name)
+        if columns.run['size'] == stat.st_size and \
+            columns.run['mtime'] == stat.st_mtime:
+            return columns
+
+    return export_columns(root_file_name, column_dir)
+
+
+def reduce_file_columns(root_file_name, column_root, fill_spectra=True):
+    """
+    Like fileReduction.reduce_file(), from the columns of root_file_name.
+    """
+    start_time = time.time()
+    columns = get_columns(root_file_name, column_root)
+    open_time = time.time() - start_time
+    result = reduce_columns(columns, fill_spectra)
+    if result is not None:
+        result['profile']['phases']['open'] = open_time
+    return result
+
+
+def main(root_file_names, column_root):
+
+    for root_file_name in root_file_names:
+
+        print '--> exporting %s' % os.path.basename(root_file_name)
+        columns = get_columns(root_file_name, column_root)
+        for name in sorted(columns.run['columns']):
+            print '\t %s: %i rows' % (
+                name,
+                columns.run['columns'][name]['n_rows'],
+            )
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('root_file_names', nargs='*', metavar='ROOT_FILE')
+    parser.add_argument(
+        '-o', '--columns',
+        required=True,
+        metavar='COLUMN_DIR',
+        help='directory to write column files to',
+    )
+    options = parser.parse_args()
+
+    if len(options.root_file_names) < 1:
+        print 'arguments: -o COLUMN_DIR [MaGe/GAT ROOT output]'
+        sys.exit()
+
+    main(options.root_file_names, options.columns)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+"""
+On-disk cache of fileReduction.reduce_file() results.
+
+Results are stored in a small SQLite database, keyed by absolute path and
+invalidated when the file's size or mtime changes, so re-running
+removeISFiles or checkImportanceSampledSpectra over an unchanged campaign
+doesn't reopen any ROOT files.
+"""
+
+import os
+import sqlite3
+import cPickle
+
+from fileReduction import reduce_file
+
+
+default_cache_file_name = os.path.expanduser('~/.mjFileCache.sqlite')
+
+# bumped when reduce_file() results change; older summaries are ignored
+summary_version = 3
+table_name = 'file_summaries_v%i' % summary_version
+
+
+class FileCache(object):
+    """
+    Per-file summaries, as returned by reduce_file(), stored in SQLite.
+    """
+
+    def __init__(self, cache_file_name=default_cache_file_name):
+
+        self.cache_file_name = cache_file_name
+        self.connection = sqlite3.connect(cache_file_name)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS %s (' % table_name +
+            ' path TEXT PRIMARY KEY,'
+            ' size INTEGER,'
+            ' mtime REAL,'
+            ' has_spectra INTEGER,'
+            ' summary BLOB'
+            ')'
+        )
+        self.connection.commit()
+
+    def _key(self, root_file_name):
+
+        path = os.path.abspath(root_file_name)
+        stat = os.stat(path)
+        return (path, stat.st_size, stat.st_mtime)
+
+    def lookup(self, root_file_name, fill_spectra=True):
+        """
+        Return (found, result).  A summary stored without spectra doesn't
+        count as found if fill_spectra is set.
+        """
+        path, size, mtime = self._key(root_file_name)
+        row = self.connection.execute(
+            'SELECT size, mtime, has_spectra, summary FROM %s'
+            ' WHERE path = ?' % table_name,
+            (path,)
+        ).fetchone()
+
+        if row is None:
+            return (False, None)
+        cached_size, cached_mtime, has_spectra, summary = row
+        if cached_size != size or cached_mtime != mtime:
+            return (False, None)
+        if fill_spectra and not has_spectra:
+            return (False, None)
+        return (True, cPickle.loads(str(summary)))
+
+    def store(self, root_file_name, result, fill_spectra=True):
+        """
+        Store a reduce_file() result; None (an empty tree) is stored too.
+        Its profile is dropped, as it doesn't apply to later lookups.
+        """
+        path, size, mtime = self._key(root_file_name)
+        if result is not None and 'profile' in result:
+            result = dict(result)
+            del result['profile']
+        summary = cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL)
+        self.connection.execute(
+            'INSERT OR REPLACE INTO %s VALUES (?, ?, ?, ?, ?)' % table_name,
+            (path, size, mtime, int(fill_spectra), sqlite3.Binary(summary))
+        )
+
+    def commit(self):
+
+        self.connection.commit()
+
+    def close(self):
+
+        self.connection.commit()
+        self.connection.close()
+
+
+def cached_reduce_file(root_file_name, cache, fill_spectra=True):
+    """
+    Return reduce_file(root_file_name, fill_spectra), reading the file only
+    if cache has no valid summary for it.
+    """
+    found, result = cache.lookup(root_file_name, fill_spectra)
+    if not found:
+        result = reduce_file(root_file_name, fill_spectra)
+        cache.store(root_file_name, result, fill_spectra)
+    return result
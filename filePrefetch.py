@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+"""
+Overlap file I/O with processing in the file loops.
+
+prefetch_files() yields file names in order while a few background threads
+read the next files ahead into the OS page cache, so on network filesystems
+opening and reading a file in ROOT mostly hits memory.  Only plain reads
+happen off the main thread; TFiles are still opened by the loop itself, as
+PyROOT objects aren't safe to create on other threads.
+
+Prefetched data lives in the page cache, not in this process; the budget
+caps the bytes read ahead but not yet processed, so prefetching doesn't
+evict files before they are used.
+"""
+
+import os
+import collections
+from multiprocessing.pool import ThreadPool
+
+
+default_n_ahead = 2
+default_budget_mb = 512
+read_block_size = 4*1024*1024
+
+
+def warm_file(file_name):
+    """
+    Read file_name into the page cache, discarding the data; return the
+    number of bytes read.  Errors are left for the loop to report when it
+    opens the file.
+    """
+    n_bytes = 0
+    block = bytearray(read_block_size)
+    try:
+        with open(file_name, 'rb') as input_file:
+            while True:
+                n_read = input_file.readinto(block)
+                if not n_read:
+                    break
+                n_bytes += n_read
+    except (IOError, OSError):
+        pass
+    return n_bytes
+
+
+def _file_size(file_name):
+
+    try:
+        return os.path.getsize(file_name)
+    except OSError:
+        return None # missing, or not a local path (e.g. root://)
+
+
+def prefetch_files(
+    file_names,
+    n_ahead=default_n_ahead,
+    budget_mb=default_budget_mb,
+):
+    """
+    Yield file_names in order; while the caller processes one, the next
+    n_ahead files (at most budget_mb MB in total) are read ahead on
+    background threads.  Each name is yielded once its read-ahead is done.
+    Files larger than the budget aren't read ahead.
+    """
+
+    file_names = list(file_names)
+    if n_ahead <= 0:
+        for file_name in file_names:
+            yield file_name
+        return
+
+    budget = budget_mb*1024*1024
+    pool = ThreadPool(min(n_ahead, 4))
+    pending = collections.deque() # (file name, async result, bytes)
+    n_scheduled = 0
+    prefetched_bytes = 0
+
+    try:
+        for i_file in range(len(file_names)):
+
+            while n_scheduled < min(len(file_names), i_file + 1 + n_ahead):
+                file_name = file_names[n_scheduled]
+                size = _file_size(file_name)
+                warm_result = None
+                if size is None or size > budget:
+                    size = 0
+                elif prefetched_bytes + size > budget:
+                    break # wait until processed files free the budget
+                else:
+                    warm_result = pool.apply_async(warm_file, (file_name,))
+                    prefetched_bytes += size
+                pending.append((file_name, warm_result, size))
+                n_scheduled += 1
+
+            file_name, warm_result, size = pending.popleft()
+            if warm_result is not None:
+                warm_result.wait()
+            yield file_name
+            prefetched_bytes -= size
+
+    finally:
+        pool.terminate()
+        pool.join()
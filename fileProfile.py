@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+
+"""
+Opt-in per-file profiling of the file loops.
+
+reduce_file() and reduce_columns() record the wall time of their phases
+(open, probe, fill) and the bytes read in a 'profile' entry of each result,
+which costs only a few time.time() calls.  A Profiler collects these per
+file, adds the phases the scripts time themselves (merge, render) and, when
+the scripts are run with --profile TRACE_FILE, writes them as a JSON trace
+and prints a summary with the slowest files.
+"""
+
+import time
+import json
+import contextlib
+import itertools
+
+
+phase_names = ['open', 'probe', 'fill', 'merge', 'render']
+
+
+class PhaseTimer(object):
+    """
+    Wall time per phase of sequential code: lap(name) adds the time since
+    the previous lap to phase name.
+    """
+
+    def __init__(self):
+
+        self.phases = {}
+        self.last_time = time.time()
+
+    def lap(self, name):
+
+        now = time.time()
+        self.phases[name] = self.phases.get(name, 0.0) + now - self.last_time
+        self.last_time = now
+
+    def profile(self, bytes_read=0):
+        """
+        Return the 'profile' entry for a result.
+        """
+        return {'phases': self.phases, 'bytes_read': bytes_read}
+
+
+class Profiler(object):
+    """
+    Per-file phase times, bytes read, entries and events of one run.  A
+    disabled Profiler records nothing.
+    """
+
+    def __init__(self, enabled=True):
+
+        self.enabled = enabled
+        self.start_time = time.time()
+        self.records = {}
+        self.file_names = [] # in the order they were first seen
+        self.run_phases = {}
+        self.phase_start = None
+
+    def _record(self, file_name):
+
+        record = self.records.get(file_name)
+        if record is None:
+            record = {
+                'file': file_name,
+                'phases': {},
+                'bytes_read': 0,
+                'n_entries': 0,
+                'n_events': 0,
+                'cached': False,
+            }
+            self.records[file_name] = record
+            self.file_names.append(file_name)
+        return record
+
+    def add_phase(self, name, seconds, file_name=None):
+        """
+        Add seconds to phase name of file_name, or of the run if file_name
+        is None.
+        """
+        if not self.enabled:
+            return
+        phases = self.run_phases
+        if file_name is not None:
+            phases = self._record(file_name)['phases']
+        phases[name] = phases.get(name, 0.0) + seconds
+
+    def add_file(self, file_name, bytes_read=0, n_entries=0, n_events=0):
+
+        if not self.enabled:
+            return
+        record = self._record(file_name)
+        record['bytes_read'] += bytes_read
+        record['n_entries'] += n_entries
+        record['n_events'] += n_events
+
+    def add_result(self, file_name, result):
+        """
+        Record a reduce_file() result; results without a profile came from a
+        cache.
+        """
+        if not self.enabled:
+            return
+        record = self._record(file_name)
+        if result is None:
+            return
+        profile = result.get('profile')
+        if profile is None:
+            record['cached'] = True
+        else:
+            for name, seconds in profile['phases'].items():
+                self.add_phase(name, seconds, file_name)
+        self.add_file(
+            file_name,
+            bytes_read=profile['bytes_read'] if profile else 0,
+            n_entries=result.get('n_entries', 0),
+            n_events=result.get('n_events', 0),
+        )
+
+    @contextlib.contextmanager
+    def phase(self, name, file_name=None):
+        """
+        Time a block as phase name of file_name (or of the run).
+        """
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.time() - start_time, file_name)
+
+    def start_phase(self, name):
+        """
+        Start timing a run phase, e.g. render, until stop_phase(); used
+        where a with block would span prompts for user input.
+        """
+        self.stop_phase()
+        self.phase_start = (name, time.time())
+
+    def stop_phase(self):
+
+        if self.phase_start is None:
+            return
+        name, start_time = self.phase_start
+        self.add_phase(name, time.time() - start_time)
+        self.phase_start = None
+
+    def iterate(self, file_names, results):
+        """
+        Yield (file name, result) pairs, recording each result and timing
+        the loop body that handles it as its merge phase.
+        """
+        pairs = itertools.izip(file_names, results)
+        if not self.enabled:
+            for pair in pairs:
+                yield pair
+            return
+        for file_name, result in pairs:
+            self.add_result(file_name, result)
+            start_time = time.time()
+            yield (file_name, result)
+            self.add_phase('merge', time.time() - start_time, file_name)
+
+    def file_records(self):
+        """
+        Return the per-file records, with their wall time and events/s.
+        """
+        records = []
+        for file_name in self.file_names:
+            record = dict(self.records[file_name])
+            wall_time = sum(record['phases'].values())
+            record['wall_time'] = wall_time
+            record['events_per_s'] = 0.0
+            if wall_time > 0:
+                record['events_per_s'] = record['n_events']/wall_time
+            records.append(record)
+        return records
+
+    def phase_totals(self):
+        """
+        Return the total time of each phase, over files and the run.
+        """
+        totals = dict(self.run_phases)
+        for record in self.records.values():
+            for name, seconds in record['phases'].items():
+                totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+    def write_trace(self, trace_file_name):
+
+        self.stop_phase()
+        trace = {
+            'start_time': self.start_time,
+            'wall_time': time.time() - self.start_time,
+            'phases': self.phase_totals(),
+            'run_phases': self.run_phases,
+            'files': self.file_records(),
+        }
+        with open(trace_file_name, 'w') as trace_file:
+            json.dump(trace, trace_file, indent=1, sort_keys=True)
+
+    def print_summary(self, n_slowest=10):
+
+        self.stop_phase()
+        wall_time = time.time() - self.start_time
+        records = self.file_records()
+        totals = self.phase_totals()
+        n_cached = len([record for record in records if record['cached']])
+
+        print '--> profile: %i files (%i cached) in %.1f s' % (
+            len(records),
+            n_cached,
+            wall_time,
+        )
+        names = phase_names + sorted(set(totals) - set(phase_names))
+        for name in names:
+            if name not in totals:
+                continue
+            print '\t %-8s %9.2f s | %5.1f%%' % (
+                name,
+                totals[name],
+                100.0*totals[name]/wall_time,
+            )
+        print '\t %-8s %9.1f MB | %i entries' % (
+            'read',
+            sum(record['bytes_read'] for record in records)/1e6,
+            sum(record['n_entries'] for record in records),
+        )
+
+        records.sort(key=lambda record: record['wall_time'], reverse=True)
+        print '--> slowest files [s]:'
+        print '\t %7s | %s | %8s | %9s | %9s | file' % (
+            'total',
+            ' | '.join('%6s' % name for name in phase_names[:-1]),
+            'MB',
+            'entries',
+            'events/s',
+        )
+        for record in records[:n_slowest]:
+            print '\t %7.2f | %s | %8.1f | %9i | %9.2e | %s' % (
+                record['wall_time'],
+                ' | '.join(
+                    '%6.2f' % record['phases'].get(name, 0.0)
+                    for name in phase_names[:-1]
+                ),
+                record['bytes_read']/1e6,
+                record['n_entries'],
+                record['events_per_s'],
+                record['file'],
+            )
+
+    def report(self, trace_file_name):
+        """
+        Write the trace and print the summary, if enabled.
+        """
+        if not self.enabled:
+            return
+        self.write_trace(trace_file_name)
+        self.print_summary()
+        print '--> wrote profile trace %s' % trace_file_name
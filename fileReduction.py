@@ -0,0 +1,558 @@
+#!/usr/bin/env python
+
+"""
+Single-pass reduction of MaGe ROOT files.
+
+reduce_file() reads the fTree of a file once, with one TTree::Draw into the
+tree's V1-V4/W buffers, and fills the entry count, track-weight distribution,
+weighted energy spectrum and per-run spectrum from those buffers with numpy.
+Histograms are returned as (contents, sumw2, entries) arrays in ROOT's bin
+layout (bin 0 is underflow, bin n_bins+1 is overflow).
+
+Importance-sampled events are weighted one by one: event_weights() reduces
+each event's step track weights with numpy.add.reduceat over the step
+offsets, so no per-event Python or TTreeFormula loop is needed.
+
+reduce_columns() gives the same results from columns written by
+columnExport, without ROOT.
+"""
+
+import contextlib
+
+import numpy
+
+from lazyROOT import ROOT
+
+from fileProfile import PhaseTimer
+from spectrumStore import add_arrays
+
+
+# (n_bins, x_min, x_max) of the histograms filled by reduce_file():
+spectrum_binning = (400, 0.0, 2000.0) # 5-keV bins
+run_spectrum_binning = (26, 0.0, 2000.0) # ~75-keV bins, for per-run overlays
+track_weight_binning = (110, -100.0, 10.0) # log2(track weight)
+
+# number of tree entries drawn into the buffers at a time
+chunk_entries = 100000
+
+
+def find_bins(values, binning):
+    """
+    Return the bin index of each value, computed like TAxis::FindBin.
+    """
+    n_bins, x_min, x_max = binning
+    bins = numpy.where(values < x_min, 0, n_bins+1)
+    in_range = (values >= x_min) & (values < x_max)
+    bins[in_range] = 1 + (
+        n_bins*(values[in_range]-x_min)/(x_max-x_min)
+    ).astype(numpy.int64)
+    return bins
+
+
+def fill_arrays(values, binning, weights=None):
+    """
+    Return (contents, sumw2, entries) of a histogram filled with values, in
+    the same order TH1::Fill would be called by TTree::Draw.  Like TTree::Draw,
+    values with zero weight are not filled.
+    """
+    n_bins = binning[0]
+    if weights is None:
+        weights = numpy.ones(len(values))
+    else:
+        nonzero = weights != 0
+        values = values[nonzero]
+        weights = weights[nonzero]
+
+    bins = find_bins(values, binning)
+    contents = numpy.bincount(bins, weights=weights, minlength=n_bins+2)
+    sumw2 = numpy.bincount(bins, weights=weights*weights, minlength=n_bins+2)
+    return (contents, sumw2, len(values))
+
+
+def add_arrays_to_hist(hist, arrays):
+    """
+    Add (contents, sumw2, entries) arrays to hist, like TH1::Add.
+    """
+    contents, sumw2, entries = arrays
+    n_entries = hist.GetEntries() + entries
+    if hist.GetSumw2N() == 0 and numpy.any(sumw2 != contents):
+        hist.Sumw2() # like TH1::Fill with weights != 1
+    for i_bin in range(len(contents)):
+        hist.AddBinContent(i_bin, contents[i_bin])
+    if hist.GetSumw2N() > 0:
+        hist_sumw2 = hist.GetSumw2()
+        for i_bin in range(len(sumw2)):
+            hist_sumw2.AddAt(hist_sumw2.At(i_bin) + sumw2[i_bin], i_bin)
+    hist.SetEntries(n_entries)
+
+
+def _buffer_to_array(buf, n_rows):
+    """
+    Copy the first n_rows of a TTree::Draw buffer into a numpy array.
+    """
+    try:
+        buf.SetSize(n_rows) # ROOT 5
+    except AttributeError:
+        buf.reshape((n_rows,))
+    return numpy.array(
+        numpy.frombuffer(buf, dtype=numpy.float64, count=n_rows)
+    )
+
+
+def draw_arrays(tree, expressions, selection='', chunk_entries=chunk_entries):
+    """
+    Yield, for each chunk of tree entries, a list of numpy arrays: one per
+    expression (at most 4), followed by the selection weights.
+
+    Expressions mixing scalars and step arrays give one row per step, like
+    TTree::Draw.  If a chunk has more rows than the tree's estimate, the
+    estimate is raised and the chunk is drawn again.
+    """
+    getters = [tree.GetV1, tree.GetV2, tree.GetV3, tree.GetV4]
+    if len(expressions) > len(getters):
+        raise ValueError('at most %i expressions can be drawn' % len(getters))
+    varexp = ':'.join(expressions)
+
+    n_tree_entries = tree.GetEntries()
+    estimate = max(tree.GetEstimate(), 1000000)
+    first_entry = 0
+    while first_entry < n_tree_entries:
+
+        n_chunk = min(chunk_entries, n_tree_entries - first_entry)
+        tree.SetEstimate(estimate)
+        n_rows = tree.Draw(varexp, selection, 'goff', n_chunk, first_entry)
+
+        if n_rows < 0:
+            raise ValueError('could not draw %s' % varexp)
+        if n_rows >= estimate:
+            # buffers were flushed before the chunk was done
+            estimate = 2*n_rows + 1
+            continue
+
+        if n_rows > 0:
+            arrays = [
+                _buffer_to_array(getter(), n_rows)
+                for getter in getters[:len(expressions)]
+            ]
+            arrays.append(_buffer_to_array(tree.GetW(), n_rows))
+            yield arrays
+
+        first_entry += n_chunk
+
+
+def segment_sums(values, offsets):
+    """
+    Return the sum of values[offsets[i]:offsets[i+1]] for each segment i, with
+    numpy.add.reduceat; empty segments sum to 0.
+    """
+    offsets = numpy.asarray(offsets, dtype=numpy.int64)
+    sums = numpy.zeros(len(offsets)-1)
+    is_filled = offsets[1:] > offsets[:-1]
+    if numpy.any(is_filled):
+        sums[is_filled] = numpy.add.reduceat(
+            numpy.asarray(values, dtype=numpy.float64),
+            offsets[:-1][is_filled],
+        )
+    return sums
+
+
+def event_weights(step_offsets, track_weights, edeps):
+    """
+    Return the IS weight of each event, from its steps' track weights: the
+    fEdep-weighted mean over steps that deposit energy, or the weight of the
+    last step if none does (nan for events without steps).  Steps of event i
+    are step_offsets[i]:step_offsets[i+1].
+    """
+    step_offsets = numpy.asarray(step_offsets, dtype=numpy.int64)
+    track_weights = numpy.asarray(track_weights, dtype=numpy.float64)
+    edeps = numpy.clip(numpy.asarray(edeps, dtype=numpy.float64), 0.0, None)
+
+    edep_sums = segment_sums(edeps, step_offsets)
+    weighted_sums = segment_sums(track_weights*edeps, step_offsets)
+
+    weights = numpy.empty(len(step_offsets)-1)
+    weights.fill(numpy.nan)
+    has_steps = step_offsets[1:] > step_offsets[:-1]
+    weights[has_steps] = track_weights[step_offsets[1:][has_steps] - 1]
+    deposits = edep_sums > 0
+    weights[deposits] = weighted_sums[deposits]/edep_sums[deposits]
+    return weights
+
+
+def step_log2_weights(track_weights, edeps):
+    """
+    Return the log2 track weights of the steps that deposit energy, for the
+    track-weight distribution; non-positive weights are left out, as they
+    have no log2 and would land in underflow as -inf.
+    """
+    track_weights = numpy.asarray(track_weights, dtype=numpy.float64)
+    is_used = (numpy.asarray(edeps) > 0) & (track_weights > 0)
+    track_weights = track_weights[is_used]
+    with numpy.errstate(divide='ignore'):
+        return numpy.log(track_weights)/numpy.log(2.0)
+
+
+def weight_range(track_weight_arrays):
+    """
+    Return (min, max) low edges of filled bins of the log2(track weight)
+    histogram, scanning bins 0 to n_bins-1 like the original bin loop.
+    """
+    n_bins, x_min, x_max = track_weight_binning
+    bin_width = (x_max - x_min)/n_bins
+    contents = track_weight_arrays[0]
+
+    min_weight = 1.0
+    max_weight = -400
+    for i_bin in range(n_bins):
+        if contents[i_bin] > 0:
+            low_edge = x_min + (i_bin-1)*bin_width # TAxis::GetBinLowEdge
+            if low_edge > max_weight:
+                max_weight = low_edge
+            if low_edge < min_weight:
+                min_weight = low_edge
+    return (min_weight, max_weight)
+
+
+# branch statuses set, in order, by probe_run_info(); of the step data only
+# the track weights are read
+probe_branch_statuses = [
+    ('*', 0),
+    ('eventHeader*', 1),
+    ('fMCRun*', 1),
+    ('eventSteps', 1),
+    ('fSteps.*', 0),
+    ('fSteps.fTrackWeight', 1),
+]
+
+
+def _get_branch_entry(tree, branch_name, i_entry):
+    """
+    Read one entry of one branch (if the tree has it); return whether it was
+    read.
+    """
+    branch = tree.GetBranch(branch_name)
+    if not branch:
+        return False
+    getattr(tree, branch_name) # makes PyROOT set the branch address
+    branch.GetEntry(i_entry)
+    return True
+
+
+def probe_run_info(tree):
+    """
+    Return a dict of run info of a non-empty tree, reading as little of it as
+    possible.
+
+    Only eventHeader is read while looking for the first entry that isn't a
+    heartbeat; then only fMCRun and the track weights of that entry's steps
+    are read.  is_heartbeat is that of entry 0; step_weight is the track
+    weight of the last step of the first non-heartbeat entry.
+    """
+
+    n_tree_entries = tree.GetEntries()
+
+    ignore_level = ROOT.gErrorIgnoreLevel
+    ROOT.gErrorIgnoreLevel = ROOT.kFatal # not all files have all branches
+    try:
+        for branch_name, status in probe_branch_statuses:
+            tree.SetBranchStatus(branch_name, status)
+
+        # GAT output may not have MaGe's event header and steps
+        is_heartbeat = False
+        i_entry = 0
+        while _get_branch_entry(tree, 'eventHeader', i_entry):
+            if not tree.eventHeader.GetIsHeartbeatEvent():
+                break
+            if i_entry == 0:
+                is_heartbeat = True
+            if i_entry+1 >= n_tree_entries:
+                break
+            i_entry += 1
+
+        _get_branch_entry(tree, 'fMCRun', i_entry)
+        mc_run = tree.fMCRun
+
+        step_weight = 1.0
+        if _get_branch_entry(tree, 'eventSteps', i_entry):
+            eventSteps = tree.eventSteps
+            n_steps = eventSteps.GetNSteps()
+            if n_steps > 0:
+                step_weight = eventSteps.GetStep(n_steps-1).GetTrackWeight()
+
+    finally:
+        tree.SetBranchStatus('*', 1)
+        ROOT.gErrorIgnoreLevel = ignore_level
+
+    return {
+        'n_events': mc_run.GetNEvents(),
+        'is_used': bool(mc_run.GetUseImportanceSampling()),
+        'run_id': mc_run.GetRunID(),
+        'a_max': mc_run.GetAmax(),
+        'biased_particle_id': mc_run.GetBiasedParticleID(),
+        'use_time_window': bool(mc_run.GetUseTimeWindow()),
+        'use_process_window': bool(mc_run.GetUseImportanceProcessWindow()),
+        'is_heartbeat': bool(is_heartbeat),
+        'probe_entry': i_entry,
+        'step_weight': step_weight,
+    }
+
+
+@contextlib.contextmanager
+def open_tree(root_file_name, tree_name='fTree'):
+    """
+    Open a ROOT file and yield (file, tree); the file is closed when the
+    block exits, so long file loops don't pile up open files (and the
+    objects ROOT keeps in them).
+    """
+    root_file = ROOT.TFile(root_file_name)
+    try:
+        yield (root_file, root_file.Get(tree_name))
+    finally:
+        root_file.Close()
+
+
+def probe_file(root_file_name):
+    """
+    Return probe_run_info() of a file's fTree, or None if the tree is empty.
+    """
+    with open_tree(root_file_name) as (root_file, tree):
+        if tree.GetEntries() <= 0:
+            return None
+        return probe_run_info(tree)
+
+
+def start_results(result):
+    """
+    Set result's spectra and track-weight distribution to empty arrays, for
+    fill_chunk() to add to.
+    """
+    result['hist_arrays'] = fill_arrays(numpy.zeros(0), spectrum_binning)
+    result['run_arrays'] = fill_arrays(numpy.zeros(0), run_spectrum_binning)
+    result['track_weight_arrays'] = None
+    if result['is_used']:
+        result['track_weight_arrays'] = fill_arrays(
+            numpy.zeros(0),
+            track_weight_binning,
+        )
+    return result
+
+
+def fill_chunk(result, energies, weights, log2_weights):
+    """
+    Add one chunk to result's spectra: energies [keV] weighted by weights
+    (None if IS wasn't used); log2_weights are the log2 track weights of
+    steps with fEdep>0.
+    """
+    result['hist_arrays'] = add_arrays(
+        result['hist_arrays'],
+        fill_arrays(energies, spectrum_binning, weights),
+    )
+    result['run_arrays'] = add_arrays(
+        result['run_arrays'],
+        fill_arrays(energies, run_spectrum_binning, weights),
+    )
+    if result['is_used']:
+        result['track_weight_arrays'] = add_arrays(
+            result['track_weight_arrays'],
+            fill_arrays(log2_weights, track_weight_binning),
+        )
+    return result
+
+
+def finish_results(result, n_entries):
+    """
+    Add the entry count and track-weight range to result.
+    """
+    result['n_entries'] = n_entries
+    result['min_weight'] = 1.0
+    result['max_weight'] = -400
+    if result['is_used']:
+        min_weight, max_weight = weight_range(result['track_weight_arrays'])
+        result['min_weight'] = min_weight
+        result['max_weight'] = max_weight
+    return result
+
+
+def fill_results(result, n_entries, energies, weights, log2_weights):
+    """
+    Add the entry count, spectra and track-weight range of one whole file to
+    result (see fill_chunk()).
+    """
+    start_results(result)
+    fill_chunk(result, energies, weights, log2_weights)
+    return finish_results(result, n_entries)
+
+
+def mean_weight(weights, default=1.0):
+    """
+    Return the mean of event weights, or default if there are none.
+    """
+    if len(weights) == 0:
+        return default
+    return float(numpy.mean(weights))
+
+
+def reduce_file(root_file_name, fill_spectra=True):
+    """
+    Return a dict of run info (see probe_run_info()), entry count and, if
+    fill_spectra, spectra for one MaGe ROOT file, or None if its tree is
+    empty.  The file is closed before returning.
+
+    If importance sampling was used, each event is weighted by its own
+    weight (see event_weights()), and 'event_weight' is the mean weight of
+    the entries -- the file's efficiency is event_weight*n_entries/n_events.
+
+    The result's 'profile' has the wall time of the open, probe and fill
+    phases and the bytes read (see fileProfile).
+    """
+
+    timer = PhaseTimer()
+    with open_tree(root_file_name) as (root_file, tree):
+        timer.lap('open')
+        result = reduce_tree(tree, fill_spectra, timer)
+        if result is not None:
+            result['profile'] = timer.profile(root_file.GetBytesRead())
+        return result
+
+
+def reduce_tree(tree, fill_spectra=True, timer=None):
+    """
+    Like reduce_file(), for an fTree; timer, a fileProfile.PhaseTimer, gets
+    the probe and fill laps.
+    """
+
+    if timer is None:
+        timer = PhaseTimer()
+    if tree.GetEntries() <= 0:
+        return None
+
+    result = probe_run_info(tree)
+    is_used = result['is_used']
+    timer.lap('probe')
+
+    if not fill_spectra and not is_used:
+        result['n_entries'] = tree.Draw(
+            'fTotalEnergy',
+            'fTotalEnergy>0',
+            'goff'
+        )
+        timer.lap('fill')
+        return result
+
+    # spectra are filled chunk by chunk, so memory doesn't grow with the
+    # number of steps in the file
+    n_entries = 0
+    if fill_spectra:
+        start_results(result)
+
+    if is_used:
+
+        weight_sum = 0.0
+        n_weights = 0
+
+        # one row per step; chunks hold whole entries, and an entry's rows
+        # start where Iteration$ is 0
+        for energy, track_weight, edep, iteration, selection in draw_arrays(
+            tree,
+            [
+                'fTotalEnergy*1e3',
+                'fSteps.fTrackWeight',
+                'fSteps.fEdep',
+                'Iteration$',
+            ],
+        ):
+
+            starts = numpy.flatnonzero(iteration == 0)
+            step_offsets = numpy.append(starts, len(iteration))
+            is_entry = energy[starts] > 0
+            n_entries += numpy.count_nonzero(is_entry)
+            weights = event_weights(step_offsets, track_weight, edep)[is_entry]
+            weight_sum += weights.sum()
+            n_weights += len(weights)
+            if fill_spectra:
+                fill_chunk(
+                    result,
+                    energy[starts][is_entry],
+                    weights,
+                    step_log2_weights(track_weight, edep),
+                )
+
+        # without entries, fall back to the probed step weight, as before
+        # events were weighted one by one
+        result['event_weight'] = result['step_weight']
+        if n_weights > 0:
+            result['event_weight'] = weight_sum/n_weights
+
+        if not fill_spectra:
+            result['n_entries'] = n_entries
+            timer.lap('fill')
+            return result
+
+    else:
+
+        for energy, selection in draw_arrays(
+            tree,
+            ['fTotalEnergy*1e3'],
+            'fTotalEnergy>0',
+        ):
+            n_entries += len(energy)
+            fill_chunk(result, energy, None, None)
+
+    finish_results(result, n_entries)
+    timer.lap('fill')
+    return result
+
+
+def reduce_columns(columns, fill_spectra=True):
+    """
+    Like reduce_file(), from a columnExport.ColumnSet instead of the ROOT
+    file.
+    """
+
+    if columns.run['n_tree_entries'] <= 0:
+        return None
+
+    timer = PhaseTimer()
+    result = dict(columns.run['run_info'])
+    is_used = result['is_used']
+
+    energy = columns['fTotalEnergy']*1e3
+    if not fill_spectra and not is_used:
+        result['n_entries'] = int(numpy.count_nonzero(energy > 0))
+        timer.lap('fill')
+        result['profile'] = timer.profile()
+        return result
+
+    if is_used:
+
+        # TTree::Draw of step arrays skips entries without steps
+        step_offsets = columns.offsets('fTrackWeight')
+        n_steps = numpy.diff(step_offsets)
+        is_entry = (energy > 0) & (n_steps > 0)
+        n_entries = int(numpy.count_nonzero(is_entry))
+
+        track_weight = columns['fTrackWeight']
+        edep = columns['fEdep']
+        log2_weights = step_log2_weights(track_weight, edep)
+
+        energies = energy[is_entry]
+        weights = event_weights(step_offsets, track_weight, edep)[is_entry]
+        result['event_weight'] = mean_weight(weights, result['step_weight'])
+
+        if not fill_spectra:
+            result['n_entries'] = n_entries
+            timer.lap('fill')
+            result['profile'] = timer.profile()
+            return result
+
+    else:
+
+        energies = energy[energy > 0]
+        n_entries = len(energies)
+        weights = None
+        log2_weights = None
+
+    fill_results(result, n_entries, energies, weights, log2_weights)
+    timer.lap('fill')
+    result['profile'] = timer.profile()
+    return result
@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+
+"""
+Bulk relocation of files, e.g. quarantining bad importance-sampling output.
+
+Files are moved in-process on a small thread pool (moves on network
+filesystems are latency bound), by linking the new name and unlinking the
+old one, so a move never replaces an existing file, and falling back to
+copy and unlink when the destination is on another device.  Every move is
+recorded in a journal (one JSON record per line), so an interrupted
+relocation can be resumed and a finished one undone:
+
+    fileRelocation.py --resume JOURNAL
+    fileRelocation.py --undo JOURNAL
+
+A list of files, one per line (e.g. the outlier runs written by
+checkImportanceSampledSpectra.py --outliers), is moved with
+
+    fileRelocation.py --move LIST_FILE [--destination DIR]
+"""
+
+import os
+import sys
+import json
+import errno
+import shutil
+import argparse
+import threading
+from multiprocessing.pool import ThreadPool
+
+
+default_n_threads = 8
+default_destination_dir = 'bad_runs'
+
+
+def link_file(source, destination):
+    """
+    Give source the name destination too, failing with EEXIST if it exists:
+    unlike a rename, a link never replaces another file, even when threads
+    race for the same name.  Filesystems without hard links fall back to a
+    checked rename.
+    """
+    try:
+        os.link(source, destination)
+        return True
+    except OSError, e:
+        if e.errno not in (errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP):
+            raise
+    if os.path.lexists(destination):
+        raise OSError(errno.EEXIST, 'destination exists', destination)
+    os.rename(source, destination)
+    return False
+
+
+def move_file(source, destination):
+    """
+    Move source to destination, which must not exist yet.
+    """
+    try:
+        if link_file(source, destination):
+            os.unlink(source)
+    except OSError, e:
+        if e.errno != errno.EXDEV:
+            raise
+        # different device: copy next to the destination, then link, so a
+        # partial copy never has the destination name
+        tmp_destination = destination + '.relocating'
+        shutil.copy2(source, tmp_destination)
+        try:
+            if link_file(tmp_destination, destination):
+                os.unlink(tmp_destination)
+        except OSError:
+            os.unlink(tmp_destination)
+            raise
+        os.unlink(source)
+
+
+class Journal(object):
+    """
+    Append-only record of planned and finished moves.
+    """
+
+    def __init__(self, journal_file_name):
+
+        self.journal_file_name = journal_file_name
+        self.lock = threading.Lock()
+        self.journal_file = open(journal_file_name, 'a')
+
+    def write(self, **record):
+
+        self.write_all([record])
+
+    def write_all(self, records):
+        """
+        Append records, dicts, with a single fsync.
+        """
+        with self.lock:
+            for record in records:
+                line = json.dumps(record, sort_keys=True)
+                self.journal_file.write(line + '\n')
+            self.journal_file.flush()
+            os.fsync(self.journal_file.fileno())
+
+    def close(self):
+
+        self.journal_file.close()
+
+
+def read_journal(journal_file_name):
+    """
+    Return a list of (source, destination, status) in planned order, with the
+    last status recorded for each move.
+    """
+    moves = {}
+    order = []
+    with open(journal_file_name) as journal_file:
+        for line in journal_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue # torn last line of an interrupted run
+            key = (record['source'], record['destination'])
+            if key not in moves:
+                order.append(key)
+            moves[key] = record['status']
+    return [(source, destination, moves[(source, destination)])
+        for source, destination in order]
+
+
+def _run_moves(moves, journal, n_threads, reverse=False, is_resume=False):
+    """
+    Run (source, destination) moves on a thread pool, or move the files back
+    if reverse; return the list of (file name, error message) failures.
+
+    When resuming, moves that finished without being journaled (source gone,
+    destination there) count as done.
+    """
+
+    done_status, failed_status = ('done', 'failed')
+    if reverse:
+        done_status, failed_status = ('undone', 'undo_failed')
+
+    def run_move(move):
+        source, destination = move
+        from_name, to_name = move
+        if reverse:
+            from_name, to_name = (destination, source)
+        try:
+            if not (is_resume and not os.path.lexists(from_name) and
+                os.path.lexists(to_name)):
+                move_file(from_name, to_name)
+        except (OSError, IOError), e:
+            journal.write(
+                source=source,
+                destination=destination,
+                status=failed_status,
+                error=str(e),
+            )
+            return (source, str(e))
+        journal.write(source=source, destination=destination, status=done_status)
+        return None
+
+    pool = ThreadPool(max(1, n_threads))
+    try:
+        results = pool.map(run_move, moves)
+    finally:
+        pool.close()
+        pool.join()
+    return [result for result in results if result is not None]
+
+
+def unique_destinations(moves):
+    """
+    Return (source, destination) moves with repeated destinations, e.g. the
+    same basename from two source directories, renamed <name>.<n><ext>.
+    Repeated sources are moved once.
+    """
+    sources = set()
+    destinations = set(destination for source, destination in moves)
+    taken = set()
+    unique_moves = []
+    for source, destination in moves:
+        if source in sources:
+            continue
+        sources.add(source)
+        if destination in taken:
+            stem, extension = os.path.splitext(destination)
+            i_copy = 1
+            while '%s.%i%s' % (stem, i_copy, extension) in destinations:
+                i_copy += 1
+            destination = '%s.%i%s' % (stem, i_copy, extension)
+            destinations.add(destination)
+        taken.add(destination)
+        unique_moves.append((source, destination))
+    return unique_moves
+
+
+def relocate_files(
+    file_names,
+    destination_dir,
+    journal_file_name=None,
+    n_threads=default_n_threads,
+):
+    """
+    Move file_names into destination_dir; return a list of (file name, error
+    message) for files that couldn't be moved.  Files with the same basename
+    are renamed (see unique_destinations()) rather than overwritten.  The
+    journal defaults to <destination_dir>.journal.
+    """
+
+    if journal_file_name is None:
+        journal_file_name = destination_dir.rstrip(os.sep) + '.journal'
+    if not os.path.isdir(destination_dir):
+        os.makedirs(destination_dir)
+
+    moves = unique_destinations([
+        (
+            os.path.abspath(file_name),
+            os.path.join(
+                os.path.abspath(destination_dir),
+                os.path.basename(file_name),
+            ),
+        ) for file_name in file_names
+    ])
+
+    journal = Journal(journal_file_name)
+    try:
+        journal.write_all([
+            {'source': source, 'destination': destination, 'status': 'planned'}
+            for source, destination in moves
+        ])
+        return _run_moves(moves, journal, n_threads)
+    finally:
+        journal.close()
+
+
+def resume(journal_file_name, n_threads=default_n_threads):
+    """
+    Finish the planned and failed moves of a journal.
+    """
+    moves = [
+        (source, destination)
+        for source, destination, status in read_journal(journal_file_name)
+        if status in ('planned', 'failed')
+    ]
+    journal = Journal(journal_file_name)
+    try:
+        return _run_moves(moves, journal, n_threads, is_resume=True)
+    finally:
+        journal.close()
+
+
+def undo(journal_file_name, n_threads=default_n_threads):
+    """
+    Move the files of finished moves in a journal back where they came from.
+    """
+    moves = [
+        (source, destination)
+        for source, destination, status in read_journal(journal_file_name)
+        if status in ('done', 'undo_failed')
+    ]
+    journal = Journal(journal_file_name)
+    try:
+        return _run_moves(
+            moves,
+            journal,
+            n_threads,
+            reverse=True,
+            is_resume=True,
+        )
+    finally:
+        journal.close()
+
+
+def read_file_list(list_file_name):
+    """
+    Return the file names in a list file, one per line; blank lines and
+    comment lines, starting with '#' after any indentation, are skipped.
+    """
+    with open(list_file_name) as list_file:
+        return [
+            line.strip() for line in list_file
+            if line.strip() and not line.strip().startswith('#')
+        ]
+
+
+def print_failures(failures):
+
+    if len(failures) == 0:
+        print '\t done'
+        return
+    print '--> %i files could not be moved:' % len(failures)
+    for file_name, error in failures:
+        print '\t %s: %s' % (os.path.basename(file_name), error)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--resume', metavar='JOURNAL')
+    group.add_argument('--undo', metavar='JOURNAL')
+    group.add_argument('--move', metavar='LIST_FILE')
+    parser.add_argument(
+        '--destination',
+        metavar='DIR',
+        default=default_destination_dir,
+        help='with --move, where to move the files (default %s)' % (
+            default_destination_dir
+        ),
+    )
+    parser.add_argument(
+        '-t', '--threads',
+        type=int,
+        default=default_n_threads,
+        help='number of moves to run at once',
+    )
+    options = parser.parse_args()
+
+    if options.move:
+        failures = relocate_files(
+            read_file_list(options.move),
+            options.destination,
+            n_threads=options.threads,
+        )
+        print '--> journal: %s.journal' % options.destination.rstrip(os.sep)
+    elif options.resume:
+        failures = resume(options.resume, options.threads)
+    else:
+        failures = undo(options.undo, options.threads)
+
+    print_failures(failures)
+    if failures:
+        sys.exit(1)
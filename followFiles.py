@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+"""
+Follow results directories while simulation jobs are still writing them.
+
+A FileWatcher polls glob patterns (or directories, for their *.root files)
+and hands out each file once, when it is complete: not modified for
+settle_time seconds, and opened cleanly by ROOT -- not a zombie, not
+recovered (ROOT recovers files their job never closed) and with an fTree.
+A file that fails the check is retried only once it changes again.  Polls
+only stat the files not handed out yet, and only open those that look
+complete, so the cost of following is in the new files.  Polling, rather
+than inotify, also sees files written by jobs on other NFS clients.
+
+follow() runs the loop: new files go to a process function as they are
+found, and a refresh function updates the outputs every refresh_interval
+seconds; the scripts make their usual outputs once it stops.
+"""
+
+import os
+import glob
+import time
+
+from lazyROOT import ROOT
+
+from fileReduction import open_tree
+
+
+default_poll_interval = 30.0 # seconds
+default_settle_time = 60.0 # seconds since the last write
+default_refresh_interval = 300.0 # seconds
+
+
+def is_complete_root_file(root_file_name):
+    """
+    Return whether ROOT opens root_file_name cleanly, with an fTree.
+    """
+    with open_tree(root_file_name) as (root_file, tree):
+        if root_file.IsZombie() or root_file.TestBit(ROOT.TFile.kRecovered):
+            return False
+        return bool(tree)
+
+
+class FileWatcher(object):
+    """
+    Newly completed files matching patterns, each handed out once.
+    """
+
+    def __init__(
+        self,
+        patterns,
+        settle_time=default_settle_time,
+        known_files=(),
+    ):
+
+        self.patterns = []
+        for pattern in patterns:
+            if os.path.isdir(pattern):
+                pattern = os.path.join(pattern, '*.root')
+            self.patterns.append(pattern)
+        self.settle_time = settle_time
+        self.done = set(known_files) # handed out, or already processed
+        self.rejected = {} # file name -> (size, mtime) that failed the check
+
+    def poll(self):
+        """
+        Return the files completed since the last poll, sorted.
+        """
+        now = time.time()
+        new_files = []
+        for pattern in self.patterns:
+            for file_name in glob.glob(pattern):
+                if file_name in self.done:
+                    continue
+                try:
+                    stat = os.stat(file_name)
+                except OSError:
+                    continue # removed since the glob
+                if now - stat.st_mtime < self.settle_time:
+                    continue # still being written
+                key = (stat.st_size, stat.st_mtime)
+                if self.rejected.get(file_name) == key:
+                    continue
+                if not is_complete_root_file(file_name):
+                    print '--> skipping incomplete file %s' % file_name
+                    self.rejected[file_name] = key
+                    continue
+                self.rejected.pop(file_name, None)
+                self.done.add(file_name)
+                new_files.append(file_name)
+        new_files.sort()
+        return new_files
+
+
+def follow(
+    watcher,
+    process_function,
+    refresh_function,
+    poll_interval=default_poll_interval,
+    refresh_interval=default_refresh_interval,
+    idle_time=None,
+):
+    """
+    Call process_function(file names) with each poll's new files from
+    watcher, a FileWatcher, and refresh_function() every refresh_interval
+    seconds if there were new files.  Stop after idle_time seconds without
+    new files (never, if None) or on Ctrl-C.
+    """
+    last_new_time = time.time()
+    last_refresh_time = last_new_time
+    is_stale = False
+    try:
+        while True:
+            new_files = watcher.poll()
+            now = time.time()
+            if new_files:
+                print '--> %i new files' % len(new_files)
+                process_function(new_files)
+                last_new_time = now
+                is_stale = True
+            if is_stale and now - last_refresh_time >= refresh_interval:
+                refresh_function()
+                last_refresh_time = now
+                is_stale = False
+            if idle_time is not None and now - last_new_time >= idle_time:
+                print '--> no new files for %g s' % idle_time
+                break
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print '--> stopped following'
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+"""
+Lazy access to PyROOT.
+
+    from lazyROOT import ROOT
+
+ROOT behaves like the PyROOT module, but ROOT itself (and cling) is only
+loaded the first time one of its attributes is used, so argument parsing,
+cache hits and column files don't pay PyROOT's startup time.
+"""
+
+import sys
+
+
+class _LazyROOT(object):
+
+    def _module(self):
+
+        import ROOT
+        return ROOT
+
+    def __getattr__(self, name):
+
+        return getattr(self._module(), name)
+
+    def __setattr__(self, name, value):
+
+        setattr(self._module(), name, value)
+
+
+def is_loaded():
+    """
+    Return whether PyROOT has been imported yet.
+    """
+    return 'ROOT' in sys.modules
+
+
+ROOT = _LazyROOT()
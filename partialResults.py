@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+"""
+Partial results of map jobs, merged by a reduce step.
+
+A job of a batch array runs a script in map mode over its shard of the
+input files and saves a Partial: named histogram arrays, named counts,
+per-run spectra, the input file names and some info.  Any number of
+partials merge associatively -- histograms and counts add, runs and file
+names concatenate in order -- so shards can be reduced in any grouping,
+and the reduce step renders the merged result as a single run would.
+
+Partials are .npz files, with the non-array parts as JSON in 'meta'.
+"""
+
+import os
+import json
+
+import numpy
+
+from spectrumStore import add_arrays
+from spectrumStore import RunArrayStore
+
+
+def _to_json(value):
+
+    if isinstance(value, numpy.generic):
+        return value.item()
+    return value
+
+
+class Partial(object):
+    """
+    Mergeable result of one shard of input files.
+    """
+
+    def __init__(self, kind, spill_dir=None):
+
+        self.kind = kind
+        self.hist_names = [] # in the order they were first added
+        self.hists = {} # name -> (contents, sumw2, entries)
+        self.counts = {}
+        self.runs = RunArrayStore(spill_dir) # (run ID, n events, arrays)
+        self.run_file_names = [] # the file of each run, or None
+        self.file_names = []
+        self.info = {} # JSON-serializable; merging keeps the last value
+
+    def add_hist(self, name, arrays):
+
+        if name not in self.hists:
+            self.hist_names.append(name)
+        self.hists[name] = add_arrays(self.hists.get(name), arrays)
+
+    def add_count(self, name, value):
+
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def merge(self, other):
+        """
+        Add other, a Partial of the same kind, to this one.
+        """
+        if other.kind != self.kind:
+            raise ValueError('cannot merge %s partial into %s partial' % (
+                other.kind,
+                self.kind,
+            ))
+        for name in other.hist_names:
+            self.add_hist(name, other.hists[name])
+        for name, value in other.counts.items():
+            self.add_count(name, value)
+        for run_id, n_events, arrays in other.runs:
+            self.runs.append(run_id, n_events, arrays)
+        self.run_file_names.extend(other.run_file_names)
+        self.file_names.extend(other.file_names)
+        self.info.update(other.info)
+        return self
+
+    def save(self, file_name):
+
+        arrays = {}
+        hist_entries = []
+        for i_hist, name in enumerate(self.hist_names):
+            contents, sumw2, entries = self.hists[name]
+            arrays['hist%i_contents' % i_hist] = contents
+            arrays['hist%i_sumw2' % i_hist] = sumw2
+            hist_entries.append(_to_json(entries))
+
+        runs = []
+        run_contents = []
+        run_sumw2 = []
+        for run_id, n_events, (contents, sumw2, entries) in self.runs:
+            runs.append([_to_json(run_id), _to_json(n_events), _to_json(entries)])
+            run_contents.append(contents)
+            run_sumw2.append(sumw2)
+        if runs:
+            arrays['run_contents'] = numpy.array(run_contents)
+            arrays['run_sumw2'] = numpy.array(run_sumw2)
+
+        meta = {
+            'kind': self.kind,
+            'hist_names': self.hist_names,
+            'hist_entries': hist_entries,
+            'counts': dict(
+                (name, _to_json(value)) for name, value in self.counts.items()
+            ),
+            'runs': runs,
+            'run_file_names': self.run_file_names,
+            'file_names': self.file_names,
+            'info': self.info,
+        }
+        arrays['meta'] = numpy.array(json.dumps(meta, sort_keys=True))
+
+        tmp_file_name = file_name + '.tmp.npz'
+        numpy.savez(tmp_file_name, **arrays)
+        os.rename(tmp_file_name, file_name)
+
+    @classmethod
+    def load(cls, file_name, spill_dir=None):
+
+        npz_file = numpy.load(file_name)
+        try:
+            meta = json.loads(str(npz_file['meta']))
+            partial = cls(str(meta['kind']), spill_dir)
+            for i_hist, name in enumerate(meta['hist_names']):
+                partial.add_hist(str(name), (
+                    npz_file['hist%i_contents' % i_hist],
+                    npz_file['hist%i_sumw2' % i_hist],
+                    meta['hist_entries'][i_hist],
+                ))
+            if meta['runs']:
+                run_contents = npz_file['run_contents']
+                run_sumw2 = npz_file['run_sumw2']
+            for i_run, (run_id, n_events, entries) in enumerate(meta['runs']):
+                partial.runs.append(run_id, n_events, (
+                    run_contents[i_run],
+                    run_sumw2[i_run],
+                    entries,
+                ))
+        finally:
+            npz_file.close()
+        # names come back from JSON as unicode; ROOT wants str
+        partial.counts = dict(
+            (str(name), value) for name, value in meta['counts'].items()
+        )
+        partial.run_file_names = [
+            str(name) if name is not None else None
+            for name in meta.get('run_file_names', [None]*len(meta['runs']))
+        ]
+        partial.file_names = [str(name) for name in meta['file_names']]
+        partial.info = dict(
+            (str(name), value) for name, value in meta['info'].items()
+        )
+        return partial
+
+
+def merge_partials(partial_file_names, spill_dir=None):
+    """
+    Load and merge partial files, in order; return the merged Partial.
+    """
+    merged = None
+    for partial_file_name in partial_file_names:
+        print '--> merging %s' % os.path.basename(partial_file_name)
+        partial = Partial.load(partial_file_name)
+        if merged is None:
+            merged = Partial(partial.kind, spill_dir)
+        merged.merge(partial)
+        partial.runs.close()
+    return merged
+
+
+def select_shard(file_names, shard_index, n_shards):
+    """
+    Return the shard_index-th of n_shards interleaved slices of file_names.
+    """
+    if not 0 <= shard_index < n_shards:
+        raise ValueError('shard %i of %i' % (shard_index, n_shards))
+    return file_names[shard_index::n_shards]
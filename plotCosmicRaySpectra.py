@@ -5,67 +5,276 @@ plot energy spectrum due to cosmic ray muons from MaGe/GAT root files
 """
 
 import os
+import sys
 import glob
+import time
+import argparse
 
-#from ROOT import gROOT
-#gROOT.SetBatch(True)
-from ROOT import TFile
-from ROOT import TH1D
-from ROOT import TCanvas
-from ROOT import TColor
+import numpy
 
+from lazyROOT import ROOT
+#ROOT.gROOT.SetBatch(True)
 
-def main(file_names):
+from fileReduction import draw_arrays
+from fileReduction import fill_arrays
+from fileReduction import probe_run_info
+from fileReduction import open_tree
+from columnExport import get_columns
+from spectrumStore import add_arrays
+from resolutionSmearing import smear_arrays
+from resolutionSmearing import parse_model
+from resolutionSmearing import default_model
+from fileProfile import Profiler
+from filePrefetch import prefetch_files
+from filePrefetch import default_budget_mb
+from batchMode import Views
+from arrayHist import ArrayHist
+from resultsCatalog import select_files
+from resultsCatalog import parse_selection
+from resultsCatalog import default_catalog_file_name
 
-    max_bin = 3000
-    n_bins = 600
-    
-    hist = TH1D('hist', '', n_bins, 0, max_bin)
+
+spectrum_binning = (600, 0.0, 3000.0) # 5-keV bins
+fine_binning = (30000, 0.0, 3000.0) # 0.1-keV bins, unsmeared
+
+
+def fill_from_tree(tree, binning):
+    """
+    Return the unsmeared (contents, sumw2, entries) spectrum arrays of tree;
+    resolution is applied later, by smear_arrays().
+    """
+    arrays = fill_arrays(numpy.zeros(0), binning)
+    for energy, weight in draw_arrays(
+        tree,
+        ['fEnergy/0.001'],
+        'fMCEventWeight.fWaveformWeight*(fEnergy>0)',
+    ):
+        arrays = add_arrays(arrays, fill_arrays(energy, binning, weight))
+    return arrays
+
+
+def fill_from_columns(columns, binning):
+    """
+    Return the unsmeared spectrum arrays of columnExport columns, like
+    fill_from_tree().
+    """
+    waveform_weight = columns.expand('fWaveformWeight', 'fEnergy')
+
+    return fill_arrays(
+        columns['fEnergy']/0.001,
+        binning,
+        waveform_weight*(columns['fEnergy']>0),
+    )
+
+
+def main(
+    file_names,
+    column_root=None,
+    profiler=None,
+    n_prefetch=0,
+    prefetch_budget_mb=default_budget_mb,
+    views=None,
+    models=None,
+):
+    """
+    Draw the spectrum of file_names smeared with each resolutionSmearing
+    model in models (default: default_model).  The files are read once.
+    """
+
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+    if views is None:
+        views = Views()
+    if not models:
+        models = [default_model]
+
+    fine_arrays = None
     n_total_events = 0
 
+    if column_root is None:
+        file_names = prefetch_files(file_names, n_prefetch, prefetch_budget_mb)
+
     for file_name in file_names:
         print os.path.basename(file_name)
 
-        root_file = TFile(file_name)
-        tree = root_file.Get('fTree')
+        if column_root is not None:
+            with profiler.phase('open', file_name):
+                columns = get_columns(file_name, column_root)
+            n_events = columns.run['run_info']['n_events']
+            with profiler.phase('fill', file_name):
+                arrays = fill_from_columns(columns, fine_binning)
+                fine_arrays = add_arrays(fine_arrays, arrays)
+            n_entries = arrays[2]
+            profiler.add_file(file_name, n_entries=n_entries, n_events=n_events)
+            print n_events, n_entries
+            n_total_events += n_events
+            continue
 
-        tree.GetEntry(0)
-        n_events = tree.fMCRun.GetNEvents()
+        open_time = time.time()
+        with open_tree(file_name) as (root_file, tree):
+            profiler.add_phase('open', time.time() - open_time, file_name)
 
+            with profiler.phase('probe', file_name):
+                n_events = probe_run_info(tree)['n_events']
 
-        hist.GetDirectory().cd()
-        n_entries = tree.Draw(
-            'fEnergy/0.001 + fRand * sqrt( 0.153845^2 + fEnergy/0.001 * 0.00296 * 0.12285 )>>+ %s' % hist.GetName(),
-            'fMCEventWeight.fWaveformWeight*(fEnergy>0)',
-            'goff'
-        )
+            with profiler.phase('fill', file_name):
+                arrays = fill_from_tree(tree, fine_binning)
+                fine_arrays = add_arrays(fine_arrays, arrays)
+            n_entries = arrays[2]
+            profiler.add_file(
+                file_name,
+                bytes_read=root_file.GetBytesRead(),
+                n_entries=n_entries,
+                n_events=n_events,
+            )
 
         print n_events, n_entries
         n_total_events += n_events
 
     print '%s total events' % n_total_events
-    print hist.GetEntries()
+    if fine_arrays is None:
+        fine_arrays = fill_arrays(numpy.zeros(0), fine_binning)
+
+    hists = []
+    for i_model, model in enumerate(models):
+        with profiler.phase('smear'):
+            arrays = smear_arrays(
+                fine_arrays,
+                fine_binning,
+                spectrum_binning,
+                model,
+            )
+        name = 'hist' if i_model == 0 else 'hist%i' % i_model
+        hist = ArrayHist.from_arrays(spectrum_binning, arrays).to_th1d(name)
+        hists.append(hist)
+    print hists[0].GetEntries()
 
-    canvas = TCanvas('canvas', '')
+    profiler.start_phase('render')
+    canvas = ROOT.TCanvas('canvas', '')
     canvas.SetLogy(1)
-    hist.SetXTitle('Energy [keV]')
-    hist.SetYTitle('Counts / %.1f keV' % hist.GetBinWidth(1) )
-    hist.SetLineColor(TColor.kBlue+1)
-    hist.SetLineWidth(2)
-    hist.Draw()
+    legend = ROOT.TLegend(0.1, 0.91, 0.9, 0.99)
+    legend.SetNColumns(2)
+    for i_model, (model, hist) in enumerate(zip(models, hists)):
+        hist.SetXTitle('Energy [keV]')
+        hist.SetYTitle('Counts / %.1f keV' % hist.GetBinWidth(1) )
+        hist.SetLineColor(ROOT.TColor.kBlue+1 if i_model == 0 else i_model+1)
+        hist.SetLineWidth(2)
+        hist.Draw('' if i_model == 0 else 'same')
+        entry_label = '#sigma^{2} = %g^{2} + %g E + (%g E)^{2}' % model
+        legend.AddEntry(hist, entry_label, 'l')
+    if len(hists) > 1:
+        legend.Draw()
     canvas.Update()
 
-    #canvas.Print('cosmicRayResponse.pdf')
+    views.save(canvas, 'cosmicRayResponse')
 
-    test = raw_input('--> any key >> ')
+    profiler.stop_phase()
+    test = views.prompt('--> any key >> ')
 
 
 if __name__ == '__main__':
 
-    # default is for MALBEK on cenpa-rocks:
-    gat_dir = os.getenv('GATRESULTS')
-    file_names = glob.glob('%s/BEGeKURFInShield/cosmicRays/cosmic/A0_Z0/*.root' % gat_dir)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file_names', nargs='*', metavar='ROOT_FILE')
+    parser.add_argument(
+        '--columns',
+        metavar='COLUMN_DIR',
+        default=None,
+        help='fill the spectrum from columnExport column files in COLUMN_DIR',
+    )
+    parser.add_argument(
+        '--prefetch',
+        type=int,
+        default=0,
+        metavar='N',
+        help='read the next N files ahead into the page cache',
+    )
+    parser.add_argument(
+        '--prefetch-budget',
+        type=int,
+        default=default_budget_mb,
+        metavar='MB',
+        help='most data to read ahead at once (default %i MB)' % (
+            default_budget_mb
+        ),
+    )
+    parser.add_argument(
+        '--resolution',
+        action='append',
+        metavar='NOISE,FANO[,LINEAR]',
+        default=None,
+        help='smear with sigma^2 = NOISE^2 + FANO*E + (LINEAR*E)^2 [keV]; '
+            'repeat to compare models (default %g,%g)' % default_model[:2],
+    )
+    parser.add_argument(
+        '--select',
+        action='append',
+        metavar='KEY=VALUE',
+        default=None,
+        help='read the files of the resultsCatalog catalog with column KEY '
+            'equal to VALUE (repeat to combine), e.g. isotope=A68_Z32',
+    )
+    parser.add_argument(
+        '--where',
+        metavar='SQL',
+        default=None,
+        help='with --select, an extra SQL condition on the catalog',
+    )
+    parser.add_argument(
+        '--catalog',
+        metavar='FILE',
+        default=default_catalog_file_name,
+        help='resultsCatalog catalog file (default %s)' % (
+            default_catalog_file_name
+        ),
+    )
+    parser.add_argument(
+        '--batch',
+        metavar='OUTPUT_DIR',
+        default=None,
+        help='don\'t prompt or open windows; print the spectrum to OUTPUT_DIR',
+    )
+    parser.add_argument(
+        '--profile',
+        metavar='TRACE_FILE',
+        default=None,
+        help='write per-file timing to TRACE_FILE (JSON) and print a summary',
+    )
+    options = parser.parse_args()
+
+    try:
+        models = [parse_model(text) for text in options.resolution or []]
+    except ValueError, e:
+        parser.error(str(e))
+
+    file_names = options.file_names
+    if options.select is not None or options.where is not None:
+        file_names += select_files(
+            options.catalog,
+            parse_selection(options.select),
+            options.where,
+        )
+        print '--> %i files selected from %s' % (
+            len(file_names),
+            options.catalog,
+        )
+        if len(file_names) < 1:
+            sys.exit()
+    if len(file_names) < 1:
+        # default is for MALBEK on cenpa-rocks:
+        gat_dir = os.getenv('GATRESULTS')
+        file_names = glob.glob('%s/BEGeKURFInShield/cosmicRays/cosmic/A0_Z0/*.root' % gat_dir)
 
-    main(file_names=file_names)
+    profiler = Profiler(enabled=options.profile is not None)
+    main(
+        file_names=file_names,
+        column_root=options.columns,
+        profiler=profiler,
+        n_prefetch=options.prefetch,
+        prefetch_budget_mb=options.prefetch_budget,
+        views=Views(options.batch, True) if options.batch else None,
+        models=models,
+    )
+    profiler.report(options.profile)
 
 
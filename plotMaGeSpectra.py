@@ -8,81 +8,211 @@ Compare MC spectra produced with different dead layers.
 
 import os
 import sys
-import math
 import glob
+import time
+import argparse
+import functools
+
+import numpy
+
+from lazyROOT import ROOT
+
+from fileReduction import draw_arrays
+from fileReduction import fill_arrays
+from fileReduction import probe_run_info
+from fileReduction import open_tree
+from columnExport import get_columns
+from spectrumStore import SpectrumStore
+from spectrumStore import add_arrays
+from spectrumIndex import SpectrumIndex
+from spectrumIndex import default_windows
+from spectrumIndex import reference_peak
+from spectrumIndex import ratio_with_error
+from spectrumIndex import scan_windows
+from spectrumIndex import read_windows
+from spectrumIndex import window_table
+from spectrumIndex import print_table
+from spectrumIndex import write_table
+from partialResults import Partial
+from partialResults import merge_partials
+from partialResults import select_shard
+from fileProfile import Profiler
+from batchMode import Views
+from arrayHist import ArrayHist
+from quickLook import QuickLook
+from batchMode import render_in_pool
+
+
+spectrum_binning = (3000, 0.0, 3000.0) # 1-keV bins
+
+
+def get_file_spectrum(root_file_name, column_root=None, profiler=None):
+    """
+    Return the (contents, sumw2, entries) spectrum arrays of one file and a
+    dict with its fMCRun Amax.
+    """
+
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+
+    if column_root is not None:
+        with profiler.phase('open', root_file_name):
+            columns = get_columns(root_file_name, column_root)
+        with profiler.phase('fill', root_file_name):
+            energy = columns['fTotalEnergy']*1e3
+            arrays = fill_arrays(energy[energy > 0], spectrum_binning)
+        profiler.add_file(
+            root_file_name,
+            n_entries=arrays[2],
+            n_events=columns.run['run_info']['n_events'],
+        )
+        return (arrays, {'a_max': columns.run['run_info']['a_max']})
+
+    open_time = time.time()
+    with open_tree(root_file_name) as (root_file, tree):
+        profiler.add_phase('open', time.time() - open_time, root_file_name)
+
+        with profiler.phase('fill', root_file_name):
+            energies = [
+                energy for energy, selection in
+                draw_arrays(tree, ['fTotalEnergy*1e3'], 'fTotalEnergy>0')
+            ]
+            energies = numpy.concatenate(energies) if energies else (
+                numpy.zeros(0)
+            )
+
+        with profiler.phase('probe', root_file_name):
+            run_info = probe_run_info(tree)
+        a_max = run_info['a_max']
+
+        profiler.add_file(
+            root_file_name,
+            bytes_read=root_file.GetBytesRead(),
+            n_entries=len(energies),
+            n_events=run_info['n_events'],
+        )
 
-from ROOT import gROOT
-from ROOT import TCanvas
-from ROOT import TColor
-from ROOT import TFile
-from ROOT import TH1D
-from ROOT import TLegend
+    return (fill_arrays(energies, spectrum_binning), {'a_max': a_max})
 
 
-def get_hist_from_files(
+def get_directory_spectrum(
     directory,
+    column_root=None,
+    store_root=None,
+    profiler=None,
+    shard=None,
+    quick_precision=None,
+    seed=None,
 ):
     """
-    Return a histogram energy spectrum constructed from root files in directory.
+    Return the (contents, sumw2, entries) spectrum arrays of the root files in
+    directory (None if there are none) and the fMCRun Amax of the last one.
+
+    If column_root is given, the spectrum is filled from columnExport column
+    files there instead of drawing each tree.  If store_root is given, per-file
+    and merged spectra are kept there and only new or changed files are read.
+    profiler, a fileProfile.Profiler, records per-file timing.  shard, an
+    (index, n_shards) pair, selects every n_shards-th file.
+
+    If quick_precision is given (store_root must not be), files are read in
+    random order until the mean peak counts per file and the ROI/peak ratio
+    are known to that relative precision (see quickLook).
     """
-    root_file_names = glob.glob('%s/*.root' % directory)
-    root_file_names.sort()
-
-    gROOT.cd() # deal with TH1D/TFile/python scope issues!!
-
-    name = directory.split('/')[0]
-    hist = TH1D('%s' % name, '', 3000, 0, 3000)
-    hist.Sumw2()
-    hist.SetLineWidth(2)
 
-    for root_file_name in root_file_names:
+    if profiler is None:
+        profiler = Profiler(enabled=False)
 
-        root_file = TFile(root_file_name)
-        tree = root_file.Get('fTree')
-
-        hist.GetDirectory().cd()
-        n_entries = tree.Draw(
-            'fTotalEnergy*1e3 >> +%s' % hist.GetName(), 
-            'fTotalEnergy>0', 
-            'goff'
-        )
-
-        tree.GetEntry(0)
-        a_max = tree.fMCRun.GetAmax()
-
-    peak_energy = 2614.5
-    if a_max == 214:
-        #peak_energy = 1764.49
-        peak_energy = 609.320
+    root_file_names = glob.glob('%s/*.root' % directory)
+    root_file_names.sort()
+    if shard is not None:
+        root_file_names = select_shard(root_file_names, *shard)
 
-    peak_counts = hist.GetBinContent(
-        hist.FindBin(peak_energy)
+    fill_function = functools.partial(
+        get_file_spectrum,
+        column_root=column_root,
+        profiler=profiler,
     )
 
+    merged = None
+    a_max = None
+    if store_root is not None:
+        store_dir = os.path.join(
+            store_root,
+            os.path.abspath(directory).lstrip(os.sep),
+        )
+        if shard is not None:
+            store_dir += '.shard%iof%i' % shard
+        store = SpectrumStore(store_dir)
+        merged, info = store.update(root_file_names, fill_function)
+        if merged is not None:
+            a_max = info['a_max']
+
+    elif quick_precision is not None:
+        quick = QuickLook(root_file_names, quick_precision, seed)
+        for root_file_name in quick.file_names:
+            arrays, info = fill_function(root_file_name)
+            with profiler.phase('merge', root_file_name):
+                merged = add_arrays(merged, arrays)
+            a_max = info['a_max']
+
+            results = SpectrumIndex([arrays], spectrum_binning).evaluate(
+                default_windows
+            )
+            peak_counts = results[reference_peak(a_max)][0][0]
+            quick.add('peak counts per file', peak_counts)
+            quick.add('roi/peak', results['roi'][0][0], peak_counts)
+            quick.file_done(root_file_name)
+            if quick.is_precise():
+                break
+        print '--> %s' % directory
+        quick.report()
+
+    else:
+        for root_file_name in root_file_names:
+            arrays, info = fill_function(root_file_name)
+            with profiler.phase('merge', root_file_name):
+                merged = add_arrays(merged, arrays)
+            a_max = info['a_max']
+
+    return (merged, a_max)
+
+
+def make_hist(name, arrays, a_max, verbose=True):
+    """
+    Return the histogram of spectrum arrays, printing its peak and ROI
+    counts if verbose.
+    """
 
-    roi_counts = hist.Integral(
-        hist.FindBin(2039),
-        hist.FindBin(2041)-1,
+    peak_name = reference_peak(a_max)
+    peak_energy = dict(
+        (window_name, low) for window_name, low, high in default_windows
+    )[peak_name]
+    results = SpectrumIndex([arrays], spectrum_binning).evaluate(
+        default_windows
     )
-
-    ratio = roi_counts / peak_counts
-    ratio_err = ratio * math.sqrt( 
-        1.0/peak_counts +
-        1.0/roi_counts
+    peak_counts, peak_err = [values[0] for values in results[peak_name]]
+    roi_counts, roi_err = [values[0] for values in results['roi']]
+    ratio, ratio_err = ratio_with_error(
+        roi_counts,
+        roi_err,
+        peak_counts,
+        peak_err,
     )
 
-    print '%s | %.1f-keV peak: %i +/- %.1f | roi: %i +/- %.1f | ratio: (%.2f +/- %.2f) x 10^-3' % (
+    if verbose: print '%s | %.1f-keV peak: %i +/- %.1f | roi: %i +/- %.1f | ratio: (%.2f +/- %.2f) x 10^-3' % (
         name,
         peak_energy,
         peak_counts,
-        math.sqrt(peak_counts),
+        peak_err,
         roi_counts,
-        math.sqrt(roi_counts),
+        roi_err,
         ratio*1e3,
         ratio_err*1e3,
     )
 
-    hist.Rebin(5)
+    # only the 5-keV hist becomes a TH1D
+    hist = ArrayHist.from_arrays(spectrum_binning, arrays).rebin(5).to_th1d(name)
+    hist.SetLineWidth(2)
     hist.SetXTitle('Energy [keV]')
     hist.SetYTitle('Counts / %.1f keV' % hist.GetBinWidth(1))
     hist.GetYaxis().SetTitleOffset(1.2)
@@ -90,24 +220,101 @@ def get_hist_from_files(
     return hist
 
 
-def main(directories):
-  
-    hists = []
+def get_hist_from_files(
+    directory,
+    column_root=None,
+    store_root=None,
+    profiler=None,
+):
+    """
+    Return a histogram energy spectrum constructed from root files in directory.
+    See get_directory_spectrum() for the options.
+    """
+    arrays, a_max = get_directory_spectrum(
+        directory,
+        column_root,
+        store_root,
+        profiler,
+    )
+    return make_hist(directory.split('/')[0], arrays, a_max)
+
 
+def summarize_directories(
+    directories,
+    column_root=None,
+    store_root=None,
+    profiler=None,
+    shard=None,
+    quick_precision=None,
+    seed=None,
+):
+    """
+    Return a partialResults.Partial with the spectrum of each directory (of
+    its shard of files, if shard is given) and its Amax.  See
+    get_directory_spectrum() for quick_precision.
+    """
+
+    partial = Partial('mage')
     for directory in directories:
-        
-        #basename = os.path.basename(root_file_name)
-        #print '--> processing %s' % basename
 
-        hist = get_hist_from_files(directory)
-        hists.append(hist)
+        arrays, a_max = get_directory_spectrum(
+            directory,
+            column_root,
+            store_root,
+            profiler,
+            shard,
+            quick_precision,
+            seed,
+        )
+        if arrays is not None:
+            partial.add_hist(directory, arrays)
+        if a_max is not None:
+            partial.info['a_max %s' % directory] = a_max
+
+    return partial
 
-        # end loop over hists
 
+def window_rows(partial, windows):
+    """
+    Return spectrumIndex.window_table() rows of the counts in each of
+    windows (plus the default peaks and ROI) for every directory of a
+    Partial from summarize_directories().
+    """
+    window_names = [name for name, low, high in windows]
+    windows = [
+        window for window in default_windows if window[0] not in window_names
+    ] + list(windows)
+    index = SpectrumIndex(
+        [partial.hists[directory] for directory in partial.hist_names],
+        spectrum_binning,
+    )
+    return window_table(
+        partial.hist_names,
+        index,
+        windows,
+        [
+            reference_peak(partial.info.get('a_max %s' % directory))
+            for directory in partial.hist_names
+        ],
+    )
+
+
+def render(hists, profiler=None, views=None):
+    """
+    Draw the directories' spectra together, in full and zoomed in on the ROI.
+    views, a batchMode.Views, decides whether to prompt; by default the views
+    are printed to the current directory.
+    """
+
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+    if views is None:
+        views = Views(output_dir='.')
 
-    canvas = TCanvas('canvas', '')
+    profiler.start_phase('render')
+    canvas = ROOT.TCanvas('canvas', '')
     canvas.SetLogy(1)
-    legend = TLegend(0.1, 0.9, 0.9, 0.99)
+    legend = ROOT.TLegend(0.1, 0.9, 0.9, 0.99)
     legend.SetNColumns(2)
 
     hist_zero = hists[0]
@@ -122,23 +329,222 @@ def main(directories):
     legend.Draw()
     hist_zero.SetMinimum(max/1e4)
     canvas.Update()
-    canvas.Print('mageSpectra.pdf')
-    raw_input('--> enter to continue')
+    views.save(canvas, 'mageSpectra')
+    profiler.stop_phase()
+    views.prompt('--> enter to continue')
 
-    return
+    profiler.start_phase('render')
     hist_zero.SetAxisRange(2030, 2040)
     hist_zero.SetMinimum(0)
     canvas.SetLogy(0)
     canvas.Update()
-    canvas.Print('mageSpectra_zoom.pdf')
-    raw_input('--> enter to continue')
+    views.save(canvas, 'mageSpectra_zoom')
+    profiler.stop_phase()
+    views.prompt('--> enter to continue')
+
+
+def render_directory(job):
+    """
+    Print the full and zoomed spectrum of one directory in batch mode; job is
+    (directory, arrays, a_max, output dir).  Run by render_in_pool().
+    """
+    directory, arrays, a_max, output_dir = job
+    prefix = directory.strip('/').replace('/', '_')
+    hist = make_hist(directory.split('/')[0], arrays, a_max, verbose=False)
+    render([hist], views=Views(output_dir, True, '%s_' % prefix))
+    return directory
+
+
+def render_partial(partial, profiler=None, views=None, jobs=1):
+    """
+    Draw the spectra of a Partial from summarize_directories() or from
+    merged map jobs.  In batch mode, the spectrum of each directory is also
+    printed on its own, on jobs worker processes.
+    """
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+
+    hists = [
+        make_hist(
+            directory.split('/')[0],
+            partial.hists[directory],
+            partial.info.get('a_max %s' % directory),
+        ) for directory in partial.hist_names
+    ]
+    render(hists, profiler, views)
+
+    if views is not None and views.is_batch and len(hists) > 1:
+        profiler.start_phase('render')
+        render_in_pool(render_directory, [
+            (
+                directory,
+                partial.hists[directory],
+                partial.info.get('a_max %s' % directory),
+                views.output_dir,
+            ) for directory in partial.hist_names
+        ], jobs)
+        profiler.stop_phase()
+
+
+def main(
+    directories,
+    column_root=None,
+    store_root=None,
+    profiler=None,
+    views=None,
+):
+
+    hists = []
+
+    for directory in directories:
+        
+        #basename = os.path.basename(root_file_name)
+        #print '--> processing %s' % basename
+
+        hist = get_hist_from_files(directory, column_root, store_root, profiler)
+        hists.append(hist)
+
+        # end loop over hists
+
+    render(hists, profiler, views)
 
 
 if __name__ == '__main__':
 
-    if len(sys.argv) < 2:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directories', nargs='*', metavar='DIRECTORY')
+    parser.add_argument(
+        '--columns',
+        metavar='COLUMN_DIR',
+        default=None,
+        help='fill spectra from columnExport column files in COLUMN_DIR',
+    )
+    parser.add_argument(
+        '--incremental',
+        metavar='STORE_DIR',
+        default=None,
+        help='keep per-file spectra in STORE_DIR and only read new files',
+    )
+    parser.add_argument(
+        '--map',
+        metavar='PARTIAL_FILE',
+        default=None,
+        help='save the spectra of these directories to PARTIAL_FILE instead '
+            'of drawing them',
+    )
+    parser.add_argument(
+        '--shard',
+        type=int,
+        nargs=2,
+        metavar=('INDEX', 'N'),
+        default=None,
+        help='only read every Nth file of each directory, starting at INDEX',
+    )
+    parser.add_argument(
+        '--reduce',
+        action='store_true',
+        help='inputs are partial files from --map; merge and draw them (or, '
+            'with --map, save the merged partial)',
+    )
+    parser.add_argument(
+        '--quick',
+        type=float,
+        metavar='PRECISION',
+        default=None,
+        help='read each directory\'s files in random order and stop once '
+            'its peak counts and ROI/peak ratio are known to this relative '
+            'precision (e.g. 0.05)',
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=None,
+        help='random seed of --quick',
+    )
+    parser.add_argument(
+        '--windows',
+        metavar='WINDOW_FILE',
+        default=None,
+        help='tabulate counts in the windows of WINDOW_FILE, one '
+            '"NAME LOW [HIGH]" per line (a peak if HIGH is missing), for '
+            'each directory',
+    )
+    parser.add_argument(
+        '--scan',
+        type=float,
+        nargs=3,
+        metavar=('LOW', 'HIGH', 'WIDTH'),
+        default=None,
+        help='tabulate counts in adjacent WIDTH-keV windows from LOW to HIGH',
+    )
+    parser.add_argument(
+        '--table',
+        metavar='TABLE_FILE',
+        default=None,
+        help='write the window counts and ratios to the reference peak to '
+            'TABLE_FILE (CSV) instead of drawing the spectra',
+    )
+    parser.add_argument(
+        '--batch',
+        metavar='OUTPUT_DIR',
+        default=None,
+        help='don\'t prompt or open windows; print the spectra, together and '
+            'for each directory, to OUTPUT_DIR',
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=1,
+        help='number of worker processes to print per-directory spectra with '
+            '(with --batch)',
+    )
+    parser.add_argument(
+        '--profile',
+        metavar='TRACE_FILE',
+        default=None,
+        help='write per-file timing to TRACE_FILE (JSON) and print a summary',
+    )
+    options = parser.parse_args()
+
+    if len(options.directories) < 1:
         print 'arguments: [directories of MaGe/GAT ROOT output]'
         sys.exit()
+    if options.quick is not None and options.incremental is not None:
+        parser.error('--quick can\'t be used with --incremental')
+
+    profiler = Profiler(enabled=options.profile is not None)
+    if options.reduce:
+        partial = merge_partials(options.directories)
+    else:
+        partial = summarize_directories(
+            options.directories,
+            column_root=options.columns,
+            store_root=options.incremental,
+            profiler=profiler,
+            shard=tuple(options.shard) if options.shard else None,
+            quick_precision=options.quick,
+            seed=options.seed,
+        )
 
-    main(sys.argv[1:])
+    if options.map is not None:
+        partial.save(options.map)
+        print '--> wrote %s' % options.map
+    elif options.windows or options.scan or options.table:
+        windows = []
+        if options.windows is not None:
+            windows += read_windows(options.windows)
+        if options.scan is not None:
+            windows += scan_windows(*options.scan)
+        rows = window_rows(partial, windows)
+        if options.table is not None:
+            write_table(options.table, rows)
+            print '--> wrote %s' % options.table
+        else:
+            print_table(rows)
+    elif options.batch is not None:
+        views = Views(options.batch, is_batch=True)
+        render_partial(partial, profiler, views, options.jobs)
+    else:
+        render_partial(partial, profiler)
+    profiler.report(options.profile)
 
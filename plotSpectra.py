@@ -5,75 +5,230 @@ plot energy spectrum due to cosmic ray muons from MaGe/GAT root files
 """
 
 import os
+import sys
 import glob
-
-#from ROOT import gROOT
-#gROOT.SetBatch(True)
-from ROOT import TFile
-from ROOT import TH1D
-from ROOT import TCanvas
-from ROOT import TColor
-
-
-def main(file_names):
+import time
+import argparse
+
+from lazyROOT import ROOT
+#ROOT.gROOT.SetBatch(True)
+
+from fileReduction import fill_arrays
+from fileReduction import draw_arrays
+from fileReduction import probe_run_info
+from fileReduction import open_tree
+from columnExport import get_columns
+from fileProfile import Profiler
+from filePrefetch import prefetch_files
+from filePrefetch import default_budget_mb
+from batchMode import Views
+from arrayHist import ArrayHist
+from resultsCatalog import select_files
+from resultsCatalog import parse_selection
+from resultsCatalog import default_catalog_file_name
+
+
+def fill_from_tree(hist, tree):
+    """
+    Fill hist, an ArrayHist, with the weighted energies [keV] of tree;
+    return the number of entries drawn.
+    """
+    n_entries = 0
+    for energy, weight in draw_arrays(
+        tree,
+        ['fEnergy/0.001'],
+        'fMCEventWeight.fWaveformWeight*(fEnergy>0)',
+    ):
+        n_entries += len(energy)
+        hist.fill(energy, weight)
+    return n_entries
+
+
+def fill_from_columns(hist, columns):
+    """
+    Fill hist from columnExport columns like fill_from_tree(); return the
+    number of entries drawn.
+    """
+    waveform_weight = columns.expand('fWaveformWeight', 'fEnergy')
+
+    arrays = fill_arrays(
+        columns['fEnergy']/0.001,
+        hist.binning,
+        waveform_weight*(columns['fEnergy']>0),
+    )
+    hist.add(arrays)
+    return arrays[2]
+
+
+def main(
+    file_names,
+    column_root=None,
+    profiler=None,
+    n_prefetch=0,
+    prefetch_budget_mb=default_budget_mb,
+    views=None,
+):
+
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+    if views is None:
+        views = Views(output_dir='.')
 
 
     max_bin = 20
     n_bins = 200
     
-    hist = TH1D('hist', '', n_bins, 0, max_bin)
+    spectrum = ArrayHist((n_bins, 0, max_bin))
     n_total_events = 0
 
+    if column_root is None:
+        file_names = prefetch_files(file_names, n_prefetch, prefetch_budget_mb)
+
     for file_name in file_names:
         print os.path.basename(file_name)
 
-        root_file = TFile(file_name)
-        tree = root_file.Get('fTree')
-
-        tree.GetEntry(0)
-        n_events = tree.fMCRun.GetNEvents()
-
-
-        hist.GetDirectory().cd()
-        n_entries = tree.Draw(
-            #'fEnergy/0.001 + fRand * sqrt( 0.153845^2 + fEnergy/0.001 * 0.00296 * 0.12285 )>>+ %s' % hist.GetName(),
-            'fEnergy/0.001 >>+ %s' % hist.GetName(),
-            'fMCEventWeight.fWaveformWeight*(fEnergy>0)',
-            'goff'
-        )
+        if column_root is not None:
+            with profiler.phase('open', file_name):
+                columns = get_columns(file_name, column_root)
+            n_events = columns.run['run_info']['n_events']
+            with profiler.phase('fill', file_name):
+                n_entries = fill_from_columns(spectrum, columns)
+            profiler.add_file(file_name, n_entries=n_entries, n_events=n_events)
+            print n_events, n_entries
+            n_total_events += n_events
+            continue
+
+        open_time = time.time()
+        with open_tree(file_name) as (root_file, tree):
+            profiler.add_phase('open', time.time() - open_time, file_name)
+
+            with profiler.phase('probe', file_name):
+                n_events = probe_run_info(tree)['n_events']
+
+            with profiler.phase('fill', file_name):
+                n_entries = fill_from_tree(spectrum, tree)
+            profiler.add_file(
+                file_name,
+                bytes_read=root_file.GetBytesRead(),
+                n_entries=n_entries,
+                n_events=n_events,
+            )
 
         print n_events, n_entries
         n_total_events += n_events
 
     print '%s total events' % n_total_events
-    print hist.GetEntries()
+    print spectrum.entries
 
-    canvas = TCanvas('canvas', '')
+    profiler.start_phase('render')
+    canvas = ROOT.TCanvas('canvas', '')
     #canvas.SetLogy(1)
+    hist = spectrum.scale(1.0/n_total_events).to_th1d('hist')
     hist.SetXTitle('Energy [keV]')
-    hist.SetYTitle('Counts / %.1f keV' % hist.GetBinWidth(1) )
-    hist.SetLineColor(TColor.kBlue+1)
+    hist.SetLineColor(ROOT.TColor.kBlue+1)
     hist.SetLineWidth(2)
-
-    hist.Scale(1.0/n_total_events)
     hist.SetYTitle('Counts / %.1f keV / Decay' % hist.GetBinWidth(1) )
 
 
     hist.Draw()
     canvas.Update()
 
-    canvas.Print('gatSpectrum.pdf')
+    views.save(canvas, 'gatSpectrum')
 
-    test = raw_input('--> any key >> ')
+    profiler.stop_phase()
+    test = views.prompt('--> any key >> ')
 
 
 if __name__ == '__main__':
 
-    # default is for MALBEK on cenpa-rocks:
-    gat_dir = os.getenv('GATRESULTS')
-    #file_names = glob.glob('%s/BEGeKURFInShield/bulk/ActiveCrystal0CrystalColumn0/A57_Z27/*.root' % gat_dir)
-    file_names = glob.glob('%s/BEGeKURFInShield/bulk/ActiveCrystal0CrystalColumn0/A68_Z32/*.root' % gat_dir)
-
-    main(file_names=file_names)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file_names', nargs='*', metavar='ROOT_FILE')
+    parser.add_argument(
+        '--columns',
+        metavar='COLUMN_DIR',
+        default=None,
+        help='fill the spectrum from columnExport column files in COLUMN_DIR',
+    )
+    parser.add_argument(
+        '--prefetch',
+        type=int,
+        default=0,
+        metavar='N',
+        help='read the next N files ahead into the page cache',
+    )
+    parser.add_argument(
+        '--prefetch-budget',
+        type=int,
+        default=default_budget_mb,
+        metavar='MB',
+        help='most data to read ahead at once (default %i MB)' % (
+            default_budget_mb
+        ),
+    )
+    parser.add_argument(
+        '--select',
+        action='append',
+        metavar='KEY=VALUE',
+        default=None,
+        help='read the files of the resultsCatalog catalog with column KEY '
+            'equal to VALUE (repeat to combine), e.g. isotope=A68_Z32',
+    )
+    parser.add_argument(
+        '--where',
+        metavar='SQL',
+        default=None,
+        help='with --select, an extra SQL condition on the catalog',
+    )
+    parser.add_argument(
+        '--catalog',
+        metavar='FILE',
+        default=default_catalog_file_name,
+        help='resultsCatalog catalog file (default %s)' % (
+            default_catalog_file_name
+        ),
+    )
+    parser.add_argument(
+        '--batch',
+        metavar='OUTPUT_DIR',
+        default=None,
+        help='don\'t prompt or open windows; print the spectrum to OUTPUT_DIR',
+    )
+    parser.add_argument(
+        '--profile',
+        metavar='TRACE_FILE',
+        default=None,
+        help='write per-file timing to TRACE_FILE (JSON) and print a summary',
+    )
+    options = parser.parse_args()
+
+    file_names = options.file_names
+    if options.select is not None or options.where is not None:
+        file_names += select_files(
+            options.catalog,
+            parse_selection(options.select),
+            options.where,
+        )
+        print '--> %i files selected from %s' % (
+            len(file_names),
+            options.catalog,
+        )
+        if len(file_names) < 1:
+            sys.exit()
+    if len(file_names) < 1:
+        # default is for MALBEK on cenpa-rocks:
+        gat_dir = os.getenv('GATRESULTS')
+        #file_names = glob.glob('%s/BEGeKURFInShield/bulk/ActiveCrystal0CrystalColumn0/A57_Z27/*.root' % gat_dir)
+        file_names = glob.glob('%s/BEGeKURFInShield/bulk/ActiveCrystal0CrystalColumn0/A68_Z32/*.root' % gat_dir)
+
+    profiler = Profiler(enabled=options.profile is not None)
+    main(
+        file_names=file_names,
+        column_root=options.columns,
+        profiler=profiler,
+        n_prefetch=options.prefetch,
+        prefetch_budget_mb=options.prefetch_budget,
+        views=Views(options.batch, True) if options.batch else None,
+    )
+    profiler.report(options.profile)
 
 
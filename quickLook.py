@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+"""
+Quick looks: read files in random order until the estimates are good enough.
+
+Files are the sampling units.  For each quantity, a RatioEstimate keeps the
+running ratio sum(a)/sum(b) over the files read so far -- e.g. weighted
+entries over events for an efficiency, ROI over peak counts for a ratio, or
+a per-file value over 1 for a mean -- with the standard ratio-estimator
+error for a random sample of files, corrected for the fraction of files
+already read.  A QuickLook stops the file loop once every relative error is
+below the requested precision, and reports how much of the data was read
+-- including files a worker pool reduced ahead of the loop but that weren't
+used.
+The error is that of extrapolating to all the files; the statistical error
+of the full data set is not included.
+"""
+
+import os
+import math
+import random
+
+
+default_min_files = 10 # fewer give unreliable sample variances
+
+
+def shuffled(file_names, seed=None):
+    """
+    Return file_names in random order (reproducible with seed).
+    """
+    file_names = list(file_names)
+    random.Random(seed).shuffle(file_names)
+    return file_names
+
+
+class RatioEstimate(object):
+    """
+    Running sum(a)/sum(b) over a random sample of n_total units.
+    """
+
+    def __init__(self, n_total):
+
+        self.n_total = n_total
+        self.n = 0
+        self.sum_a = 0.0
+        self.sum_b = 0.0
+        self.sum_aa = 0.0
+        self.sum_bb = 0.0
+        self.sum_ab = 0.0
+
+    def add(self, a, b=1.0):
+
+        self.n += 1
+        self.sum_a += a
+        self.sum_b += b
+        self.sum_aa += a*a
+        self.sum_bb += b*b
+        self.sum_ab += a*b
+
+    def value(self):
+
+        if self.sum_b == 0:
+            return float('nan')
+        return self.sum_a/self.sum_b
+
+    def error(self):
+        """
+        Return the error of value() as an estimate over all n_total units.
+        """
+        if self.n < 2 or self.sum_b == 0:
+            return float('inf')
+        ratio = self.value()
+        residual_var = (
+            self.sum_aa - 2*ratio*self.sum_ab + ratio*ratio*self.sum_bb
+        )/(self.n - 1)
+        mean_b = self.sum_b/self.n
+        fpc = max(0.0, 1.0 - float(self.n)/self.n_total)
+        return math.sqrt(max(residual_var, 0.0)*fpc/self.n)/abs(mean_b)
+
+    def relative_error(self):
+
+        value = self.value()
+        if value == 0 or value != value:
+            return float('inf')
+        return self.error()/abs(value)
+
+
+class QuickLook(object):
+    """
+    Named RatioEstimates over file_names, read in random order, and the
+    stopping rule: every relative error below precision, after at least
+    min_files files.
+    """
+
+    def __init__(
+        self,
+        file_names,
+        precision,
+        seed=None,
+        min_files=default_min_files,
+    ):
+
+        self.file_names = shuffled(file_names, seed)
+        self.precision = precision
+        self.min_files = min_files
+        self.estimates = {}
+        self.names = [] # in the order they were first added
+        self.n_read = 0 # files whose values were added
+        self.read_file_names = set() # files reduced, used or not
+
+    def add(self, name, a, b=1.0):
+        """
+        Add one file's a and b to estimate name.
+        """
+        if name not in self.estimates:
+            self.estimates[name] = RatioEstimate(len(self.file_names))
+            self.names.append(name)
+        self.estimates[name].add(a, b)
+
+    def file_read(self, file_name):
+        """
+        Count file_name's bytes as read, e.g. when it is handed to a worker.
+        """
+        self.read_file_names.add(file_name)
+
+    def file_done(self, file_name):
+        """
+        Count file_name as read; call after add()ing its values.
+        """
+        self.n_read += 1
+        self.file_read(file_name)
+
+    def is_precise(self):
+
+        if self.n_read < min(self.min_files, len(self.file_names)):
+            return False
+        return all(
+            self.estimates[name].relative_error() <= self.precision
+            for name in self.names
+        )
+
+    def report(self):
+
+        total_bytes = 0
+        bytes_read = 0
+        for file_name in self.file_names:
+            try:
+                size = os.path.getsize(file_name)
+            except OSError:
+                continue
+            total_bytes += size
+            if file_name in self.read_file_names:
+                bytes_read += size
+        print '--> quick look: used %i and read %i of %i files' % (
+            self.n_read,
+            len(self.read_file_names),
+            len(self.file_names),
+        )
+        print '\t %.1f%% of bytes read' % (
+            100.0*bytes_read/total_bytes if total_bytes else 0.0
+        )
+        for name in self.names:
+            estimate = self.estimates[name]
+            print '\t %s: %.3e +/- %.1e (%.1f%%)' % (
+                name,
+                estimate.value(),
+                estimate.error(),
+                100.0*estimate.relative_error(),
+            )
@@ -9,82 +9,151 @@ Move spectra with old weighting values.
 import os
 import sys
 import math
-import commands
-
-from ROOT import gROOT
-from ROOT import TCanvas
-from ROOT import TFile
-
-
-def main(root_file_names):
-
-    weight_threshold = 1e-1 # for Al stand plate
-    #weight_threshold = 1e-2 # for Al stand plate
-    #weight_threshold = 1e-3 # for Al stand plate
-
-    #weight_threshold = 1e-6 # for rock
-    #weight_threshold = 1e-3 # for zeolite
-
-    print '--> weight_threshold:  %.2e' % weight_threshold 
-
-    #use_user_input = raw_input('--> would you like to change the default weight?  (y/n) ')
-    use_user_input = 'n'
-    if use_user_input != 'n':
-        weight_threshold = raw_input('--> please enter weight_threshold: ')
-        weight_threshold = float(weight_threshold)
-        print '--> weight_threshold:  %.2e' % weight_threshold 
-
-    weight_to_n_events_dict = {}
-    files_to_delete = []
-    n_counts_to_delete = 0
-    n_counts = 0
-
-    for root_file_name in root_file_names:
-        
+import argparse
+
+import numpy
+
+from fileReduction import reduce_file
+from fileCache import FileCache
+from fileCache import cached_reduce_file
+from fileCache import default_cache_file_name
+from fileProfile import Profiler
+from filePrefetch import prefetch_files
+from filePrefetch import default_budget_mb
+from fileRelocation import relocate_files
+from fileRelocation import print_failures
+from fileRelocation import default_n_threads
+from thresholdSweep import WeightSweep
+from thresholdSweep import print_sweep
+from thresholdSweep import write_sweep
+from scanCheckpoint import Checkpointer
+from scanCheckpoint import save_json
+from scanCheckpoint import load_json
+from scanCheckpoint import default_interval
+from followFiles import FileWatcher
+from followFiles import follow
+from followFiles import default_poll_interval
+from followFiles import default_settle_time
+from followFiles import default_refresh_interval
+
+
+default_weight_threshold = 1e-1 # for Al stand plate
+#default_weight_threshold = 1e-2 # for Al stand plate
+#default_weight_threshold = 1e-3 # for Al stand plate
+
+#default_weight_threshold = 1e-6 # for rock
+#default_weight_threshold = 1e-3 # for zeolite
+
+
+def new_state(weight_threshold):
+    """
+    Return the state of an empty scan: files to move and counts at
+    weight_threshold, per-file weights and counts for threshold sweeps and
+    the files processed.  It is JSON-serializable, for checkpoints.
+    """
+    return {
+        'weight_threshold': weight_threshold,
+        'files_to_delete': [],
+        'n_counts_to_delete': 0,
+        'n_counts': 0,
+        'file_weights': [],
+        'file_n_entries': [],
+        'file_n_events': [],
+        'processed_files': [],
+    }
+
+
+def load_state(checkpoint_file_name, weight_threshold):
+    """
+    Return the state saved in checkpoint_file_name, which must have been
+    made with weight_threshold.
+    """
+    state = load_json(checkpoint_file_name)
+    if state['weight_threshold'] != weight_threshold:
+        raise ValueError('%s was made with weight_threshold %.2e' % (
+            checkpoint_file_name,
+            state['weight_threshold'],
+        ))
+    for name in ['files_to_delete', 'processed_files']:
+        state[name] = [str(file_name) for file_name in state[name]]
+    return state
+
+
+def scan_files(
+    root_file_names,
+    state,
+    cache=None,
+    profiler=None,
+    n_prefetch=0,
+    prefetch_budget_mb=default_budget_mb,
+    checkpointer=None,
+):
+    """
+    Add the IS weights and counts of root_file_names to state, from
+    new_state().  checkpointer, a scanCheckpoint.Checkpointer, is updated
+    between files.
+    """
+
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+
+    weight_threshold = state['weight_threshold']
+
+    for root_file_name in prefetch_files(
+        root_file_names,
+        n_prefetch,
+        prefetch_budget_mb,
+    ):
+
+        if checkpointer is not None:
+            checkpointer.update()
         basename = os.path.basename(root_file_name)
 
         print '--> processing %s' % basename
+        state['processed_files'].append(root_file_name)
+
+        if cache is None:
+            result = reduce_file(root_file_name, fill_spectra=False)
+        else:
+            result = cached_reduce_file(root_file_name, cache, fill_spectra=False)
+            cache.commit()
+        profiler.add_result(root_file_name, result)
+        if result is None:
+            print '\t 0 entries'
+            continue
 
-        root_file = TFile(root_file_name)
-        tree = root_file.Get('fTree')
-        #n_entries = tree.GetEntries()
-        n_entries = tree.Draw('fTotalEnergy', 'fTotalEnergy>0', 'goff')
-        n_counts += n_entries
+        n_entries = result['n_entries']
+        state['n_counts'] += n_entries
 
         # skip files with 0 events:
         if n_entries < 0: 
             print '\t 0 entries'
             continue
 
-        # get some info from the first tree entry
-        tree.GetEntry(0)
-
-        if tree.eventHeader.GetIsHeartbeatEvent():
+        # info is from the first tree entry that isn't a heartbeat
+        if result['is_heartbeat']:
             if n_entries <=2:
                 print '\t %i entries with heartbeats' % n_entries
                 continue
 
-            else:
-                tree.GetEntry(1)
-
-
-        mc_run = tree.fMCRun
-        n_events = mc_run.GetNEvents()
+        n_events = result['n_events']
 
-        used_IS = mc_run.GetUseImportanceSampling()
+        used_IS = result['is_used']
 
-        eventSteps = tree.eventSteps
-        n_steps = eventSteps.GetNSteps()
-
-        # assume all tracks have the same weight
+        # mean of the events' own weights, so weight*n_entries/n_events is
+        # the file's efficiency
         weight = 1.0
         if used_IS:
-            weight = eventSteps.GetStep(n_steps-1).GetTrackWeight()
+            weight = result['event_weight']
+
+        state['file_weights'].append(weight)
+        state['file_n_entries'].append(n_entries)
+        state['file_n_events'].append(n_events)
 
         #if weight > weight_threshold:
         if weight < weight_threshold:
-            files_to_delete.append(root_file_name)
-            n_counts_to_delete += n_entries
+            state['files_to_delete'].append(root_file_name)
+            state['n_counts_to_delete'] += n_entries
 
         print '\t %i events | %i entries | weight: %.1e | eff: %.1e +/- %.1e' % (
             n_events,
@@ -94,6 +163,157 @@ def main(root_file_names):
             weight*math.sqrt(n_entries)/n_events,
         )
 
+
+def print_candidates(state, sweep_thresholds=None):
+    """
+    Print how many files are below the threshold so far (or, with
+    sweep_thresholds, the sweep).
+    """
+    if sweep_thresholds is not None:
+        print_sweep(WeightSweep(
+            state['file_weights'],
+            state['file_n_entries'],
+            state['file_n_events'],
+        ).evaluate(sweep_thresholds))
+        return
+    print '--> %i of %i files below %.1e (%.1e of %.1e counts)' % (
+        len(state['files_to_delete']),
+        len(state['processed_files']),
+        state['weight_threshold'],
+        state['n_counts_to_delete'],
+        state['n_counts'],
+    )
+
+
+def main(
+    root_file_names,
+    cache_file_name=None,
+    n_threads=default_n_threads,
+    weight_threshold=default_weight_threshold,
+    sweep_thresholds=None,
+    sweep_file_name=None,
+    profiler=None,
+    n_prefetch=0,
+    prefetch_budget_mb=default_budget_mb,
+    checkpoint_file_name=None,
+    resume=False,
+    checkpoint_interval=default_interval,
+    follow_files=False,
+    poll_interval=default_poll_interval,
+    settle_time=default_settle_time,
+    refresh_interval=default_refresh_interval,
+    idle_time=None,
+):
+    """
+    Find files with IS weights below weight_threshold and offer to move them
+    to bad_IS/.  If sweep_thresholds are given, print (and write to
+    sweep_file_name) what each of them would remove instead.  profiler, a
+    fileProfile.Profiler, records per-file timing; n_prefetch files are read
+    ahead (see filePrefetch).  If checkpoint_file_name is given, the scan is
+    saved there every checkpoint_interval seconds and before the prompt
+    (see scanCheckpoint); with resume, its files are skipped.
+
+    If follow_files is set, root_file_names are directories or glob
+    patterns whose files are scanned as jobs finish them (see followFiles);
+    the files below threshold (or the sweep) are printed every
+    refresh_interval seconds.
+    """
+
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+
+    print '--> weight_threshold:  %.2e' % weight_threshold 
+
+    #use_user_input = raw_input('--> would you like to change the default weight?  (y/n) ')
+    use_user_input = 'n'
+    if use_user_input != 'n':
+        weight_threshold = raw_input('--> please enter weight_threshold: ')
+        weight_threshold = float(weight_threshold)
+        print '--> weight_threshold:  %.2e' % weight_threshold 
+
+    state = new_state(weight_threshold)
+    if resume and os.path.exists(checkpoint_file_name):
+        state = load_state(checkpoint_file_name, weight_threshold)
+        done = set(state['processed_files'])
+        if not follow_files:
+            root_file_names = [
+                root_file_name for root_file_name in root_file_names
+                if root_file_name not in done
+            ]
+        print '--> resuming from %s: %i files done' % (
+            checkpoint_file_name,
+            len(done),
+        )
+
+    checkpointer = Checkpointer(
+        checkpoint_file_name,
+        lambda file_name: save_json(file_name, state),
+        checkpoint_interval,
+    )
+
+    cache = None
+    if cache_file_name is not None:
+        cache = FileCache(cache_file_name)
+
+    if not follow_files:
+        scan_files(
+            root_file_names,
+            state,
+            cache,
+            profiler,
+            n_prefetch,
+            prefetch_budget_mb,
+            checkpointer,
+        )
+    else:
+        watcher = FileWatcher(
+            root_file_names,
+            settle_time,
+            state['processed_files'],
+        )
+
+        def process(new_file_names):
+            scan_files(
+                new_file_names,
+                state,
+                cache,
+                profiler,
+                n_prefetch,
+                prefetch_budget_mb,
+                checkpointer,
+            )
+            checkpointer.update(force=True)
+
+        follow(
+            watcher,
+            process,
+            lambda: print_candidates(state, sweep_thresholds),
+            poll_interval,
+            refresh_interval,
+            idle_time,
+        )
+
+    checkpointer.update(force=True)
+    if cache is not None:
+        cache.close()
+
+    files_to_delete = state['files_to_delete']
+    n_counts_to_delete = state['n_counts_to_delete']
+    n_counts = state['n_counts']
+
+    if sweep_thresholds is not None:
+        sweep = WeightSweep(
+            state['file_weights'],
+            state['file_n_entries'],
+            state['file_n_events'],
+        ).evaluate(sweep_thresholds)
+        print '--> removing files with weight < threshold:'
+        print_sweep(sweep)
+        if sweep_file_name is not None:
+            write_sweep(sweep_file_name, sweep)
+            print '--> wrote %s' % sweep_file_name
+        return
+
     n_files_to_delete = len(files_to_delete)
     print '--> files to delete:'
     if n_files_to_delete == 0.0:
@@ -121,31 +341,184 @@ def main(root_file_names):
         return
 
     #print '--> moving files to $MAGERESULTS/problemFiles/'
-    cmd = 'mkdir bad_IS'
-    output = commands.getstatusoutput(cmd)
-    #print output
-
     print '--> moving %i files...' % n_files_to_delete
-    for file_name in files_to_delete:
-
-        #cmd = 'mv %s $MAGERESULTS/problemFiles/' % file_name 
-        cmd = 'mv %s bad_IS/' % file_name 
-        #print cmd
-        output = commands.getstatusoutput(cmd)
-        #print output
-
-    print '\t done'
+    with profiler.phase('relocate'):
+        failures = relocate_files(
+            files_to_delete,
+            'bad_IS',
+            n_threads=n_threads,
+        )
+    print_failures(failures)
+    print '--> journal: bad_IS.journal (undo with fileRelocation.py --undo)'
 
 
 
 
 if __name__ == '__main__':
 
-    if len(sys.argv) < 2:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('root_file_names', nargs='*', metavar='ROOT_FILE')
+    parser.add_argument(
+        '--cache',
+        nargs='?',
+        const=default_cache_file_name,
+        default=None,
+        metavar='FILE',
+        help='reuse per-file results cached in FILE (default %s)' % (
+            default_cache_file_name
+        ),
+    )
+    parser.add_argument(
+        '-t', '--threads',
+        type=int,
+        default=default_n_threads,
+        help='number of file moves to run at once',
+    )
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=default_weight_threshold,
+        help='move files with IS weights below this (default %.1e)' % (
+            default_weight_threshold
+        ),
+    )
+    parser.add_argument(
+        '--sweep',
+        type=float,
+        nargs='+',
+        metavar='THRESHOLD',
+        help='only print what each of these thresholds would remove',
+    )
+    parser.add_argument(
+        '--sweep-log',
+        type=float,
+        nargs=3,
+        metavar=('LOW', 'HIGH', 'N'),
+        help='sweep N log-spaced thresholds from LOW to HIGH',
+    )
+    parser.add_argument(
+        '--sweep-output',
+        metavar='CSV_FILE',
+        help='also write the sweep to CSV_FILE',
+    )
+    parser.add_argument(
+        '--checkpoint',
+        metavar='FILE',
+        default=None,
+        help='save the state of the scan to FILE every so often, to '
+            '--resume it after a crash',
+    )
+    parser.add_argument(
+        '--checkpoint-interval',
+        type=float,
+        default=default_interval,
+        metavar='SECONDS',
+        help='time between checkpoints (default %g s)' % default_interval,
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='continue from the --checkpoint FILE, skipping its files',
+    )
+    parser.add_argument(
+        '--follow',
+        action='store_true',
+        help='inputs are directories or quoted glob patterns; keep scanning '
+            'their new files as jobs finish them, until --idle or Ctrl-C',
+    )
+    parser.add_argument(
+        '--poll',
+        type=float,
+        default=default_poll_interval,
+        metavar='SECONDS',
+        help='time between looks for new files (default %g s)' % (
+            default_poll_interval
+        ),
+    )
+    parser.add_argument(
+        '--settle',
+        type=float,
+        default=default_settle_time,
+        metavar='SECONDS',
+        help='files modified more recently are still being written '
+            '(default %g s)' % default_settle_time,
+    )
+    parser.add_argument(
+        '--refresh',
+        type=float,
+        default=default_refresh_interval,
+        metavar='SECONDS',
+        help='time between updates of the candidates while following '
+            '(default %g s)' % default_refresh_interval,
+    )
+    parser.add_argument(
+        '--idle',
+        type=float,
+        default=None,
+        metavar='SECONDS',
+        help='stop following after this long without new files',
+    )
+    parser.add_argument(
+        '--prefetch',
+        type=int,
+        default=0,
+        metavar='N',
+        help='read the next N files ahead into the page cache',
+    )
+    parser.add_argument(
+        '--prefetch-budget',
+        type=int,
+        default=default_budget_mb,
+        metavar='MB',
+        help='most data to read ahead at once (default %i MB)' % (
+            default_budget_mb
+        ),
+    )
+    parser.add_argument(
+        '--profile',
+        metavar='TRACE_FILE',
+        default=None,
+        help='write per-file timing to TRACE_FILE (JSON) and print a summary',
+    )
+    options = parser.parse_args()
+
+    if len(options.root_file_names) < 1:
         print 'arguments: [MaGe ROOT output]'
         sys.exit()
 
-    main(sys.argv[1:])
+    sweep_thresholds = options.sweep
+    if options.sweep_log is not None:
+        low, high, n_thresholds = options.sweep_log
+        sweep_thresholds = numpy.logspace(
+            math.log10(low),
+            math.log10(high),
+            int(n_thresholds),
+        )
+
+    if options.resume and options.checkpoint is None:
+        parser.error('--resume needs --checkpoint')
+
+    profiler = Profiler(enabled=options.profile is not None)
+    main(
+        options.root_file_names,
+        cache_file_name=options.cache,
+        n_threads=options.threads,
+        weight_threshold=options.threshold,
+        sweep_thresholds=sweep_thresholds,
+        sweep_file_name=options.sweep_output,
+        profiler=profiler,
+        n_prefetch=options.prefetch,
+        prefetch_budget_mb=options.prefetch_budget,
+        checkpoint_file_name=options.checkpoint,
+        resume=options.resume,
+        checkpoint_interval=options.checkpoint_interval,
+        follow_files=options.follow,
+        poll_interval=options.poll,
+        settle_time=options.settle,
+        refresh_interval=options.refresh,
+        idle_time=options.idle,
+    )
+    profiler.report(options.profile)
 
 
 
@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+
+"""
+SQLite catalog of the ROOT files in MaGe/GAT results trees.
+
+Results trees are laid out as
+    $GATRESULTS/<geometry>/<source type>/<source volume>/A<A>_Z<Z>/*.root
+e.g. BEGeKURFInShield/bulk/ActiveCrystal0CrystalColumn0/A68_Z32.  index()
+crawls a tree once and records, for each file, the fields of its path and
+what probe_run_info() reads from its fMCRun: run ID, IS settings, Amax and
+N events, plus the number of tree entries.  The isotope from the path is
+cross-checked against Amax.
+
+Refreshing is incremental: only new or changed files are opened, and
+directories whose mtime hasn't changed aren't listed again (use rescan to
+also stat every file, e.g. after files were rewritten in place).  Scripts
+then select their inputs with select_files() instead of globbing:
+
+    select_files(catalog_file_name, {'isotope': 'A68_Z32',
+        'source_type': 'bulk', 'is_used': 0})
+
+usage: resultsCatalog.py [--catalog FILE] [RESULTS_DIR ...]
+       resultsCatalog.py [--catalog FILE] --select KEY=VALUE [...]
+"""
+
+import os
+import re
+import sys
+import json
+import sqlite3
+import argparse
+
+from fileReduction import open_tree
+from fileReduction import probe_run_info
+
+
+default_catalog_file_name = os.path.expanduser('~/.mjResultsCatalog.sqlite')
+results_variables = ['GATRESULTS', 'MAGERESULTS']
+
+isotope_pattern = re.compile(r'^A(\d+)_Z(\d+)$')
+
+# catalog columns, in table order
+file_columns = [
+    ('path', 'TEXT PRIMARY KEY'),
+    ('results_dir', 'TEXT'),
+    ('directory', 'TEXT'),
+    ('size', 'INTEGER'),
+    ('mtime', 'REAL'),
+    ('geometry', 'TEXT'),
+    ('source_type', 'TEXT'),
+    ('source_volume', 'TEXT'),
+    ('isotope', 'TEXT'),
+    ('a', 'INTEGER'),
+    ('z', 'INTEGER'),
+    ('a_max', 'INTEGER'),
+    ('isotope_mismatch', 'INTEGER'),
+    ('run_id', 'INTEGER'),
+    ('is_used', 'INTEGER'),
+    ('biased_particle_id', 'INTEGER'),
+    ('use_time_window', 'INTEGER'),
+    ('use_process_window', 'INTEGER'),
+    ('n_events', 'INTEGER'),
+    ('n_entries', 'INTEGER'),
+    ('is_readable', 'INTEGER'),
+]
+column_names = [name for name, column_type in file_columns]
+
+
+def parse_path(relative_path):
+    """
+    Return a dict of the geometry, source type, source volume and isotope
+    fields of a file path relative to its results dir.  Fields that the
+    path doesn't have are None.
+    """
+    parts = os.path.dirname(relative_path).split(os.sep)
+    fields = dict.fromkeys(
+        ['geometry', 'source_type', 'source_volume', 'isotope', 'a', 'z']
+    )
+
+    i_isotope = None
+    for i_part, part in enumerate(parts):
+        match = isotope_pattern.match(part)
+        if match:
+            i_isotope = i_part
+            fields['isotope'] = part
+            fields['a'] = int(match.group(1))
+            fields['z'] = int(match.group(2))
+
+    volume_parts = parts if i_isotope is None else parts[:i_isotope]
+    volume_parts = [part for part in volume_parts if part]
+    if len(volume_parts) > 0:
+        fields['geometry'] = volume_parts[0]
+    if len(volume_parts) > 1:
+        fields['source_type'] = volume_parts[1]
+    if len(volume_parts) > 2:
+        fields['source_volume'] = '/'.join(volume_parts[2:])
+    return fields
+
+
+def read_file_info(root_file_name):
+    """
+    Return a dict of the run info and number of entries of one file.
+    Unreadable files get is_readable 0; empty ones have no run info.
+    """
+    info = {'n_entries': None, 'is_readable': 0}
+    with open_tree(root_file_name) as (root_file, tree):
+        if root_file.IsZombie() or not tree:
+            return info
+        info['is_readable'] = 1
+        info['n_entries'] = tree.GetEntries()
+        if info['n_entries'] > 0:
+            run_info = probe_run_info(tree)
+            for name in column_names:
+                if name in run_info:
+                    info[name] = run_info[name]
+    return info
+
+
+class ResultsCatalog(object):
+    """
+    Per-file catalog rows, stored in SQLite.
+    """
+
+    def __init__(self, catalog_file_name=default_catalog_file_name):
+
+        self.catalog_file_name = catalog_file_name
+        self.connection = sqlite3.connect(catalog_file_name)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS files (%s)' % ', '.join(
+                '%s %s' % column for column in file_columns
+            )
+        )
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS files_isotope ON files (isotope)'
+        )
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS files_directory ON files (directory)'
+        )
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS directories ('
+            ' path TEXT PRIMARY KEY,'
+            ' mtime REAL,'
+            ' subdirectories TEXT'
+            ')'
+        )
+        self.connection.commit()
+
+    def _directory_row(self, directory):
+
+        return self.connection.execute(
+            'SELECT mtime, subdirectories FROM directories WHERE path = ?',
+            (directory,)
+        ).fetchone()
+
+    def _file_stats(self, directory):
+
+        return dict(
+            (path, (size, mtime)) for path, size, mtime in
+            self.connection.execute(
+                'SELECT path, size, mtime FROM files WHERE directory = ?',
+                (directory,)
+            )
+        )
+
+    def _store_file(self, results_dir, directory, path, size, mtime):
+
+        row = {
+            'path': path,
+            'results_dir': results_dir,
+            'directory': directory,
+            'size': size,
+            'mtime': mtime,
+        }
+        row.update(parse_path(os.path.relpath(path, results_dir)))
+        row.update(read_file_info(path))
+        a_max = row.get('a_max')
+        row['isotope_mismatch'] = int(
+            a_max is not None and row['a'] is not None and row['a'] > 0 and
+            a_max != row['a']
+        )
+        if row['isotope_mismatch']:
+            print 'WARNING: %s: Amax %i != A from path %i' % (
+                path,
+                a_max,
+                row['a'],
+            )
+        self.connection.execute(
+            'INSERT OR REPLACE INTO files VALUES (%s)' % ', '.join(
+                '?' for name in column_names
+            ),
+            [row.get(name) for name in column_names]
+        )
+
+    def _forget_directory(self, directory):
+        """
+        Remove directory and everything below it; return the number of files
+        removed.
+        """
+        pattern = directory.replace('\\', '\\\\').replace('%', '\\%')
+        pattern = pattern.replace('_', '\\_') + os.sep + '%'
+        n_files = 0
+        for table, column in [('files', 'directory'), ('directories', 'path')]:
+            cursor = self.connection.execute(
+                'DELETE FROM %s WHERE %s = ? OR %s LIKE ? ESCAPE \'\\\'' % (
+                    table,
+                    column,
+                    column,
+                ),
+                (directory, pattern)
+            )
+            if table == 'files':
+                n_files = cursor.rowcount
+        return n_files
+
+    def index(self, results_dir, rescan=False):
+        """
+        Bring the catalog of results_dir up to date; return the numbers of
+        files (added or updated, removed).
+        """
+        results_dir = os.path.abspath(results_dir)
+        n_updated = 0
+        n_removed = 0
+
+        directories = [results_dir]
+        while directories:
+            directory = directories.pop()
+            try:
+                mtime = os.stat(directory).st_mtime
+            except OSError:
+                n_removed += self._forget_directory(directory)
+                continue
+
+            row = self._directory_row(directory)
+            if row is not None and row[0] == mtime and not rescan:
+                # nothing was added or removed here
+                directories.extend(json.loads(row[1]))
+                continue
+
+            known_files = self._file_stats(directory)
+            subdirectories = []
+            for name in sorted(os.listdir(directory)):
+                path = os.path.join(directory, name)
+                if os.path.isdir(path):
+                    subdirectories.append(path)
+                    continue
+                if not name.endswith('.root'):
+                    continue
+                stat = os.stat(path)
+                if known_files.pop(path, None) == (stat.st_size, stat.st_mtime):
+                    continue
+                print '--> indexing %s' % os.path.relpath(path, results_dir)
+                self._store_file(
+                    results_dir,
+                    directory,
+                    path,
+                    stat.st_size,
+                    stat.st_mtime,
+                )
+                n_updated += 1
+
+            for path in known_files:
+                self.connection.execute(
+                    'DELETE FROM files WHERE path = ?', (path,)
+                )
+                n_removed += 1
+            if row is not None:
+                for subdirectory in json.loads(row[1]):
+                    if subdirectory not in subdirectories:
+                        n_removed += self._forget_directory(subdirectory)
+
+            self.connection.execute(
+                'INSERT OR REPLACE INTO directories VALUES (?, ?, ?)',
+                (directory, mtime, json.dumps(subdirectories))
+            )
+            self.connection.commit()
+            directories.extend(subdirectories)
+
+        return (n_updated, n_removed)
+
+    def select(self, selection=None, where=None):
+        """
+        Return the sorted paths of files matching selection, a dict of column
+        name -> value, and where, an SQL condition.
+        """
+        conditions = []
+        values = []
+        for name, value in sorted((selection or {}).items()):
+            if name not in column_names:
+                raise ValueError('unknown catalog column %r' % name)
+            if value is None:
+                conditions.append('%s IS NULL' % name)
+            else:
+                conditions.append('%s = ?' % name)
+                values.append(value)
+        if where:
+            conditions.append('(%s)' % where)
+
+        query = 'SELECT path FROM files'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY path'
+        return [
+            str(path) for (path,) in self.connection.execute(query, values)
+        ]
+
+    def close(self):
+
+        self.connection.commit()
+        self.connection.close()
+
+
+def parse_selection(selections):
+    """
+    Return a dict of column name -> value from KEY=VALUE strings; integer
+    values are converted.
+    """
+    selection = {}
+    for item in selections or []:
+        if '=' not in item:
+            raise ValueError('selection %r is not KEY=VALUE' % item)
+        name, value = item.split('=', 1)
+        try:
+            value = int(value)
+        except ValueError:
+            pass
+        selection[name.strip()] = value
+    return selection
+
+
+def select_files(
+    catalog_file_name=default_catalog_file_name,
+    selection=None,
+    where=None,
+):
+    """
+    Return the sorted paths of the catalogued files matching selection and
+    where; see ResultsCatalog.select().
+    """
+    catalog = ResultsCatalog(catalog_file_name)
+    try:
+        return catalog.select(selection, where)
+    finally:
+        catalog.close()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        'results_dirs',
+        nargs='*',
+        metavar='RESULTS_DIR',
+        help='results trees to index (default $%s)' % (
+            ' and $'.join(results_variables)
+        ),
+    )
+    parser.add_argument(
+        '--catalog',
+        metavar='FILE',
+        default=default_catalog_file_name,
+        help='catalog file (default %s)' % default_catalog_file_name,
+    )
+    parser.add_argument(
+        '--rescan',
+        action='store_true',
+        help='stat every file, not only those in changed directories',
+    )
+    parser.add_argument(
+        '--select',
+        action='append',
+        metavar='KEY=VALUE',
+        default=None,
+        help='print the catalogued files with column KEY equal to VALUE '
+            'instead of indexing; columns: %s' % ', '.join(column_names),
+    )
+    parser.add_argument(
+        '--where',
+        metavar='SQL',
+        default=None,
+        help='with --select, an extra SQL condition, e.g. "n_entries > 0"',
+    )
+    options = parser.parse_args()
+
+    if options.select is not None or options.where is not None:
+        for path in select_files(
+            options.catalog,
+            parse_selection(options.select),
+            options.where,
+        ):
+            print path
+        sys.exit()
+
+    results_dirs = options.results_dirs
+    if len(results_dirs) < 1:
+        results_dirs = [
+            os.getenv(variable) for variable in results_variables
+            if os.getenv(variable)
+        ]
+    if len(results_dirs) < 1:
+        print 'arguments: [results dirs] (or set $%s)' % (
+            ' or $'.join(results_variables)
+        )
+        sys.exit()
+
+    catalog = ResultsCatalog(options.catalog)
+    for results_dir in results_dirs:
+        n_updated, n_removed = catalog.index(results_dir, options.rescan)
+        print '--> %s: %i files indexed, %i removed' % (
+            results_dir,
+            n_updated,
+            n_removed,
+        )
+    catalog.close()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+"""
+Find runs whose spectra disagree with the rest.
+
+The per-run spectra of checkImportanceSampledSpectra are stacked into a
+runs x bins matrix of counts per event, and every run is compared, bin by
+bin, to the pooled spectrum of all the other runs (leave-one-out: the
+pooled sums minus the run's own row, so all runs are scored at once).
+Pulls use the run's expected Sumw2 under the pooled spectrum -- Poisson
+counts scaled by the pooled mean weight per entry -- plus the pooled
+spectrum's own error.  Runs are ranked by chi^2/ndf; the file names of the
+outliers can go straight to fileRelocation.py --move.
+"""
+
+import numpy
+
+
+default_max_chi2_ndf = 3.0
+default_max_pull = 5.0
+
+
+def run_matrix(runs):
+    """
+    Return (run IDs, n events, contents, sumw2) arrays, one row per run, of
+    (run ID, n events, (contents, sumw2, entries)) records, e.g. a
+    partialResults Partial's runs; underflow and overflow bins are dropped.
+    """
+    run_ids = []
+    n_events = []
+    contents = []
+    sumw2 = []
+    for run_id, run_n_events, arrays in runs:
+        run_ids.append(run_id)
+        n_events.append(run_n_events)
+        contents.append(arrays[0][1:-1])
+        sumw2.append(arrays[1][1:-1])
+    return (
+        numpy.array(run_ids),
+        numpy.array(n_events, dtype=numpy.float64),
+        numpy.array(contents, dtype=numpy.float64),
+        numpy.array(sumw2, dtype=numpy.float64),
+    )
+
+
+def score_runs(n_events, contents, sumw2):
+    """
+    Return a dict of per-run arrays: 'chi2', 'ndf', 'chi2_ndf', 'max_pull'
+    (signed, the largest in magnitude) and the runs x bins 'pulls', each run
+    compared with the pooled spectrum of the others.
+    """
+    n_events = numpy.asarray(n_events, dtype=numpy.float64)[:, numpy.newaxis]
+    other_events = n_events.sum() - n_events
+    other_contents = contents.sum(axis=0) - contents
+    other_sumw2 = sumw2.sum(axis=0) - sumw2
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        rate = contents/n_events
+        pooled_rate = other_contents/other_events
+        pooled_var = other_sumw2/other_events**2
+        # sumw2 of the run if it followed the pooled spectrum
+        mean_weight = numpy.where(
+            other_contents > 0,
+            other_sumw2/other_contents,
+            0.0,
+        )
+        expected_var = pooled_rate*mean_weight/n_events
+        variance = numpy.where(
+            expected_var > 0,
+            expected_var,
+            sumw2/n_events**2,
+        ) + pooled_var
+        variance[~numpy.isfinite(variance)] = 0.0 # e.g. a single run
+        pulls = numpy.where(
+            variance > 0,
+            (rate - pooled_rate)/numpy.sqrt(variance),
+            0.0,
+        )
+    pulls[~numpy.isfinite(pulls)] = 0.0
+
+    chi2 = (pulls**2).sum(axis=1)
+    ndf = numpy.count_nonzero(variance > 0, axis=1)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        chi2_ndf = numpy.where(ndf > 0, chi2/ndf, 0.0)
+    i_max = numpy.argmax(numpy.abs(pulls), axis=1)
+    return {
+        'chi2': chi2,
+        'ndf': ndf,
+        'chi2_ndf': chi2_ndf,
+        'max_pull': pulls[numpy.arange(len(pulls)), i_max],
+        'pulls': pulls,
+    }
+
+
+def rank_outliers(
+    run_ids,
+    scores,
+    max_chi2_ndf=default_max_chi2_ndf,
+    max_pull=default_max_pull,
+):
+    """
+    Return [(row, run ID, chi2/ndf, max pull, is outlier)] ranked by
+    chi2/ndf, worst first; a run is an outlier if its chi2/ndf or any |pull|
+    is above the limits.  row indexes the rows of run_matrix().
+    """
+    order = numpy.argsort(-scores['chi2_ndf'], kind='mergesort')
+    ranked = []
+    for i_run in order:
+        chi2_ndf = scores['chi2_ndf'][i_run]
+        pull = scores['max_pull'][i_run]
+        is_outlier = chi2_ndf > max_chi2_ndf or abs(pull) > max_pull
+        ranked.append((
+            i_run,
+            run_ids[i_run],
+            chi2_ndf,
+            pull,
+            bool(is_outlier),
+        ))
+    return ranked
+
+
+def print_ranking(ranked, n_print=20):
+
+    n_outliers = sum(1 for run in ranked if run[-1])
+    print '--> %i of %i runs are outliers' % (n_outliers, len(ranked))
+    print '%12s | %9s | %9s' % ('run', 'chi2/ndf', 'max pull')
+    for i_run, run_id, chi2_ndf, pull, is_outlier in ranked[:n_print]:
+        print '%12s | %9.2f | %9.2f%s' % (
+            run_id,
+            chi2_ndf,
+            pull,
+            ' *' if is_outlier else '',
+        )
+
+
+def write_outlier_files(file_name, ranked, run_files):
+    """
+    Write the file names of the outlier runs, worst first, one per line;
+    run_files is the file name of each row (None if unknown).  Return the
+    number written.
+    """
+    n_written = 0
+    with open(file_name, 'w') as list_file:
+        for i_run, run_id, chi2_ndf, pull, is_outlier in ranked:
+            if is_outlier and run_files[i_run] is not None:
+                list_file.write('%s\n' % run_files[i_run])
+                n_written += 1
+    return n_written
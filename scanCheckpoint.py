@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""
+Periodic checkpoints of long file loops.
+
+A Checkpointer calls a save function every interval seconds (and once more
+at the end), so a scan that dies -- a corrupt file, a preempted node, a
+dropped SSH session at a prompt -- can --resume from the last checkpoint
+instead of from the first file.  Loops check in between files, so a
+checkpoint always holds whole files; files in it are skipped on resume and
+the others are added in the same order, giving the same result as an
+uninterrupted run.
+
+Checkpoints are written to a temporary file and renamed, so a crash while
+saving leaves the previous one intact.
+"""
+
+import os
+import json
+import time
+
+
+default_interval = 60.0 # seconds
+
+
+class Checkpointer(object):
+    """
+    Call save_function(file_name) at most every interval seconds.
+    """
+
+    def __init__(self, file_name, save_function, interval=default_interval):
+
+        self.file_name = file_name
+        self.save_function = save_function
+        self.interval = interval
+        self.last_time = time.time()
+
+    def update(self, force=False):
+        """
+        Save if interval has passed since the last save (or if force).
+        """
+        if self.file_name is None:
+            return
+        now = time.time()
+        if force or now - self.last_time >= self.interval:
+            self.save_function(self.file_name)
+            self.last_time = now
+
+
+def save_json(file_name, state):
+    """
+    Write state, a JSON-serializable dict, to file_name atomically.
+    """
+    tmp_file_name = file_name + '.tmp'
+    with open(tmp_file_name, 'w') as checkpoint_file:
+        json.dump(state, checkpoint_file, sort_keys=True)
+    os.rename(tmp_file_name, file_name)
+
+
+def load_json(file_name):
+    """
+    Return the state saved by save_json(), with str file names.
+    """
+    with open(file_name) as checkpoint_file:
+        state = json.load(checkpoint_file)
+    return dict((str(key), value) for key, value in state.items())
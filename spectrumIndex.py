@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+"""
+Window integrals of many spectra from prefix sums.
+
+A SpectrumIndex keeps cumulative sums of the contents and sumw2 of one or
+more spectra in the same binning (e.g. one per directory), so the counts in
+any energy window and their errors are two lookups, and a list of windows is
+evaluated for all spectra at once.  Windows follow the TH1 calls they
+replace: a peak is the single bin FindBin(energy), a ROI from low to high is
+Integral(FindBin(low), FindBin(high)-1).
+"""
+
+import numpy
+
+from fileReduction import find_bins
+
+
+# (name, low, high) windows; high None is the single bin at low
+default_windows = [
+    ('peak_2614', 2614.5, None),
+    ('peak_1764', 1764.49, None),
+    ('peak_609', 609.320, None),
+    ('roi', 2039.0, 2041.0),
+]
+
+
+def reference_peak(a_max):
+    """
+    Return the window name of the peak ROI counts are compared to.
+    """
+    if a_max == 214:
+        return 'peak_609'
+    return 'peak_2614'
+
+
+def scan_windows(low, high, width):
+    """
+    Return adjacent (name, low, high) windows of width covering low to high.
+    """
+    lows = numpy.arange(low, high, width)
+    return [
+        ('scan_%g' % window_low, window_low, window_low + width)
+        for window_low in lows
+    ]
+
+
+def read_windows(file_name):
+    """
+    Return the (name, low, high) windows of a text file with one
+    'NAME LOW [HIGH]' per line; '#' starts a comment.
+    """
+    windows = []
+    with open(file_name) as windows_file:
+        for line in windows_file:
+            fields = line.split('#', 1)[0].split()
+            if not fields:
+                continue
+            if len(fields) not in (2, 3):
+                raise ValueError('window %r is not NAME LOW [HIGH]' % line)
+            high = float(fields[2]) if len(fields) == 3 else None
+            windows.append((fields[0], float(fields[1]), high))
+    return windows
+
+
+class SpectrumIndex(object):
+    """
+    Prefix sums of spectra, each (contents, sumw2, entries) arrays in the
+    ROOT bin layout of binning.
+    """
+
+    def __init__(self, spectra, binning):
+
+        self.binning = binning
+        n_bins = binning[0]
+        contents = numpy.zeros((len(spectra), n_bins+2))
+        sumw2 = numpy.zeros((len(spectra), n_bins+2))
+        for i_spectrum, arrays in enumerate(spectra):
+            if arrays is not None:
+                contents[i_spectrum] = arrays[0]
+                sumw2[i_spectrum] = arrays[1]
+
+        def prefix_sum(values):
+            sums = numpy.zeros((len(values), n_bins+3))
+            numpy.cumsum(values, axis=1, out=sums[:, 1:])
+            return sums
+
+        self.contents_sums = prefix_sum(contents)
+        self.sumw2_sums = prefix_sum(sumw2)
+
+    def integrate_bins(self, first_bins, last_bins):
+        """
+        Return (counts, errors) in bins first_bins through last_bins,
+        inclusive, one row per spectrum and one column per bin range.
+        """
+        first_bins = numpy.asarray(first_bins)
+        last_bins = numpy.maximum(numpy.asarray(last_bins), first_bins-1)
+        counts = (
+            self.contents_sums[:, last_bins+1] -
+            self.contents_sums[:, first_bins]
+        )
+        sumw2 = (
+            self.sumw2_sums[:, last_bins+1] -
+            self.sumw2_sums[:, first_bins]
+        )
+        return (counts, numpy.sqrt(numpy.maximum(sumw2, 0.0)))
+
+    def evaluate(self, windows):
+        """
+        Return a dict of window name -> (counts, errors) arrays, one value
+        per spectrum.
+        """
+        lows = numpy.array([low for name, low, high in windows])
+        highs = numpy.array([
+            low if high is None else high for name, low, high in windows
+        ])
+        is_peak = numpy.array([high is None for name, low, high in windows])
+        first_bins = find_bins(lows, self.binning)
+        last_bins = numpy.where(
+            is_peak,
+            first_bins,
+            find_bins(highs, self.binning) - 1,
+        )
+        counts, errors = self.integrate_bins(first_bins, last_bins)
+        return dict(
+            (name, (counts[:, i_window], errors[:, i_window]))
+            for i_window, (name, low, high) in enumerate(windows)
+        )
+
+
+def ratio_with_error(numerator, numerator_err, denominator, denominator_err):
+    """
+    Return (ratio, error), adding relative errors in quadrature; nan where
+    either count is zero.
+    """
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        ratio = numerator/denominator
+        error = numpy.abs(ratio)*numpy.sqrt(
+            (numerator_err/numerator)**2 + (denominator_err/denominator)**2
+        )
+    return (ratio, error)
+
+
+window_columns = [
+    # (key, header, format)
+    ('spectrum', 'spectrum', '%-24s'),
+    ('window', 'window', '%-12s'),
+    ('low', 'low', '%9.2f'),
+    ('high', 'high', '%9.2f'),
+    ('counts', 'counts', '%10.4g'),
+    ('counts_err', '+/-', '%9.3g'),
+    ('ratio', 'ratio', '%9.3g'),
+    ('ratio_err', '+/-', '%9.3g'),
+]
+
+
+def window_table(names, index, windows, reference_windows):
+    """
+    Return a list of row dicts, one per (spectrum, window), with the counts
+    of each window and their ratio to the counts of the spectrum's
+    reference window (a name in windows, per spectrum).
+    """
+    results = index.evaluate(windows)
+    rows = []
+    for i_spectrum, name in enumerate(names):
+        reference_counts, reference_err = results[reference_windows[i_spectrum]]
+        for window_name, low, high in windows:
+            counts, counts_err = results[window_name]
+            ratio, ratio_err = ratio_with_error(
+                counts[i_spectrum],
+                counts_err[i_spectrum],
+                reference_counts[i_spectrum],
+                reference_err[i_spectrum],
+            )
+            rows.append({
+                'spectrum': name,
+                'window': window_name,
+                'low': low,
+                'high': low if high is None else high,
+                'counts': counts[i_spectrum],
+                'counts_err': counts_err[i_spectrum],
+                'ratio': ratio,
+                'ratio_err': ratio_err,
+            })
+    return rows
+
+
+def print_table(rows):
+
+    headers = []
+    for key, header, format in window_columns:
+        if format.endswith('s'):
+            headers.append(header.ljust(len(format % '')))
+        else:
+            headers.append(header.rjust(len(format % 0)))
+    print ' | '.join(headers)
+    for row in rows:
+        print ' | '.join(
+            format % row[key] for key, header, format in window_columns
+        )
+
+
+def write_table(file_name, rows):
+    """
+    Write rows as comma-separated values.
+    """
+    keys = [key for key, header, format in window_columns]
+    with open(file_name, 'w') as table_file:
+        table_file.write(','.join(keys) + '\n')
+        for row in rows:
+            table_file.write(','.join(
+                row[key] if isinstance(row[key], str) else repr(float(row[key]))
+                for key in keys
+            ) + '\n')
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+"""
+Incremental spectra of directories of ROOT files.
+
+A SpectrumStore keeps, for one directory, a partial spectrum per input file,
+their merged spectrum and a manifest of contributing files (with size and
+mtime).  update() only reads new or changed files; if files were only
+added, their partials are added to the merged spectrum, otherwise it is
+re-merged from the stored partials.
+
+A RunArrayStore keeps per-run spectra for overlays, optionally spilled to
+disk.
+"""
+
+import os
+import json
+import tempfile
+import itertools
+
+import numpy
+
+
+manifest_file_name = 'manifest.json'
+merged_file_name = 'merged.npz'
+
+
+def save_arrays(file_name, arrays):
+    """
+    Save (contents, sumw2, entries) histogram arrays to an .npz file.
+    """
+    contents, sumw2, entries = arrays
+    tmp_file_name = file_name + '.tmp.npz'
+    numpy.savez(tmp_file_name, contents=contents, sumw2=sumw2, entries=entries)
+    os.rename(tmp_file_name, file_name)
+
+
+def load_arrays(file_name):
+
+    npz_file = numpy.load(file_name)
+    try:
+        return (
+            npz_file['contents'],
+            npz_file['sumw2'],
+            int(npz_file['entries']),
+        )
+    finally:
+        npz_file.close()
+
+
+def add_arrays(arrays, other_arrays):
+    """
+    Return the sum of two (contents, sumw2, entries) tuples.
+    """
+    if arrays is None:
+        return other_arrays
+    return (
+        arrays[0] + other_arrays[0],
+        arrays[1] + other_arrays[1],
+        arrays[2] + other_arrays[2],
+    )
+
+
+class SpectrumStore(object):
+    """
+    Partial and merged spectra of one directory, kept in store_dir.
+    """
+
+    def __init__(self, store_dir):
+
+        self.store_dir = store_dir
+        if not os.path.isdir(store_dir):
+            os.makedirs(store_dir)
+
+        self.manifest = {'files': {}}
+        manifest_path = os.path.join(store_dir, manifest_file_name)
+        if os.path.isfile(manifest_path):
+            with open(manifest_path) as manifest_file:
+                self.manifest = json.load(manifest_file)
+
+    def _path(self, file_name):
+
+        return os.path.join(self.store_dir, file_name)
+
+    def _save_manifest(self):
+
+        manifest_path = self._path(manifest_file_name)
+        with open(manifest_path + '.tmp', 'w') as manifest_file:
+            json.dump(self.manifest, manifest_file, indent=1, sort_keys=True)
+        os.rename(manifest_path + '.tmp', manifest_path)
+
+    def update(self, root_file_names, fill_function):
+        """
+        Bring the store up to date with root_file_names and return
+        (merged arrays, info), where info is that of the last file.
+
+        fill_function(root_file_name) returns the (contents, sumw2, entries)
+        arrays of one file and a JSON-serializable dict of info about it.
+        """
+
+        files = self.manifest['files']
+        current_paths = [os.path.abspath(name) for name in root_file_names]
+
+        removed_paths = set(files) - set(current_paths)
+        for path in removed_paths:
+            partial_path = self._path(files[path]['partial'])
+            if os.path.isfile(partial_path):
+                os.remove(partial_path)
+            del files[path]
+
+        new_partials = []
+        is_append_only = not removed_paths
+        for path in current_paths:
+
+            stat = os.stat(path)
+            entry = files.get(path)
+            if entry is not None and entry['size'] == stat.st_size and \
+                entry['mtime'] == stat.st_mtime:
+                continue
+            if entry is not None:
+                is_append_only = False
+
+            print '\t reading %s' % os.path.basename(path)
+            arrays, info = fill_function(path)
+            partial = '%s.npz' % os.path.basename(path)
+            save_arrays(self._path(partial), arrays)
+            files[path] = {
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'partial': partial,
+                'info': info,
+            }
+            new_partials.append(arrays)
+
+        merged_path = self._path(merged_file_name)
+        has_merged = os.path.isfile(merged_path) and \
+            self.manifest.get('n_merged') == len(files) - len(new_partials)
+
+        if is_append_only and has_merged:
+            merged = load_arrays(merged_path)
+            for arrays in new_partials:
+                merged = add_arrays(merged, arrays)
+        else:
+            merged = None
+            for path in current_paths:
+                merged = add_arrays(
+                    merged,
+                    load_arrays(self._path(files[path]['partial']))
+                )
+
+        if new_partials or removed_paths or not has_merged:
+            if merged is not None:
+                save_arrays(merged_path, merged)
+            self.manifest['n_merged'] = len(files)
+            self._save_manifest()
+
+        info = None
+        if current_paths:
+            info = files[current_paths[-1]]['info']
+        return (merged, info)
+
+
+class RunArrayStore(object):
+    """
+    Per-run (run ID, n events, (contents, sumw2, entries)) records, in
+    append order.  They are kept in memory or, if spill_dir is given,
+    appended to an unnamed scratch file there and read back memory-mapped,
+    so memory doesn't grow with the number of runs.
+    """
+
+    def __init__(self, spill_dir=None):
+
+        self.runs = []
+        self.spill_file = None
+        self.n_values = None
+        if spill_dir is not None:
+            if not os.path.isdir(spill_dir):
+                os.makedirs(spill_dir)
+            self.spill_file = tempfile.TemporaryFile(dir=spill_dir)
+
+    def __len__(self):
+
+        return len(self.runs)
+
+    def append(self, run_id, n_events, arrays):
+
+        if self.spill_file is None:
+            self.runs.append((run_id, n_events, arrays))
+            return
+
+        contents, sumw2, entries = arrays
+        row = numpy.concatenate([contents, sumw2]).astype(numpy.float64)
+        if self.n_values is None:
+            self.n_values = len(row)
+        if len(row) != self.n_values:
+            raise ValueError('run %s has %i bins, not %i' % (
+                run_id,
+                len(row)//2,
+                self.n_values//2,
+            ))
+        row.tofile(self.spill_file)
+        self.runs.append((run_id, n_events, entries))
+
+    def __iter__(self):
+
+        if self.spill_file is None:
+            for run in self.runs:
+                yield run
+            return
+        if not self.runs:
+            return
+
+        self.spill_file.flush()
+        rows = numpy.memmap(
+            self.spill_file,
+            dtype=numpy.float64,
+            mode='r',
+            shape=(len(self.runs), self.n_values),
+        )
+        n_bins = self.n_values//2
+        for (run_id, n_events, entries), row in itertools.izip(self.runs, rows):
+            row = numpy.array(row)
+            yield (run_id, n_events, (row[:n_bins], row[n_bins:], entries))
+
+    def close(self):
+
+        if self.spill_file is not None:
+            self.spill_file.close()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+"""
+Evaluate many IS weight thresholds from one scan of the files.
+
+Files are sorted by weight once; for each threshold, binary search finds the
+files below it and prefix sums give the removed and kept counts and the
+efficiency (sum of weight*n_entries over sum of n_events) of the kept files.
+"""
+
+import numpy
+
+
+class WeightSweep(object):
+    """
+    Per-file weights, entry and event counts, sorted by weight.
+    """
+
+    def __init__(self, weights, n_entries, n_events):
+
+        weights = numpy.asarray(weights, dtype=numpy.float64)
+        order = numpy.argsort(weights, kind='mergesort')
+        self.weights = weights[order]
+        n_entries = numpy.asarray(n_entries, dtype=numpy.float64)[order]
+        n_events = numpy.asarray(n_events, dtype=numpy.float64)[order]
+
+        def prefix_sum(values):
+            sums = numpy.zeros(len(values)+1)
+            numpy.cumsum(values, out=sums[1:])
+            return sums
+
+        self.entries_sums = prefix_sum(n_entries)
+        self.events_sums = prefix_sum(n_events)
+        self.weighted_sums = prefix_sum(self.weights*n_entries)
+        self.weighted2_sums = prefix_sum(self.weights*self.weights*n_entries)
+
+    def evaluate(self, thresholds):
+        """
+        Return a dict of arrays, one value per threshold, for removing the
+        files with weight < threshold.
+        """
+        thresholds = numpy.asarray(thresholds, dtype=numpy.float64)
+        n_removed = numpy.searchsorted(self.weights, thresholds, side='left')
+
+        def removed_and_kept(sums):
+            removed = sums[n_removed]
+            return (removed, sums[-1] - removed)
+
+        entries_removed, entries_kept = removed_and_kept(self.entries_sums)
+        events_removed, events_kept = removed_and_kept(self.events_sums)
+        weighted_removed, weighted_kept = removed_and_kept(self.weighted_sums)
+        weighted2_removed, weighted2_kept = removed_and_kept(self.weighted2_sums)
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            efficiency = weighted_kept/events_kept
+            efficiency_err = numpy.sqrt(weighted2_kept)/events_kept
+            fraction_removed = entries_removed/self.entries_sums[-1]
+
+        return {
+            'threshold': thresholds,
+            'files_removed': n_removed,
+            'files_kept': len(self.weights) - n_removed,
+            'entries_removed': entries_removed,
+            'entries_kept': entries_kept,
+            'fraction_removed': fraction_removed,
+            'efficiency': efficiency,
+            'efficiency_err': efficiency_err,
+        }
+
+
+sweep_columns = [
+    # (key, header, format)
+    ('threshold', 'threshold', '%9.2e'),
+    ('files_removed', 'files rm', '%8i'),
+    ('files_kept', 'kept', '%8i'),
+    ('entries_removed', 'counts rm', '%9.2e'),
+    ('entries_kept', 'kept', '%9.2e'),
+    ('fraction_removed', '% rm', '%6.2f'),
+    ('efficiency', 'eff', '%9.2e'),
+    ('efficiency_err', '+/-', '%9.2e'),
+]
+
+
+def print_sweep(sweep):
+
+    print ' | '.join(
+        header.rjust(len(format % 0)) for key, header, format in sweep_columns
+    )
+    for i_threshold in range(len(sweep['threshold'])):
+        values = []
+        for key, header, format in sweep_columns:
+            value = sweep[key][i_threshold]
+            if key == 'fraction_removed':
+                value *= 100.0
+            values.append(format % value)
+        print ' | '.join(values)
+
+
+def write_sweep(file_name, sweep):
+    """
+    Write a sweep as comma-separated values, one row per threshold.
+    """
+    keys = [key for key, header, format in sweep_columns]
+    with open(file_name, 'w') as sweep_file:
+        sweep_file.write(','.join(keys) + '\n')
+        for i_threshold in range(len(sweep['threshold'])):
+            sweep_file.write(
+                ','.join(repr(sweep[key][i_threshold].item()) for key in keys)
+                + '\n'
+            )
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+"""
+Check that spectra of different IS weight classes agree.
+
+The weight-class spectra of checkImportanceSampledSpectra are stacked into a
+classes x bins matrix of counts per event, and every pair of classes is
+compared at once: chi^2/ndf and per-bin pulls of the difference of their
+rates, and a Kolmogorov-style distance between their normalized cumulative
+spectra.  Bin variances are each class's expected Sumw2 under the pair's
+pooled rate -- Poisson counts scaled by the class's mean weight per entry
+in the bin (or overall, for empty bins) -- rather than the observed Sumw2,
+which is too small wherever a sparse high-weight class fluctuates low.
+The distance is scaled by the classes' effective entries,
+sqrt(n1*n2/(n1 + n2)), to compare with the Kolmogorov critical value; on
+binned spectra the test is conservative.
+"""
+
+import numpy
+
+from runOutliers import default_max_chi2_ndf
+from runOutliers import default_max_pull
+
+
+# Kolmogorov critical value at 0.1%, as many pairs are tested
+default_max_ks = 1.949
+
+
+def class_matrix(classes):
+    """
+    Return (names, n events, contents, sumw2) arrays, one row per class, of
+    (name, n events, (contents, sumw2, entries)) records; underflow and
+    overflow bins are dropped.
+    """
+    names = []
+    n_events = []
+    contents = []
+    sumw2 = []
+    for name, class_n_events, arrays in classes:
+        names.append(name)
+        n_events.append(class_n_events)
+        contents.append(arrays[0][1:-1])
+        sumw2.append(arrays[1][1:-1])
+    return (
+        names,
+        numpy.array(n_events, dtype=numpy.float64),
+        numpy.array(contents, dtype=numpy.float64),
+        numpy.array(sumw2, dtype=numpy.float64),
+    )
+
+
+def score_pairs(n_events, contents, sumw2):
+    """
+    Return a dict of per-pair arrays, one entry per pair i < j: 'i', 'j',
+    'chi2', 'ndf', 'chi2_ndf', 'max_pull' (signed, the largest in
+    magnitude), 'ks_distance', 'ks' (the distance scaled by the effective
+    entries) and the pairs x bins 'pulls'.
+    """
+    i, j = numpy.triu_indices(len(n_events), k=1)
+    n_events = numpy.asarray(n_events, dtype=numpy.float64)
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        totals = contents.sum(axis=1)
+        total_sumw2 = sumw2.sum(axis=1)
+        mean_weight = numpy.where(totals > 0, total_sumw2/totals, 0.0)
+        n_effective = numpy.where(total_sumw2 > 0, totals**2/total_sumw2, 0.0)
+
+        # pairs x bins
+        n_i = n_events[i][:, numpy.newaxis]
+        n_j = n_events[j][:, numpy.newaxis]
+        rate_i = contents[i]/n_i
+        rate_j = contents[j]/n_j
+        pooled_rate = (contents[i] + contents[j])/(n_i + n_j)
+
+        def variance(k, n_k):
+            # sumw2 of class k if it followed the pooled rate
+            bin_weight = numpy.where(
+                contents[k] > 0,
+                sumw2[k]/contents[k],
+                mean_weight[k][:, numpy.newaxis],
+            )
+            return pooled_rate*bin_weight/n_k
+
+        pair_variance = variance(i, n_i) + variance(j, n_j)
+        pair_variance[~numpy.isfinite(pair_variance)] = 0.0
+        pulls = numpy.where(
+            pair_variance > 0,
+            (rate_i - rate_j)/numpy.sqrt(pair_variance),
+            0.0,
+        )
+        pulls[~numpy.isfinite(pulls)] = 0.0
+
+        chi2 = (pulls**2).sum(axis=1)
+        ndf = numpy.count_nonzero(pair_variance > 0, axis=1)
+        chi2_ndf = numpy.where(ndf > 0, chi2/ndf, 0.0)
+
+        cumulative = numpy.cumsum(contents, axis=1)/totals[:, numpy.newaxis]
+        cumulative[~numpy.isfinite(cumulative)] = 0.0
+        ks_distance = numpy.abs(cumulative[i] - cumulative[j]).max(axis=1)
+        ks_scale = numpy.sqrt(
+            n_effective[i]*n_effective[j]/(n_effective[i] + n_effective[j])
+        )
+        ks = ks_distance*numpy.where(numpy.isfinite(ks_scale), ks_scale, 0.0)
+
+    if len(pulls):
+        i_max = numpy.argmax(numpy.abs(pulls), axis=1)
+        max_pull = pulls[numpy.arange(len(pulls)), i_max]
+    else:
+        max_pull = numpy.zeros(0)
+    return {
+        'i': i,
+        'j': j,
+        'chi2': chi2,
+        'ndf': ndf,
+        'chi2_ndf': chi2_ndf,
+        'max_pull': max_pull,
+        'ks_distance': ks_distance,
+        'ks': ks,
+        'pulls': pulls,
+    }
+
+
+def rank_pairs(
+    names,
+    scores,
+    max_chi2_ndf=default_max_chi2_ndf,
+    max_pull=default_max_pull,
+    max_ks=default_max_ks,
+):
+    """
+    Return [(name i, name j, chi2/ndf, max pull, KS, passed)] ranked by
+    chi2/ndf, worst first; a pair fails if any of them is above its limit.
+    """
+    order = numpy.argsort(-scores['chi2_ndf'], kind='mergesort')
+    ranked = []
+    for i_pair in order:
+        chi2_ndf = scores['chi2_ndf'][i_pair]
+        pull = scores['max_pull'][i_pair]
+        ks = scores['ks'][i_pair]
+        passed = chi2_ndf <= max_chi2_ndf and abs(pull) <= max_pull and (
+            ks <= max_ks
+        )
+        ranked.append((
+            names[scores['i'][i_pair]],
+            names[scores['j'][i_pair]],
+            chi2_ndf,
+            pull,
+            ks,
+            bool(passed),
+        ))
+    return ranked
+
+
+def print_pairs(ranked, n_print=20):
+
+    n_failed = sum(1 for pair in ranked if not pair[-1])
+    print '--> %i of %i weight-class pairs fail' % (n_failed, len(ranked))
+    print '%12s | %12s | %9s | %9s | %9s | %s' % (
+        'class',
+        'class',
+        'chi2/ndf',
+        'max pull',
+        'KS',
+        'result',
+    )
+    for name_i, name_j, chi2_ndf, pull, ks, passed in ranked[:n_print]:
+        print '%12s | %12s | %9.2f | %9.2f | %9.2f | %s' % (
+            name_i,
+            name_j,
+            chi2_ndf,
+            pull,
+            ks,
+            'pass' if passed else 'FAIL',
+        )